@@ -43,20 +43,83 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'corsheaders',
-    'crosscheckapi',
+    'crosscheckapi.apps.CrosscheckapiConfig',
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'crosscheckapi.authentication.LandlordTokenAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'crosscheckapi.pagination.IdCursorPagination',
     'PAGE_SIZE': 10
 }
 
+# Tokens resolved by LandlordTokenAuthentication are cached in process
+AUTH_CREDENTIAL_CACHE = {
+    'MAX_ENTRIES': 1024,
+    'TTL': 300,
+}
+
+# Rows inserted per bulk_create call by the payment import
+PAYMENT_IMPORT_BATCH_SIZE = 500
+
+# Rows fetched per database round trip by the payment export
+PAYMENT_EXPORT_CHUNK_SIZE = 2000
+
+# Operations accepted in one /batch request
+BATCH_MAX_OPERATIONS = 500
+
+# Payments older than HORIZON_DAYS are moved out of the payment table by
+# archive_payments, BATCH_SIZE per transaction (see crosscheckapi.archive)
+PAYMENT_ARCHIVE = {
+    'HORIZON_DAYS': 730,
+    'BATCH_SIZE': 2000,
+}
+
+# The default cache and the cache of list responses, see
+# crosscheckapi.cache. LocMemCache drops the least recently used tenth of
+# its entries when it is full. To share the responses between processes,
+# use FileBasedCache with a directory as LOCATION, or MemcachedCache
+# with a memcached address.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+            'CULL_FREQUENCY': 10,
+        },
+    },
+}
+
+RESPONSE_CACHE = {
+    'ENABLED': True,
+    'ALIAS': 'responses',
+}
+
+# /sync cursors trail their response by OVERLAP_SECONDS, and delete
+# tombstones are kept for TOMBSTONE_DAYS (see prune_tombstones)
+SYNC = {
+    'OVERLAP_SECONDS': 60,
+    'TOMBSTONE_DAYS': 30,
+}
+
+# Query counts and database time per request, reported in the
+# Server-Timing header. Slow requests are logged to crosscheckapi.requests.
+REQUEST_INSTRUMENTATION = {
+    'ENABLED': True,
+    'SLOW_REQUEST_MS': 500,
+    'TOP_STATEMENTS': 5,
+    'REPEATED_QUERIES': 3,
+}
+
 CORS_ORIGIN_WHITELIST = (
     'http://localhost:3000',
     'http://127.0.0.1:3000',
@@ -64,6 +127,7 @@ CORS_ORIGIN_WHITELIST = (
 )
 
 MIDDLEWARE = [
+    'crosscheckapi.middleware.query_instrumentation',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -102,9 +166,36 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Reuse connections across requests instead of reconnecting
+        # and reapplying the pragmas every time
+        'CONN_MAX_AGE': 60,
     }
 }
 
+# Landlord rows are split across these databases, see crosscheckapi.shards.
+# Users, tokens and payment types stay in 'default'. Each shard needs
+# `python manage.py migrate --database <shard>`.
+LANDLORD_SHARDS = ['shard_1', 'shard_2']
+for shard in LANDLORD_SHARDS:
+    DATABASES[shard] = dict(DATABASES['default'], NAME=BASE_DIR / '{}.sqlite3'.format(shard))
+
+DATABASE_ROUTERS = ['crosscheckapi.shards.LandlordShardRouter']
+
+# Applied in order to every new SQLite connection by
+# crosscheckapi.signals.apply_sqlite_pragmas. WAL lets readers run while
+# a payment is written, and busy_timeout makes writers wait for the
+# lock instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'busy_timeout': 20000,
+    'journal_mode': 'wal',
+    # Safe with WAL: a power loss can only drop the last commits
+    'synchronous': 'normal',
+    # Negative sizes are KiB, so 64 MB of page cache per connection
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'memory',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -2,17 +2,30 @@ from django.conf.urls import include
 from django.urls import path
 from rest_framework import routers
 from crosscheckapi.views import register_user, login_user
-from crosscheckapi.views import Tenants, Payments, Properties, PaymentTypes
+from crosscheckapi.views import Tenants, Payments, Properties, PaymentTypes, Reports, Sync, Batch
+from crosscheckapi.views import async_payment_list, async_payment_detail
+from crosscheckapi.views import async_tenant_list, async_tenant_detail
+from crosscheckapi.views import async_property_list, async_property_detail
 
 router = routers.DefaultRouter(trailing_slash=False)
 router.register(r'tenants', Tenants, 'tenant')
 router.register(r'payments', Payments, 'payment')
 router.register(r'properties', Properties, 'property')
 router.register(r'paymenttypes', PaymentTypes, 'paymenttype')
+router.register(r'reports', Reports, 'report')
+router.register(r'sync', Sync, 'sync')
+router.register(r'batch', Batch, 'batch')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('register', register_user),
     path('login', login_user),
+    # Async read endpoints, served concurrently under ASGI
+    path('async/payments', async_payment_list),
+    path('async/payments/<int:pk>', async_payment_detail),
+    path('async/tenants', async_tenant_list),
+    path('async/tenants/<int:pk>', async_tenant_detail),
+    path('async/properties', async_property_list),
+    path('async/properties/<int:pk>', async_property_detail),
     path('api-auth', include('rest_framework.urls', namespace='rest_framework')),
 ]
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CrosscheckapiConfig(AppConfig):
     name = 'crosscheckapi'
+
+    def ready(self):
+        # Connect the signal handlers
+        from crosscheckapi import signals  # pylint: disable=unused-import,import-outside-toplevel
@@ -0,0 +1,89 @@
+"""Hot and cold payment storage
+
+Payments dated before the archive horizon are moved from the payment
+table into ArchivedPayment by `archive_payments`, so the lists, searches
+and exports that every request runs only read recent payments. Queries
+for a date range that the archive holds rows in read the PaymentHistory
+view instead, which covers both tables.
+
+The archive is one table per landlord database rather than one table
+or file per year. Every archive read is bounded by its date index: a
+range reads only the index entries of its own dates, the archive check
+in `payment_source` is one index lookup, and the PaymentHistory view
+applies the range to each table separately. So the years outside a
+range cost nothing, just as a table per year would make them, without
+per-year models, migrations, views or databases to create as the years
+pass. Archiving a year into its own SQLite file would also lose the
+foreign keys and the transactions shared with the payment table.
+
+Archived payments keep their ids and stay counted in MonthlyIncome.
+They are read-only: /payments/<id> still returns them, but answers a
+change or delete with 409.
+They leave /sync like deleted payments do, since clients sync the
+recent payments only.
+
+Settings, all under PAYMENT_ARCHIVE:
+    HORIZON_DAYS -- payments older than this many days are archived
+    BATCH_SIZE -- payments moved per transaction
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from crosscheckapi.models import ArchivedPayment, Payment, PaymentHistory, Tombstone
+
+DEFAULTS = {
+    'HORIZON_DAYS': 730,
+    'BATCH_SIZE': 2000,
+}
+
+
+def archive_options():
+    return dict(DEFAULTS, **getattr(settings, 'PAYMENT_ARCHIVE', {}))
+
+
+def archive_horizon():
+    """The date before which payments belong in the archive"""
+    return timezone.localdate() - timedelta(days=archive_options()['HORIZON_DAYS'])
+
+
+def payment_source(landlord, start=None, end=None):
+    """The model to read the landlord's payments dated from `start` to
+    `end` from: Payment, or PaymentHistory when the archive holds some
+    of them. Without a range only recent payments are read.
+    """
+    if start is None or end is None:
+        return Payment
+    archived = ArchivedPayment.objects.filter(landlord=landlord, date__range=(start, end))
+    return PaymentHistory if archived.exists() else Payment
+
+
+def archive_batch(using, before, after_id, batch_size):
+    """Move up to `batch_size` payments dated before `before`, with ids
+    above `after_id`, into the archive in one transaction
+
+    Returns:
+        list -- the moved payments, by id
+    """
+    with transaction.atomic(using=using):
+        # Walk the primary key so each batch continues where the last stopped
+        payments = list(Payment.objects.using(using).filter(
+            id__gt=after_id, date__lt=before).order_by('id')[:batch_size])
+        if not payments:
+            return payments
+
+        ArchivedPayment.objects.using(using).bulk_create(
+            [ArchivedPayment(**{field.attname: getattr(payment, field.attname)
+                                for field in Payment._meta.concrete_fields})
+             for payment in payments])
+        Tombstone.objects.using(using).bulk_create(
+            [Tombstone(model='payment', object_id=payment.id, landlord_id=payment.landlord_id)
+             for payment in payments])
+
+        # A raw delete, since the delete signals would uncount the
+        # payments from MonthlyIncome. The search index triggers still
+        # remove them from the full-text index.
+        Payment.objects.using(using).filter(
+            id__in=[payment.id for payment in payments])._raw_delete(using)
+
+    return payments
@@ -0,0 +1,105 @@
+"""Token authentication that also resolves the landlord"""
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from crosscheckapi.models import Landlord
+from crosscheckapi.shards import activate
+
+
+class CredentialCache:
+    """Bounded, thread-safe LRU map of token key -> (user, token)
+
+    Entries expire after `ttl` seconds, which bounds how stale an entry
+    can be in other processes. Inside the process, signal handlers
+    invalidate entries as soon as a token, user or landlord changes.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, credentials):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, credentials)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in [key for key, (_, (user, _)) in self._entries.items()
+                        if user.id == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+CACHE_SETTINGS = getattr(settings, 'AUTH_CREDENTIAL_CACHE', {})
+credential_cache = CredentialCache(
+    max_entries=CACHE_SETTINGS.get('MAX_ENTRIES', 1024),
+    ttl=CACHE_SETTINGS.get('TTL', 300),
+)
+
+
+class LandlordTokenAuthentication(TokenAuthentication):
+    """DRF token authentication that loads the token, user and landlord
+    in one joined query and caches them
+
+    The authenticated landlord is available to views as `request.landlord`,
+    and the rest of the request uses the landlord's shard.
+    """
+
+    def authenticate(self, request):
+        credentials = super().authenticate(request)
+        if credentials is None:
+            return None
+
+        # The landlord was loaded with the user, so this is not a query
+        user, token = credentials
+        try:
+            request.landlord = user.landlord
+        except Landlord.DoesNotExist:
+            request.landlord = None
+        activate(request.landlord)
+        return user, token
+
+    def authenticate_credentials(self, key):
+        credentials = credential_cache.get(key)
+        if credentials is not None:
+            return credentials
+
+        model = self.get_model()
+        try:
+            token = model.objects.select_related('user__landlord').get(key=key)
+        except model.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        credentials = (token.user, token)
+        credential_cache.set(key, credentials)
+        return credentials
@@ -0,0 +1,213 @@
+"""Helpers shared by the benchmark management commands"""
+import random
+import statistics
+import time
+from collections import namedtuple
+from contextlib import ExitStack, contextmanager
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from crosscheckapi.models import (Landlord, Payment, PaymentType, Property,
+                                  PropertySearchToken, Tenant, TenantPropertyRel)
+from crosscheckapi.reports import rebuild_monthly_income
+from crosscheckapi.shards import landlord_databases
+
+FIRST_NAMES = ['James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael',
+               'Linda', 'David', 'Elizabeth', 'William', 'Barbara', 'Richard', 'Susan']
+LAST_NAMES = ['Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller',
+              'Davis', 'Rodriguez', 'Martinez', 'Hernandez', 'Lopez', 'Wilson', 'Anderson']
+STREETS = ['Main St', 'Broadway', 'Church St', 'Elm Ave', 'Charlotte Pike', 'West End Ave']
+CITIES = [('Nashville', 'TN', '37203'), ('Franklin', 'TN', '37064'), ('Memphis', 'TN', '38103')]
+
+
+@contextmanager
+def rollback():
+    """Run the block in a transaction on every landlord database that
+    is always rolled back, so generated benchmark data never reaches
+    the database or the shards
+    """
+    with ExitStack() as stack:
+        aliases = landlord_databases()
+        for alias in aliases:
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+        for alias in aliases:
+            transaction.set_rollback(True, using=alias)
+
+
+def timed(func, repeat):
+    """Call `func` `repeat` times and return latency statistics in ms"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+
+    samples.sort()
+    return {
+        'mean': statistics.mean(samples),
+        'p50': samples[int(len(samples) * 0.50)],
+        'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        'p99': samples[min(len(samples) - 1, int(len(samples) * 0.99))],
+    }
+
+
+def generate_portfolio(name, tenants, payments, years=5, batch_size=10000, seed=0):
+    """Create a landlord with `tenants` tenants, one property and one
+    lease per tenant, and `payments` payments spread over `years`
+
+    Returns:
+        tuple -- the landlord and its API token
+    """
+    rng = random.Random(seed)
+    user = User.objects.create_user(username=name, email=name, password='benchmark')
+    landlord = Landlord.objects.create(user=user)
+    token = Token.objects.create(user=user)
+    payment_types = list(PaymentType.objects.all()) or [
+        PaymentType.objects.create(label=label) for label in ('Cash', 'Check', 'Money Order')]
+
+    end = date.today()
+    start = end - timedelta(days=365 * years)
+
+    Tenant.objects.bulk_create([
+        Tenant(full_name='{} {}'.format(rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)),
+               email='tenant{}@example.com'.format(i), landlord=landlord)
+        for i in range(tenants)], batch_size=batch_size)
+    Property.objects.bulk_create([
+        Property(street='{} {}'.format(rng.randint(1, 9999), rng.choice(STREETS)),
+                 city=city, state=state, postal_code=postal_code, landlord=landlord)
+        for city, state, postal_code in (rng.choice(CITIES) for _ in range(tenants))],
+        batch_size=batch_size)
+
+    # bulk_create skips the signal that indexes property addresses
+    PropertySearchToken.objects.bulk_create([
+        PropertySearchToken(token=token, rented_property=rental, landlord=landlord)
+        for rental in Property.objects.filter(landlord=landlord)
+        for token in rental.address_tokens], batch_size=batch_size)
+
+    tenant_ids = list(Tenant.objects.filter(landlord=landlord).values_list('id', flat=True))
+    property_ids = list(Property.objects.filter(landlord=landlord).values_list('id', flat=True))
+    TenantPropertyRel.objects.bulk_create([
+        TenantPropertyRel(tenant_id=tenant_id, rented_property_id=property_id,
+                          rent=rng.randrange(800, 2500, 50), lease_start=start, lease_end=end)
+        for tenant_id, property_id in zip(tenant_ids, property_ids)], batch_size=batch_size)
+
+    days = (end - start).days
+    for offset in range(0, payments, batch_size):
+        Payment.objects.bulk_create([
+            Payment(date=start + timedelta(days=rng.randrange(days)),
+                    amount=rng.randrange(800, 2500, 50),
+                    ref_num='{}{}'.format(rng.choice('PCWM'), rng.randrange(10 ** 7)),
+                    tenant_id=rng.choice(tenant_ids),
+                    payment_type=rng.choice(payment_types), landlord=landlord)
+            for _ in range(min(batch_size, payments - offset))])
+
+    # bulk_create also skips the monthly income signals
+    rebuild_monthly_income(landlord)
+
+    return landlord, token
+
+
+# A route exercised by the endpoint benchmark. `path` is formatted with
+# the portfolio fixtures, `data(fixtures, n)` returns the query
+# parameters (GET) or JSON body (POST) of the n-th call, and `budget` is
+# the most SQL queries one call may run once credentials are cached.
+Endpoint = namedtuple('Endpoint', ['name', 'method', 'path', 'budget', 'data'])
+
+
+def no_data(fixtures, n):
+    return {}
+
+
+def query(**params):
+    return lambda fixtures, n: params
+
+
+ENDPOINTS = [
+    Endpoint('login', 'post', '/login', 2,
+             lambda fixtures, n: {'username': fixtures['username'], 'password': 'benchmark'}),
+    Endpoint('register', 'post', '/register', 9,
+             lambda fixtures, n: {'email': '{}.{}'.format(n, fixtures['username']), 'password': 'benchmark'}),
+    Endpoint('tenants', 'get', '/tenants', 2, no_data),
+    Endpoint('tenants page', 'get', '/tenants', 2, query(page_size=50)),
+    Endpoint('tenants fast', 'get', '/tenants', 2, query(fast='true')),
+    Endpoint('tenants search', 'get', '/tenants', 2, query(search='Smith')),
+    Endpoint('tenants table', 'get', '/tenants', 0, query(table='true')),
+    Endpoint('tenant', 'get', '/tenants/{tenant}', 2, no_data),
+    Endpoint('tenant create', 'post', '/tenants', 1,
+             query(phone_number='615-555-0100', email='new@example.com', full_name='New Tenant')),
+    Endpoint('payments', 'get', '/payments', 1, no_data),
+    Endpoint('payments page', 'get', '/payments', 1, query(page_size=50)),
+    Endpoint('payments fast', 'get', '/payments', 1, query(fast='true', page_size=50)),
+    Endpoint('payments keyword', 'get', '/payments', 1, query(keyword='smi', page_size=50)),
+    # Date ranges first check whether the archive holds payments in them
+    Endpoint('payments range', 'get', '/payments', 2, query(date='{:%Y}-01-01/{:%Y}-03-31'.format(
+        date.today(), date.today()), page_size=50)),
+    Endpoint('payments history', 'get', '/payments', 2, query(date='2000-01-01/{:%Y-%m-%d}'.format(
+        date.today()), page_size=50)),
+    Endpoint('payment', 'get', '/payments/{payment}', 3, no_data),
+    Endpoint('payment create', 'post', '/payments', 5,
+             lambda fixtures, n: {'full_name': fixtures['tenant'], 'date': date.today().isoformat(),
+                                  'amount': '1000', 'ref_num': 'B{}'.format(n),
+                                  'type': fixtures['payment_type']}),
+    Endpoint('payments export', 'get', '/payments/export', 1, query(output='csv')),
+    Endpoint('properties', 'get', '/properties', 1, no_data),
+    Endpoint('properties page', 'get', '/properties', 1, query(page_size=50)),
+    Endpoint('properties search', 'get', '/properties', 1, query(search='main')),
+    Endpoint('property', 'get', '/properties/{property}', 2, no_data),
+    Endpoint('property create', 'post', '/properties', 3,
+             query(street='1 Benchmark Ave', city='Nashville', state='TN', postal_code='37203')),
+    Endpoint('paymenttypes', 'get', '/paymenttypes', 0, no_data),
+    Endpoint('monthly report', 'get', '/reports/monthly', 1, no_data),
+    Endpoint('reconciliation', 'get', '/reports/reconciliation', 2, no_data),
+]
+
+
+def portfolio_fixtures(landlord):
+    """The ids the ENDPOINTS paths and bodies refer to"""
+    lease = TenantPropertyRel.objects.filter(tenant__landlord=landlord).order_by('id').first()
+    return {
+        'username': landlord.user.username,
+        'tenant': lease.tenant_id,
+        'property': lease.rented_property_id,
+        'payment': Payment.objects.filter(landlord=landlord).order_by('id').first().id,
+        'payment_type': PaymentType.objects.order_by('id').first().id,
+    }
+
+
+def measure_endpoint(client, endpoint, fixtures, repeat):
+    """Call `endpoint` `repeat` times after one warm-up call
+
+    Returns:
+        dict -- latency statistics in ms and the most queries one call ran
+    """
+    path = endpoint.path.format(**fixtures)
+    counter = iter(range(repeat + 1))
+    queries = []
+
+    def call():
+        data = endpoint.data(fixtures, next(counter))
+        # Queries in every database count, shards included
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias]))
+                        for alias in connections]
+            if endpoint.method == 'post':
+                response = client.post(path, data, format='json')
+            else:
+                response = client.get(path, data)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        if response.status_code >= 400:
+            raise AssertionError('{} {} returned {}'.format(
+                endpoint.method.upper(), path, response.status_code))
+        queries.append(sum(len(context) for context in captured))
+
+    # Resolves the credentials and fills the in-process caches
+    call()
+    queries.clear()
+
+    stats = timed(call, repeat)
+    stats['queries'] = max(queries)
+    return stats
@@ -0,0 +1,154 @@
+"""Per-landlord data versions for cached responses
+
+Cached values include the landlord's current data version in their key.
+Bumping the version when the underlying rows change makes every older
+entry unreachable, and the cache backend evicts them in time.
+
+`cached_response` caches whole list responses this way. The responses
+are stored in the cache named by RESPONSE_CACHE['ALIAS'], so the backend
+and its size are configured in CACHES: LocMemCache keeps each process's
+entries in memory and evicts the least recently used ones, while
+FileBasedCache or MemcachedCache share the entries between processes.
+
+Settings, all under RESPONSE_CACHE:
+    ENABLED -- when false responses are never cached
+    ALIAS -- the CACHES entry holding the responses and their versions
+"""
+import hashlib
+import threading
+import uuid
+from collections import Counter
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+DEFAULTS = {
+    'ENABLED': True,
+    'ALIAS': 'default',
+}
+
+
+def version_key(namespace, landlord_id):
+    return 'version:{}:{}'.format(namespace, landlord_id)
+
+
+def data_version(namespace, landlord_id, backend=cache):
+    """Return the landlord's current version for `namespace`"""
+    key = version_key(namespace, landlord_id)
+    version = backend.get(key)
+    if version is None:
+        # Versions are random rather than counters, so a version lost
+        # to eviction can never be reissued for different data
+        backend.add(key, uuid.uuid4().hex, timeout=None)
+        version = backend.get(key)
+    return version
+
+
+def bump_version(namespace, landlord_id, backend=cache):
+    """Invalidate everything cached under the landlord's `namespace`"""
+    backend.set(version_key(namespace, landlord_id), uuid.uuid4().hex, timeout=None)
+
+
+def response_cache_options():
+    return dict(DEFAULTS, **getattr(settings, 'RESPONSE_CACHE', {}))
+
+
+def invalidate_responses(landlord_id, using=None):
+    """Drop the landlord's cached responses now and again once the
+    `using` transaction commits, so a concurrent request cannot cache
+    the uncommitted old rows
+
+    `landlord_id` None drops every landlord's cached responses.
+    """
+    def bump():
+        backend = caches[response_cache_options()['ALIAS']]
+        if landlord_id is None:
+            bump_version('responses', 'all', backend)
+        else:
+            bump_version('responses', landlord_id, backend)
+
+    bump()
+    transaction.on_commit(bump, using=using)
+
+
+class CacheStats:
+    """Thread-safe hit and miss counters per cached endpoint"""
+
+    def __init__(self):
+        self.hits = Counter()
+        self.misses = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, hit):
+        with self._lock:
+            (self.hits if hit else self.misses)[endpoint] += 1
+
+    def snapshot(self):
+        """Return {endpoint: {'hits': n, 'misses': n}}"""
+        with self._lock:
+            return {endpoint: {'hits': self.hits[endpoint], 'misses': self.misses[endpoint]}
+                    for endpoint in sorted(set(self.hits) | set(self.misses))}
+
+    def clear(self):
+        with self._lock:
+            self.hits.clear()
+            self.misses.clear()
+
+
+response_stats = CacheStats()
+
+
+def response_key(endpoint, request, backend):
+    """The cache key of `request`'s response: the landlord, the endpoint,
+    the landlord's and the shared data versions, and a digest of what
+    else the body depends on
+    """
+    landlord_id = request.landlord.id
+    params = sorted(request.query_params.lists())
+    digest = hashlib.sha1(repr((
+        request.build_absolute_uri('/'), request.accepted_media_type, params
+    )).encode()).hexdigest()
+    return 'response:{}:{}:{}:{}:{}'.format(
+        endpoint, landlord_id, data_version('responses', landlord_id, backend),
+        data_version('responses', 'all', backend), digest)
+
+
+def cached_response(endpoint):
+    """Cache a viewset handler's 200 responses per landlord until the
+    landlord's data changes. Responses say whether they were cached in
+    the X-Cache header.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def view(self, request, *args, **kwargs):
+            options = response_cache_options()
+            if not options['ENABLED'] or getattr(request, 'landlord', None) is None:
+                return handler(self, request, *args, **kwargs)
+
+            # The key is taken before the rows are read, so rows written
+            # meanwhile bump the version past the stored entry
+            backend = caches[options['ALIAS']]
+            key = response_key(endpoint, request, backend)
+            cached = backend.get(key)
+            response_stats.record(endpoint, cached is not None)
+            if cached is not None:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            response = handler(self, request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                if isinstance(response, Response):
+                    response = self.finalize_response(request, response, *args, **kwargs)
+                    response.render()
+                backend.set(key, (response.content, response['Content-Type']))
+            response['X-Cache'] = 'MISS'
+            return response
+
+        return view
+
+    return decorator
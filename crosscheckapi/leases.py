@@ -0,0 +1,47 @@
+"""Resolve payments to the lease that covers their date"""
+from bisect import bisect_right
+from collections import defaultdict
+
+
+class LeaseResolver:
+    """Looks up the leased property for many (tenant, date) pairs
+    from one query
+
+    Like `TenantPropertyRel.objects.covering`, a date resolves to the
+    tenant's latest starting lease whose range contains it.
+    """
+
+    def __init__(self, leases):
+        """
+        Arguments:
+            leases -- TenantPropertyRel queryset holding every lease
+            that may be looked up
+        """
+        self._leases = defaultdict(list)
+        rows = leases.order_by('tenant_id', 'lease_start', 'id').values_list(
+            'tenant_id', 'lease_start', 'lease_end', 'rented_property_id')
+        for tenant_id, lease_start, lease_end, property_id in rows:
+            self._leases[tenant_id].append((lease_start, lease_end, property_id))
+        self._starts = {
+            tenant_id: [lease[0] for lease in leases]
+            for tenant_id, leases in self._leases.items()
+        }
+
+    def property_id(self, tenant_id, day):
+        """The property id leased by the tenant on `day`, or None"""
+        index = bisect_right(self._starts.get(tenant_id, ()), day)
+        leases = self._leases.get(tenant_id, ())
+
+        # Walk back from the latest lease starting on or before the day
+        # to allow for a long lease that overlaps later, shorter ones
+        while index > 0:
+            index -= 1
+            lease_start, lease_end, property_id = leases[index]
+            if lease_end >= day:
+                return property_id
+        return None
+
+    def attach(self, payments):
+        """Set `rented_property_id` on each payment from its lease"""
+        for payment in payments:
+            payment.rented_property_id = self.property_id(payment.tenant_id, payment.date)
@@ -0,0 +1,50 @@
+"""Move old payments out of the payment table into the archive"""
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from crosscheckapi.archive import archive_batch, archive_horizon, archive_options
+from crosscheckapi.cache import invalidate_responses
+from crosscheckapi.models import Payment
+from crosscheckapi.shards import landlord_databases
+
+
+class Command(BaseCommand):
+    help = "Archive the payments dated before PAYMENT_ARCHIVE['HORIZON_DAYS'] ago"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', help='Archive payments dated before this YYYY-MM-DD instead')
+        parser.add_argument('--batch-size', type=int, help='Payments moved per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Count the payments only')
+
+    def handle(self, *args, **options):
+        before = archive_horizon()
+        if options['before'] is not None:
+            before = parse_date(options['before'])
+            if before is None:
+                raise CommandError('--before must be formatted as YYYY-MM-DD')
+        batch_size = options['batch_size'] or archive_options()['BATCH_SIZE']
+
+        archived = 0
+        landlord_ids = set()
+        for using in landlord_databases():
+            if options['dry_run']:
+                count = Payment.objects.using(using).filter(date__lt=before).count()
+                self.stdout.write('{}: {} payments before {}'.format(using, count, before))
+                archived += count
+                continue
+
+            last_id = 0
+            while True:
+                # Each batch commits on its own, so writers only wait for one batch
+                payments = archive_batch(using, before, last_id, batch_size)
+                if not payments:
+                    break
+                archived += len(payments)
+                landlord_ids.update(payment.landlord_id for payment in payments)
+                last_id = payments[-1].id
+                self.stdout.write('{}: through payment {}: {} archived'.format(using, last_id, archived))
+
+        for landlord_id in landlord_ids:
+            invalidate_responses(landlord_id)
+
+        self.stdout.write(self.style.SUCCESS('{} payments {}archived'.format(
+            archived, 'would be ' if options['dry_run'] else '')))
@@ -0,0 +1,79 @@
+"""Attach the leased property to existing payments, archived ones included"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from crosscheckapi.cache import invalidate_responses
+from crosscheckapi.leases import LeaseResolver
+from crosscheckapi.models import ArchivedPayment, Landlord, Payment, TenantPropertyRel
+from crosscheckapi.reports import rebuild_monthly_income
+from crosscheckapi.shards import landlord_databases
+
+
+class Command(BaseCommand):
+    help = 'Set rented_property on payments from the lease covering each payment date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=10000)
+        parser.add_argument('--all', action='store_true',
+                            help='Re-resolve payments that already have a property')
+
+    def handle(self, *args, **options):
+        updated = 0
+        landlord_ids = set()
+        for using in landlord_databases():
+            # The monthly income rebuilt below reads the archive too
+            for model in (Payment, ArchivedPayment):
+                updated += self.backfill(using, model, options, landlord_ids)
+
+        # bulk_update skips the signals that keep the monthly income
+        # summary and the cached responses in step with each payment's property
+        for landlord in Landlord.objects.filter(id__in=landlord_ids):
+            rebuild_monthly_income(landlord)
+            invalidate_responses(landlord.id)
+
+        self.stdout.write(self.style.SUCCESS('{} payments updated'.format(updated)))
+
+    def backfill(self, using, model, options, landlord_ids):
+        """Backfill the `model` payments of one database, adding the ids
+        of landlords with changed payments to `landlord_ids`
+
+        Returns:
+            int -- the number of payments updated
+        """
+        payments = model.objects.using(using).order_by('id').only(
+            'id', 'tenant_id', 'date', 'rented_property_id', 'landlord_id')
+        if not options['all']:
+            payments = payments.filter(rented_property__isnull=True)
+
+        last_id = 0
+        updated = 0
+        while True:
+            # Walk the primary key so each chunk is an index range
+            # and every chunk commits on its own
+            with transaction.atomic(using=using):
+                chunk = list(payments.filter(id__gt=last_id)[:options['chunk_size']])
+                if not chunk:
+                    break
+
+                tenant_ids = model.objects.using(using).filter(
+                    id__gt=last_id, id__lte=chunk[-1].id).values('tenant_id')
+                resolver = LeaseResolver(
+                    TenantPropertyRel.objects.using(using).filter(tenant_id__in=tenant_ids))
+                before = [payment.rented_property_id for payment in chunk]
+                resolver.attach(chunk)
+
+                changed = [payment for payment, old in zip(chunk, before)
+                           if payment.rented_property_id != old]
+                # bulk_update does not apply auto_now, and /sync must resend these
+                now = timezone.now()
+                for payment in changed:
+                    payment.updated_at = now
+                model.objects.using(using).bulk_update(changed, ['rented_property', 'updated_at'])
+
+            updated += len(changed)
+            landlord_ids.update(payment.landlord_id for payment in changed)
+            last_id = chunk[-1].id
+            self.stdout.write('{}: through {} {}: {} updated'.format(
+                using, model._meta.verbose_name, last_id, updated))
+
+        return updated
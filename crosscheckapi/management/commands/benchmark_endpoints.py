@@ -0,0 +1,93 @@
+"""Run every API route against generated portfolios and compare the
+results with a stored baseline
+"""
+import json
+import os
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+from crosscheckapi.benchmark import (ENDPOINTS, generate_portfolio, measure_endpoint,
+                                     portfolio_fixtures, rollback)
+
+
+class Command(BaseCommand):
+    help = ('Benchmark every endpoint at several scale factors. Fails when an endpoint '
+            'exceeds its query budget or regresses against the baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='100,1000,10000',
+                            help='Comma separated tenant counts, one portfolio each')
+        parser.add_argument('--payments-per-tenant', type=int, default=24)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--baseline', default='benchmark_baseline.json')
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Write the results as the new baseline instead of comparing')
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help='Allowed median slowdown against the baseline, as a fraction')
+        parser.add_argument('--slack-ms', type=float, default=2.0,
+                            help='Slowdowns under this many ms are never regressions')
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(scale) for scale in options['scales'].split(',')]
+        except ValueError:
+            raise CommandError('--scales must be comma separated integers')
+
+        results = {}
+        failures = []
+        # Every call is measured uncached, as the budgets are for the database
+        uncached = dict(getattr(settings, 'RESPONSE_CACHE', {}), ENABLED=False)
+        with override_settings(ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver'],
+                               RESPONSE_CACHE=uncached), rollback():
+            for scale in scales:
+                self.stdout.write('Generating {} tenants, {} payments...'.format(
+                    scale, scale * options['payments_per_tenant']))
+                landlord, token = generate_portfolio(
+                    'endpoint-benchmark-{}@example.com'.format(scale), scale,
+                    scale * options['payments_per_tenant'])
+                fixtures = portfolio_fixtures(landlord)
+                client = APIClient()
+                client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+                for endpoint in ENDPOINTS:
+                    stats = measure_endpoint(client, endpoint, fixtures, options['repeat'])
+                    results['{}:{}'.format(scale, endpoint.name)] = stats
+                    self.stdout.write(
+                        '{:>6} {:<18} queries={:<2} p50={:8.2f}ms p95={:8.2f}ms p99={:8.2f}ms'.format(
+                            scale, endpoint.name, stats['queries'],
+                            stats['p50'], stats['p95'], stats['p99']))
+                    if stats['queries'] > endpoint.budget:
+                        failures.append('{} at {} tenants ran {} queries, budget {}'.format(
+                            endpoint.name, scale, stats['queries'], endpoint.budget))
+
+        if options['save_baseline']:
+            with open(options['baseline'], 'w') as baseline_file:
+                json.dump(results, baseline_file, indent=2, sort_keys=True)
+            self.stdout.write('Baseline written to {}'.format(options['baseline']))
+        elif os.path.exists(options['baseline']):
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)
+            failures += self.regressions(results, baseline, options)
+        else:
+            self.stdout.write('No baseline at {}, skipping the comparison'.format(options['baseline']))
+
+        if failures:
+            raise CommandError('Endpoint benchmark failed:\n' + '\n'.join(failures))
+
+    def regressions(self, results, baseline, options):
+        """Endpoints slower or chattier than the baseline run"""
+        failures = []
+        for key, stats in results.items():
+            previous = baseline.get(key)
+            if previous is None:
+                continue
+            if stats['queries'] > previous['queries']:
+                failures.append('{} ran {} queries, baseline {}'.format(
+                    key, stats['queries'], previous['queries']))
+            limit = max(previous['p50'] * (1 + options['threshold']),
+                        previous['p50'] + options['slack_ms'])
+            if stats['p50'] > limit:
+                failures.append('{} p50 {:.2f}ms, baseline {:.2f}ms'.format(
+                    key, stats['p50'], previous['p50']))
+        return failures
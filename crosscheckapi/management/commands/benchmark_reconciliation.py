@@ -0,0 +1,51 @@
+"""Benchmark the vectorized rent reconciliation on synthetic data"""
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from crosscheckapi.reconciliation import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Time reconcile() for many leases with several years of monthly payments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--leases', type=int, default=100000)
+        parser.add_argument('--years', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        lease_count, months = options['leases'], options['years'] * 12
+
+        start = np.datetime64('2016-01-01') + rng.integers(0, 365, lease_count)
+        leases = {
+            'id': np.arange(lease_count),
+            'tenant': np.arange(lease_count),
+            'property': np.arange(lease_count),
+            'start': start,
+            'end': start + 365 * options['years'],
+            'rent': rng.integers(8, 25, lease_count) * 100,
+        }
+
+        # One payment per lease month, 5% missed and 20% paid short,
+        # paid up to 20 days after the first of the month
+        tenant = np.repeat(leases['tenant'], months)
+        month = (np.repeat(start.astype('datetime64[M]'), months) +
+                 np.tile(np.arange(months), lease_count))
+        kept = rng.random(len(tenant)) > 0.05
+        amount = np.repeat(leases['rent'], months)
+        amount = np.where(rng.random(len(tenant)) < 0.2, amount // 2, amount)
+        payments = {
+            'tenant': tenant[kept],
+            'date': (month.astype('datetime64[D]') + rng.integers(0, 20, len(tenant)))[kept],
+            'amount': amount[kept],
+        }
+        as_of = leases['end'].max()
+
+        self.stdout.write('{:,} leases, {:,} payments'.format(lease_count, len(payments['tenant'])))
+        began = time.perf_counter()
+        result = reconcile(leases, payments, as_of)
+        seconds = time.perf_counter() - began
+
+        self.stdout.write('reconciled in {:.2f}s: {:,} leases in arrears, {:,} unmatched payments'.format(
+            seconds, int((result['arrears'] > 0).sum()), result['unmatched_count']))
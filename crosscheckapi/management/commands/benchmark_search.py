@@ -0,0 +1,36 @@
+"""Compare the FTS5 payment search with the LIKE search it replaced"""
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from crosscheckapi.benchmark import generate_portfolio, rollback, timed
+from crosscheckapi.models import Payment
+
+
+class Command(BaseCommand):
+    help = 'Benchmark payment keyword search: FTS5 index vs icontains scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payments', type=int, default=1000000)
+        parser.add_argument('--tenants', type=int, default=2000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        keywords = ['smi', 'garcia', 'mary jo', 'P123', 'C98765']
+
+        with rollback():
+            self.stdout.write('Generating {payments} payments...'.format(**options))
+            landlord, _ = generate_portfolio(
+                'search-benchmark@example.com', options['tenants'], options['payments'])
+            payments = Payment.objects.filter(landlord=landlord).order_by('-date', '-id')
+
+            for keyword in keywords:
+                like = payments.filter(
+                    Q(ref_num__icontains=keyword) | Q(tenant__full_name__icontains=keyword))
+                fts = payments.search(keyword)
+
+                for label, queryset in (('like', like), ('fts5', fts)):
+                    rows = queryset.count()
+                    stats = timed(lambda qs=queryset: list(qs.values_list('id', flat=True)),
+                                  options['repeat'])
+                    self.stdout.write(
+                        '{:<8} {:<5} rows={:<7} p50={:8.2f}ms p95={:8.2f}ms'.format(
+                            keyword, label, rows, stats['p50'], stats['p95']))
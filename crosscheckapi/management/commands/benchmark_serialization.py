@@ -0,0 +1,48 @@
+"""Compare the per-row cost of DRF serializers with the ?fast rendering"""
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from crosscheckapi import fastjson
+from crosscheckapi.benchmark import generate_portfolio, rollback, timed
+from crosscheckapi.models import Payment, Property
+from crosscheckapi.views.payment import PAYMENT_ROW, PaymentSerializer
+from crosscheckapi.views.property import PROPERTY_ROW, PropertySerializer
+
+
+class Command(BaseCommand):
+    help = 'Benchmark list rendering: DRF ModelSerializer vs values() row mappers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+
+        with rollback():
+            self.stdout.write('Generating {} rows...'.format(rows))
+            landlord, _ = generate_portfolio(
+                'serialization-benchmark@example.com', rows, rows)
+
+            payments = (Payment.objects.filter(landlord=landlord)
+                        .select_related('tenant', 'payment_type').order_by('-date', '-id'))
+            properties = Property.objects.filter(landlord=landlord).order_by('id')
+
+            cases = [
+                ('payments', 'drf', lambda: JSONRenderer().render(
+                    PaymentSerializer(payments.all(), many=True).data)),
+                ('payments', 'fast', lambda: fastjson.dumps(
+                    PAYMENT_ROW.rows(payments.values(*PAYMENT_ROW.fields)))),
+                ('properties', 'drf', lambda: JSONRenderer().render(
+                    PropertySerializer(properties.all(), many=True).data)),
+                ('properties', 'fast', lambda: fastjson.dumps(
+                    PROPERTY_ROW.rows(properties.values(*PROPERTY_ROW.fields)))),
+            ]
+
+            self.stdout.write('JSON encoder: {}'.format(
+                'orjson' if fastjson.orjson is not None else 'json'))
+            for resource, label, render in cases:
+                stats = timed(render, options['repeat'])
+                self.stdout.write(
+                    '{:<10} {:<4} p50={:8.2f}ms p95={:8.2f}ms per row={:6.2f}us'.format(
+                        resource, label, stats['p50'], stats['p95'],
+                        stats['p50'] * 1000 / rows))
@@ -0,0 +1,97 @@
+"""Measure concurrent payment writes by many landlords, first with every
+landlord in the default database, then with the landlords spread over
+LANDLORD_SHARDS
+
+SQLite allows one writer per database file, so landlords sharing a file
+wait on each other's commits while landlords in different shards write
+in parallel. The landlords are committed and deleted again afterwards.
+"""
+import random
+import threading
+import time
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from crosscheckapi.benchmark import generate_portfolio
+from crosscheckapi.models import Payment, PaymentType, Tenant
+from crosscheckapi.shards import landlord_shard, move_landlord
+
+
+class Command(BaseCommand):
+    help = 'Compare concurrent multi-landlord write throughput in one database and across shards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--landlords', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=2, help='Writer threads per landlord')
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--tenants', type=int, default=100)
+        parser.add_argument('--payments', type=int, default=2400)
+
+    def handle(self, *args, **options):
+        shards = list(getattr(settings, 'LANDLORD_SHARDS', []))
+        if not shards:
+            raise CommandError('No LANDLORD_SHARDS are configured')
+        for shard in shards:
+            if Payment._meta.db_table not in connections[shard].introspection.table_names():
+                raise CommandError('Run `manage.py migrate --database {}` first'.format(shard))
+
+        self.stdout.write('Generating {landlords} landlords...'.format(**options))
+        landlords = [generate_portfolio('shard-benchmark-{}@example.com'.format(i),
+                                        options['tenants'], options['payments'], seed=i)[0]
+                     for i in range(options['landlords'])]
+        try:
+            self.report(DEFAULT_DB_ALIAS, self.run(landlords, options))
+
+            for i, landlord in enumerate(landlords):
+                move_landlord(landlord, shards[i % len(shards)])
+            self.report('sharded', self.run(landlords, options))
+        finally:
+            # Deleting the landlord also deletes its rows from its shard
+            for landlord in landlords:
+                landlord.user.delete()
+
+    def run(self, landlords, options):
+        """Write payments from `writers` threads per landlord for `seconds`
+
+        Returns:
+            tuple -- sorted latencies in ms, the number of errors and the duration
+        """
+        payment_type = PaymentType.objects.first()
+        deadline = time.perf_counter() + options['seconds']
+        latencies, errors = [], []
+
+        def worker(landlord, seed):
+            rng = random.Random(seed)
+            samples, failed = [], 0
+            with landlord_shard(landlord):
+                tenant_ids = list(Tenant.objects.filter(landlord=landlord).values_list('id', flat=True))
+                while time.perf_counter() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        Payment.objects.create(
+                            date=date.today() - timedelta(days=rng.randrange(365)), amount=1000,
+                            ref_num='B{}'.format(rng.randrange(10 ** 7)),
+                            tenant_id=rng.choice(tenant_ids), payment_type=payment_type,
+                            landlord=landlord)
+                        samples.append((time.perf_counter() - start) * 1000)
+                    except OperationalError:
+                        failed += 1
+            connections.close_all()
+            latencies.extend(samples)
+            errors.append(failed)
+
+        threads = [threading.Thread(target=worker, args=(landlord, i * options['writers'] + j))
+                   for i, landlord in enumerate(landlords) for j in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return sorted(latencies), sum(errors), options['seconds']
+
+    def report(self, layout, result):
+        latencies, errors, seconds = result
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+        self.stdout.write('{:<8} {:8.1f} writes/s  p99={:8.2f}ms  errors={}'.format(
+            layout, len(latencies) / seconds, p99, errors))
@@ -0,0 +1,109 @@
+"""Compare SQLite's defaults with the tuned connection profile under a
+mixed read/write load
+"""
+import random
+import threading
+import time
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection, connections
+from django.test.utils import override_settings
+from crosscheckapi.benchmark import generate_portfolio
+from crosscheckapi.models import Payment, PaymentType, Tenant
+
+
+class Command(BaseCommand):
+    help = ('Run concurrent payment readers and writers against the default database, '
+            'first with SQLite defaults, then with SQLITE_PRAGMAS and CONN_MAX_AGE')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--tenants', type=int, default=1000)
+        parser.add_argument('--payments', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The default database is not SQLite')
+
+        database = connections.databases['default']
+        profiles = [
+            # Django's defaults: rollback journal and a new connection per request
+            ('default', {'journal_mode': 'delete'}, 0),
+            ('tuned', settings.SQLITE_PRAGMAS, database.get('CONN_MAX_AGE', 0)),
+        ]
+
+        self.stdout.write('Generating {tenants} tenants, {payments} payments...'.format(**options))
+        landlord, _ = generate_portfolio(
+            'sqlite-benchmark@example.com', options['tenants'], options['payments'])
+        original_max_age = database.get('CONN_MAX_AGE', 0)
+        try:
+            for name, pragmas, max_age in profiles:
+                database['CONN_MAX_AGE'] = max_age
+                with override_settings(SQLITE_PRAGMAS=pragmas):
+                    # Reconnect so the journal mode switches before the threads start
+                    connection.close()
+                    connection.ensure_connection()
+                    self.report(name, self.run(landlord, options))
+        finally:
+            database['CONN_MAX_AGE'] = original_max_age
+            connection.close()
+            landlord.user.delete()
+
+    def run(self, landlord, options):
+        """Run the readers and writers for `seconds`
+
+        Returns:
+            dict -- per kind: latencies in ms and the number of errors
+        """
+        tenant_ids = list(Tenant.objects.filter(landlord=landlord).values_list('id', flat=True))
+        payment_type = PaymentType.objects.first()
+        payments = Payment.objects.filter(landlord=landlord).order_by('-date', '-id')
+        deadline = time.perf_counter() + options['seconds']
+        results = {'read': ([], []), 'write': ([], [])}
+
+        def read(rng):
+            list(payments.values('id', 'date', 'amount', 'ref_num', 'tenant__full_name')[:50])
+
+        def write(rng):
+            Payment.objects.create(
+                date=date.today() - timedelta(days=rng.randrange(365)), amount=1000,
+                ref_num='S{}'.format(rng.randrange(10 ** 7)), tenant_id=rng.choice(tenant_ids),
+                payment_type=payment_type, landlord=landlord)
+
+        def worker(kind, operation, seed):
+            rng = random.Random(seed)
+            latencies, errors = [], []
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    operation(rng)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                except OperationalError as ex:
+                    errors.append(str(ex))
+                # The end of a request: closes the connection unless
+                # CONN_MAX_AGE keeps it
+                close_old_connections()
+            connection.close()
+            results[kind][0].extend(latencies)
+            results[kind][1].extend(errors)
+
+        threads = [threading.Thread(target=worker, args=('read', read, i))
+                   for i in range(options['readers'])]
+        threads += [threading.Thread(target=worker, args=('write', write, i))
+                    for i in range(options['writers'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        return {kind: (sorted(latencies), errors, options['seconds'])
+                for kind, (latencies, errors) in results.items()}
+
+    def report(self, profile, results):
+        for kind, (latencies, errors, seconds) in results.items():
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0
+            self.stdout.write('{:<8} {:<6} {:8.1f} ops/s  p99={:8.2f}ms  errors={}'.format(
+                profile, kind, len(latencies) / seconds, p99, len(errors)))
@@ -0,0 +1,152 @@
+"""Compare WSGI and ASGI throughput for the read endpoints
+
+The WSGI and ASGI handlers are driven in process: WSGI by a pool of
+`--concurrency` threads, like a threaded server, and ASGI by the same
+number of concurrent tasks on one event loop, like uvicorn with one
+worker. Every response body is read in full, so the numbers cover the
+whole Django stack but not an HTTP server or the network.
+
+The portfolio is committed, because the async views read through their
+own connections, and deleted again afterwards.
+"""
+import asyncio
+import io
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.test.utils import override_settings
+from crosscheckapi.benchmark import generate_portfolio
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def wsgi_request(application, path, query, token):
+    """Make one GET request to the WSGI `application`
+
+    Returns:
+        int -- the response status code
+    """
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query,
+        'SERVER_NAME': 'testserver', 'SERVER_PORT': '80', 'HTTP_HOST': 'testserver',
+        'HTTP_AUTHORIZATION': 'Token ' + token, 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http', 'wsgi.multithread': True, 'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    status = []
+    response = application(environ, lambda code, headers: status.append(int(code[:3])))
+    try:
+        b''.join(response)
+    finally:
+        response.close()
+    return status[0]
+
+
+async def asgi_request(application, path, query, token):
+    """Make one GET request to the ASGI `application`
+
+    Returns:
+        int -- the response status code
+    """
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'authorization', b'Token ' + token.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('testserver', 80),
+    }
+    status = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+class Command(BaseCommand):
+    help = 'Load test the read endpoints under WSGI and ASGI at a fixed concurrency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=200)
+        parser.add_argument('--requests', type=int, default=4000)
+        parser.add_argument('--tenants', type=int, default=1000)
+        parser.add_argument('--payments', type=int, default=24000)
+        parser.add_argument('--paths', default='/payments?page_size=50,/tenants?page_size=50',
+                            help='Comma separated sync routes, each also run under /async')
+
+    def handle(self, *args, **options):
+        self.options = options
+        landlord, token = generate_portfolio(
+            'loadtest@example.com', options['tenants'], options['payments'])
+        try:
+            # Under load every request would be logged as slow
+            instrumentation = dict(getattr(settings, 'REQUEST_INSTRUMENTATION', {}),
+                                   SLOW_REQUEST_MS=float('inf'))
+            with override_settings(ALLOWED_HOSTS=settings.ALLOWED_HOSTS + ['testserver'],
+                                   REQUEST_INSTRUMENTATION=instrumentation):
+                wsgi, asgi = get_wsgi_application(), get_asgi_application()
+                for url in options['paths'].split(','):
+                    path, _, query = url.partition('?')
+                    self.report('wsgi', url, self.run_wsgi(wsgi, path, query, token.key))
+                    self.report('asgi', url, self.run_asgi(asgi, path, query, token.key))
+                    self.report('asgi', '/async' + url,
+                                self.run_asgi(asgi, '/async' + path, query, token.key))
+        finally:
+            landlord.user.delete()
+
+    def run_wsgi(self, application, path, query, token):
+        def worker(count):
+            samples = []
+            for _ in range(count):
+                start = time.perf_counter()
+                status = wsgi_request(application, path, query, token)
+                samples.append(((time.perf_counter() - start) * 1000, status))
+            return samples
+
+        with ThreadPoolExecutor(self.options['concurrency']) as pool:
+            start = time.perf_counter()
+            results = list(pool.map(worker, self.shares()))
+            seconds = time.perf_counter() - start
+        return [sample for samples in results for sample in samples], seconds
+
+    def run_asgi(self, application, path, query, token):
+        async def worker(count):
+            samples = []
+            for _ in range(count):
+                start = time.perf_counter()
+                status = await asgi_request(application, path, query, token)
+                samples.append(((time.perf_counter() - start) * 1000, status))
+            return samples
+
+        async def run():
+            start = time.perf_counter()
+            results = await asyncio.gather(*(worker(count) for count in self.shares()))
+            return results, time.perf_counter() - start
+
+        results, seconds = asyncio.run(run())
+        return [sample for samples in results for sample in samples], seconds
+
+    def shares(self):
+        """Split the requests evenly over the concurrent clients"""
+        clients, total = self.options['concurrency'], self.options['requests']
+        return [total // clients + (i < total % clients) for i in range(clients)]
+
+    def report(self, server, url, result):
+        samples, seconds = result
+        latencies = sorted(latency for latency, _ in samples)
+        errors = sum(1 for _, status in samples if status != 200)
+        self.stdout.write('{:<5} {:<32} {:8.1f} req/s  p50={:8.2f}ms  p99={:8.2f}ms  errors={}'.format(
+            server, url, len(samples) / seconds, percentile(latencies, 0.50),
+            percentile(latencies, 0.99), errors))
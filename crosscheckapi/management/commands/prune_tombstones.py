@@ -0,0 +1,24 @@
+"""Delete the tombstones that /sync no longer reads
+
+Cursors older than SYNC['TOMBSTONE_DAYS'] get a full reset instead of
+the deletions, so older tombstones can go.
+"""
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from crosscheckapi.models import Tombstone
+from crosscheckapi.shards import landlord_databases
+from crosscheckapi.views.sync import sync_options
+
+
+class Command(BaseCommand):
+    help = "Delete the tombstones older than SYNC['TOMBSTONE_DAYS']"
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=sync_options()['TOMBSTONE_DAYS'])
+        pruned = 0
+        for using in landlord_databases():
+            # Nothing refers to tombstones, so this is a single DELETE
+            pruned += Tombstone.objects.using(using).filter(deleted_at__lt=cutoff).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS('{} tombstones pruned'.format(pruned)))
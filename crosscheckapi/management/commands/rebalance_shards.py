@@ -0,0 +1,77 @@
+"""Move landlords between shard databases
+
+Run with the moved landlords' traffic paused, and keep it paused for
+AUTH_CREDENTIAL_CACHE's TTL afterwards, since other processes route by
+the landlord they cached.
+"""
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count
+from crosscheckapi.models import Landlord, Payment
+from crosscheckapi.shards import move_landlord
+
+
+class Command(BaseCommand):
+    help = ('Move one landlord to a shard, or spread the landlords still in the default '
+            'database over LANDLORD_SHARDS by payment count')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--landlord', type=int, help='Move only this landlord id')
+        parser.add_argument('--to', help='The shard to move --landlord to')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--dry-run', action='store_true', help='Print the moves only')
+
+    def handle(self, *args, **options):
+        shards = list(getattr(settings, 'LANDLORD_SHARDS', []))
+        if not shards:
+            raise CommandError('No LANDLORD_SHARDS are configured')
+
+        if options['landlord'] is not None:
+            if options['to'] not in shards + [DEFAULT_DB_ALIAS]:
+                raise CommandError('--to must be one of {}'.format(
+                    ', '.join([DEFAULT_DB_ALIAS] + shards)))
+            moves = [(Landlord.objects.get(pk=options['landlord']), options['to'])]
+        else:
+            moves = self.plan(shards)
+
+        moved = 0
+        for landlord, target in moves:
+            self.stdout.write('Landlord {}: {} -> {}'.format(landlord.pk, landlord.shard, target))
+            if options['dry_run']:
+                continue
+
+            start = time.perf_counter()
+            try:
+                rows = move_landlord(landlord, target, options['batch_size'])
+            except ValueError as ex:
+                if options['landlord'] is not None:
+                    raise CommandError(ex.args[0])
+                # Leave the landlord where it is and move the others
+                self.stderr.write('  Skipped: {}'.format(ex.args[0]))
+                continue
+            moved += 1
+            self.stdout.write('  {} rows in {:.2f}s'.format(rows, time.perf_counter() - start))
+
+        self.stdout.write(self.style.SUCCESS('{} landlords moved'.format(moved)))
+
+    def plan(self, shards):
+        """Assign the landlords in 'default', largest first, to the shard
+        with the fewest payments so far
+
+        Returns:
+            list -- (landlord, shard) pairs
+        """
+        load = {shard: Payment.objects.using(shard).count() for shard in shards}
+        sizes = dict(Payment.objects.using(DEFAULT_DB_ALIAS).values_list(
+            'landlord_id').annotate(Count('id')).order_by())
+
+        landlords = sorted(Landlord.objects.filter(shard=DEFAULT_DB_ALIAS).select_related('user'),
+                           key=lambda landlord: (-sizes.get(landlord.pk, 0), landlord.pk))
+        moves = []
+        for landlord in landlords:
+            target = min(shards, key=lambda shard: (load[shard], shards.index(shard)))
+            load[target] += sizes.get(landlord.pk, 0)
+            moves.append((landlord, target))
+        return moves
@@ -0,0 +1,21 @@
+"""Rebuild the MonthlyIncome summary table from Payment"""
+from django.core.management.base import BaseCommand
+from crosscheckapi.models import Landlord
+from crosscheckapi.reports import rebuild_monthly_income
+
+
+class Command(BaseCommand):
+    help = 'Recompute monthly income totals from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--landlord', type=int, help='Only rebuild this landlord id')
+
+    def handle(self, *args, **options):
+        landlord = None
+        if options['landlord'] is not None:
+            landlord = Landlord.objects.get(pk=options['landlord'])
+
+        # Each database is rebuilt in its own transaction
+        rebuild_monthly_income(landlord)
+
+        self.stdout.write(self.style.SUCCESS('Monthly income rebuilt'))
@@ -0,0 +1,152 @@
+"""Per-request SQL instrumentation
+
+The query_instrumentation middleware installs an execute wrapper on
+every database connection and records each statement of a request and
+how long it took, for sync and async requests alike. It reports the
+totals in a Server-Timing header and logs requests slower than
+SLOW_REQUEST_MS as one JSON line on the `crosscheckapi.requests` logger.
+
+Settings, all under REQUEST_INSTRUMENTATION:
+    ENABLED -- when false the middleware removes itself at startup
+    SLOW_REQUEST_MS -- requests slower than this are logged
+    TOP_STATEMENTS -- how many of the slowest statements a log includes
+    REPEATED_QUERIES -- a statement fingerprint seen this many times in
+        one request is logged as a likely N+1 query
+"""
+import asyncio
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.decorators import sync_and_async_middleware
+
+logger = logging.getLogger('crosscheckapi.requests')
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SLOW_REQUEST_MS': 500,
+    'TOP_STATEMENTS': 5,
+    'REPEATED_QUERIES': 3,
+}
+
+# Parameter lists of any length, e.g. `IN (%s, %s, %s)`, and literals
+PLACEHOLDER_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+def fingerprint(sql):
+    """The statement with parameters and literals removed, so that
+    the same query with different arguments compares equal
+    """
+    return LITERAL.sub('?', PLACEHOLDER_LIST.sub('(...)', sql))
+
+
+class QueryRecorder:
+    """Collects (sql, duration in ms) for every statement of one request"""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.statements)
+
+
+# The recorder of the request being handled. A context variable rather
+# than a per-connection wrapper, so statements that async views run in
+# worker threads are recorded against their request too.
+current_recorder = ContextVar('current_recorder', default=None)
+
+
+def record_statement(execute, sql, params, many, context):
+    """Execute wrapper installed on every new database connection"""
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        recorder.statements.append((sql, (time.perf_counter() - start) * 1000))
+
+
+def install_recorder(sender, connection, **kwargs):
+    if record_statement not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_statement)
+
+
+@sync_and_async_middleware
+def query_instrumentation(get_response):
+    """Count the queries and database time of every request"""
+    options = dict(DEFAULTS, **getattr(settings, 'REQUEST_INSTRUMENTATION', {}))
+    if not options['ENABLED']:
+        raise MiddlewareNotUsed
+
+    connection_created.connect(install_recorder, dispatch_uid='crosscheckapi.install_recorder')
+    for connection in connections.all():
+        if connection.connection is not None:
+            install_recorder(None, connection)
+
+    if asyncio.iscoroutinefunction(get_response):
+        async def middleware(request):
+            recorder = QueryRecorder()
+            reset = current_recorder.set(recorder)
+            start = time.perf_counter()
+            try:
+                response = await get_response(request)
+            finally:
+                current_recorder.reset(reset)
+            return report(options, request, response, recorder, start)
+
+    else:
+        def middleware(request):
+            recorder = QueryRecorder()
+            reset = current_recorder.set(recorder)
+            start = time.perf_counter()
+            try:
+                response = get_response(request)
+            finally:
+                current_recorder.reset(reset)
+            return report(options, request, response, recorder, start)
+
+    return middleware
+
+
+def report(options, request, response, recorder, start):
+    """Add the Server-Timing header and log the request when it is slow"""
+    total = (time.perf_counter() - start) * 1000
+
+    # Streamed bodies query after this point and are not counted
+    response['Server-Timing'] = 'db;desc="{} queries";dur={:.2f}, total;dur={:.2f}'.format(
+        len(recorder.statements), recorder.duration, total)
+
+    if total >= options['SLOW_REQUEST_MS']:
+        logger.warning(json.dumps(slow_request(options, request, response, recorder, total)))
+
+    return response
+
+
+def slow_request(options, request, response, recorder, total):
+    """The structured log record of a slow request"""
+    slowest = sorted(recorder.statements, key=lambda statement: statement[1], reverse=True)
+    repeated = Counter(fingerprint(sql) for sql, _ in recorder.statements)
+    return {
+        'method': request.method,
+        'path': request.get_full_path(),
+        'status': response.status_code,
+        'duration_ms': round(total, 2),
+        'db_ms': round(recorder.duration, 2),
+        'queries': len(recorder.statements),
+        'slowest': [{'sql': sql, 'duration_ms': round(duration, 2)}
+                    for sql, duration in slowest[:options['TOP_STATEMENTS']]],
+        'repeated': [{'fingerprint': sql, 'count': count}
+                     for sql, count in repeated.most_common()
+                     if count >= options['REPEATED_QUERIES']],
+    }
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.7 on 2026-10-18 12:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crosscheckapi', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['landlord', '-date', 'id'], name='payment_landlord_date_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.1.7 on 2026-10-18 12:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crosscheckapi', '0002_payment_landlord_date_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['landlord', 'tenant', '-date'], name='payment_landlord_tenant_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['landlord', 'full_name'], name='tenant_landlord_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenantpropertyrel',
+            index=models.Index(fields=['tenant', 'lease_start', 'lease_end'], name='lease_tenant_dates_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenantpropertyrel',
+            index=models.Index(fields=['rented_property', 'lease_start'], name='lease_property_start_idx'),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# Full-text index over each payment's ref_num and tenant name.
+# The rowid of each entry is the payment id. Triggers keep it in
+# sync with both tables, including bulk inserts and cascades.
+CREATE_SQL = [
+    """CREATE VIRTUAL TABLE crosscheckapi_payment_fts USING fts5(
+        ref_num, full_name, tokenize = 'unicode61', prefix = '2 3'
+    )""",
+    """CREATE TRIGGER crosscheckapi_payment_fts_insert
+    AFTER INSERT ON crosscheckapi_payment BEGIN
+        INSERT INTO crosscheckapi_payment_fts (rowid, ref_num, full_name)
+        SELECT new.id, new.ref_num, t.full_name
+        FROM crosscheckapi_tenant t WHERE t.id = new.tenant_id;
+    END""",
+    """CREATE TRIGGER crosscheckapi_payment_fts_update
+    AFTER UPDATE OF ref_num, tenant_id ON crosscheckapi_payment BEGIN
+        DELETE FROM crosscheckapi_payment_fts WHERE rowid = old.id;
+        INSERT INTO crosscheckapi_payment_fts (rowid, ref_num, full_name)
+        SELECT new.id, new.ref_num, t.full_name
+        FROM crosscheckapi_tenant t WHERE t.id = new.tenant_id;
+    END""",
+    """CREATE TRIGGER crosscheckapi_payment_fts_delete
+    AFTER DELETE ON crosscheckapi_payment BEGIN
+        DELETE FROM crosscheckapi_payment_fts WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER crosscheckapi_payment_fts_tenant_update
+    AFTER UPDATE OF full_name ON crosscheckapi_tenant BEGIN
+        UPDATE crosscheckapi_payment_fts SET full_name = new.full_name
+        WHERE rowid IN (
+            SELECT id FROM crosscheckapi_payment WHERE tenant_id = new.id
+        );
+    END""",
+    """INSERT INTO crosscheckapi_payment_fts (rowid, ref_num, full_name)
+    SELECT p.id, p.ref_num, t.full_name
+    FROM crosscheckapi_payment p
+    JOIN crosscheckapi_tenant t ON t.id = p.tenant_id""",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS crosscheckapi_payment_fts_tenant_update",
+    "DROP TRIGGER IF EXISTS crosscheckapi_payment_fts_delete",
+    "DROP TRIGGER IF EXISTS crosscheckapi_payment_fts_update",
+    "DROP TRIGGER IF EXISTS crosscheckapi_payment_fts_insert",
+    "DROP TABLE IF EXISTS crosscheckapi_payment_fts",
+]
+
+
+def run_sqlite(statements):
+    """Only SQLite has FTS5. Other databases keep the LIKE search."""
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crosscheckapi', '0003_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(CREATE_SQL), run_sqlite(DROP_SQL)),
+    ]
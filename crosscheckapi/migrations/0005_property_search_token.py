@@ -0,0 +1,41 @@
+# Generated by Django 3.1.7 on 2026-10-18 12:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+from crosscheckapi.models.property import tokenize_address
+
+
+def index_existing_properties(apps, schema_editor):
+    Property = apps.get_model('crosscheckapi', 'Property')
+    PropertySearchToken = apps.get_model('crosscheckapi', 'PropertySearchToken')
+    db_alias = schema_editor.connection.alias
+
+    for rental in Property.objects.using(db_alias).iterator():
+        PropertySearchToken.objects.using(db_alias).bulk_create([
+            PropertySearchToken(token=token, rented_property_id=rental.id, landlord_id=rental.landlord_id)
+            for token in tokenize_address(rental.street, rental.city, rental.state, rental.postal_code)
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crosscheckapi', '0004_payment_search_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PropertySearchToken',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=100)),
+                ('landlord', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crosscheckapi.landlord')),
+                ('rented_property', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crosscheckapi.property')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='propertysearchtoken',
+            index=models.Index(fields=['landlord', 'token', 'rented_property'], name='property_token_idx'),
+        ),
+        migrations.RunPython(index_existing_properties, migrations.RunPython.noop),
+    ]
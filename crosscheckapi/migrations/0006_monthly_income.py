@@ -0,0 +1,50 @@
+# Generated by Django 3.1.7 on 2026-10-18 12:44
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def summarize_existing_payments(apps, schema_editor):
+    Payment = apps.get_model('crosscheckapi', 'Payment')
+    MonthlyIncome = apps.get_model('crosscheckapi', 'MonthlyIncome')
+    db_alias = schema_editor.connection.alias
+
+    summary = Payment.objects.using(db_alias).annotate(month=TruncMonth('date')).values(
+        'landlord_id', 'rented_property_id', 'tenant_id', 'month', 'payment_type_id'
+    ).annotate(total=Sum('amount'), payment_count=Count('id')).order_by()
+    MonthlyIncome.objects.using(db_alias).bulk_create(
+        [MonthlyIncome(**row) for row in summary], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crosscheckapi', '0005_property_search_token'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyIncome',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('total', models.IntegerField(default=0)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('landlord', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crosscheckapi.landlord')),
+                ('payment_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crosscheckapi.paymenttype')),
+                ('rented_property', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='crosscheckapi.property')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crosscheckapi.tenant')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='monthlyincome',
+            index=models.Index(fields=['landlord', 'month'], name='income_landlord_month_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlyincome',
+            index=models.Index(fields=['landlord', 'tenant', 'month'], name='income_landlord_tenant_idx'),
+        ),
+        migrations.RunPython(summarize_existing_payments, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 13:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crosscheckapi', '0006_monthly_income'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='landlord',
+            name='shard',
+            field=models.CharField(default='default', max_length=50),
+        ),
+    ]
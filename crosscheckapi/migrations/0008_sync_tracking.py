@@ -0,0 +1,81 @@
+# Generated by Django 3.1.7 on 2026-10-18 13:24
+
+from importlib import import_module
+from django.db import migrations, models
+import django.db.models.deletion
+
+# SQLite adds the columns by rebuilding the payment and tenant tables,
+# which fails while the full-text index triggers refer to them. The
+# triggers are dropped for the rebuild and created again afterwards.
+# The index itself is unchanged, since no payment id, ref_num or
+# tenant name changes.
+payment_search_fts = import_module('crosscheckapi.migrations.0004_payment_search_fts')
+CREATE_TRIGGERS = payment_search_fts.CREATE_SQL[1:5]
+DROP_TRIGGERS = payment_search_fts.DROP_SQL[:4]
+run_sqlite = payment_search_fts.run_sqlite
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crosscheckapi', '0007_landlord_shard'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_sqlite(DROP_TRIGGERS), run_sqlite(CREATE_TRIGGERS)),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50)),
+                ('object_id', models.IntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='property',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='tenant',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='tenantpropertyrel',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['landlord', 'updated_at'], name='payment_landlord_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='property',
+            index=models.Index(fields=['landlord', 'updated_at'], name='property_landlord_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenant',
+            index=models.Index(fields=['landlord', 'updated_at'], name='tenant_landlord_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tenantpropertyrel',
+            index=models.Index(fields=['updated_at'], name='lease_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='landlord',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crosscheckapi.landlord'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['landlord', 'deleted_at'], name='tombstone_landlord_time_idx'),
+        ),
+        migrations.RunPython(run_sqlite(CREATE_TRIGGERS), run_sqlite(DROP_TRIGGERS)),
+    ]
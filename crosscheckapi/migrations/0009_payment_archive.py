@@ -0,0 +1,59 @@
+# Generated by Django 3.1.7 on 2026-10-18 13:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+COLUMNS = ('id, date, amount, ref_num, tenant_id, rented_property_id, payment_type_id, '
+           'landlord_id, updated_at')
+
+# PaymentHistory reads both tables. SQLite applies the filters and the
+# ordering of a query on the view to each table's index separately.
+CREATE_VIEW = (
+    'CREATE VIEW crosscheckapi_payment_history AS '
+    'SELECT {0} FROM crosscheckapi_payment UNION ALL '
+    'SELECT {0} FROM crosscheckapi_archivedpayment'.format(COLUMNS)
+)
+DROP_VIEW = 'DROP VIEW crosscheckapi_payment_history'
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crosscheckapi', '0008_sync_tracking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentHistory',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('amount', models.IntegerField()),
+                ('ref_num', models.CharField(max_length=100)),
+                ('updated_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'crosscheckapi_payment_history',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedPayment',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('amount', models.IntegerField()),
+                ('ref_num', models.CharField(max_length=100)),
+                ('updated_at', models.DateTimeField()),
+                ('landlord', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crosscheckapi.landlord')),
+                ('payment_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crosscheckapi.paymenttype')),
+                ('rented_property', models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.CASCADE, to='crosscheckapi.property')),
+                ('tenant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='crosscheckapi.tenant')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedpayment',
+            index=models.Index(fields=['landlord', '-date', 'id'], name='archived_landlord_date_idx'),
+        ),
+        migrations.RunSQL(CREATE_VIEW, DROP_VIEW),
+    ]
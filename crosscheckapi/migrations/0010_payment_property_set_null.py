@@ -0,0 +1,24 @@
+# Generated by Django 3.1.7 on 2026-10-18 13:58
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crosscheckapi', '0009_payment_archive'),
+    ]
+
+    # on_delete is applied by Django, not by the database, so only the
+    # model state changes. Altering the field would rebuild the payment
+    # table on SQLite.
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='payment',
+                name='rented_property',
+                field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, to='crosscheckapi.property'),
+            ),
+        ]),
+    ]
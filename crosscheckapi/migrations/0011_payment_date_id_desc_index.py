@@ -0,0 +1,29 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crosscheckapi', '0010_payment_property_set_null'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='payment',
+            name='payment_landlord_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['landlord', '-date', '-id'], name='payment_landlord_date_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='archivedpayment',
+            name='archived_landlord_date_idx',
+        ),
+        migrations.AddIndex(
+            model_name='archivedpayment',
+            index=models.Index(fields=['landlord', '-date', '-id'], name='archived_landlord_date_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:15
+
+from importlib import import_module
+from django.db import migrations, models
+
+# Ids are numbered from each shard's offset, past the 32 bit range. The
+# payment history view reads the archived payment ids, so it is dropped
+# while their column changes and created again afterwards.
+payment_archive = import_module('crosscheckapi.migrations.0009_payment_archive')
+CREATE_VIEW = payment_archive.CREATE_VIEW
+DROP_VIEW = payment_archive.DROP_VIEW
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crosscheckapi', '0011_payment_date_id_desc_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DROP_VIEW, CREATE_VIEW),
+        migrations.AlterField(
+            model_name='archivedpayment',
+            name='id',
+            field=models.BigIntegerField(primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='tombstone',
+            name='object_id',
+            field=models.BigIntegerField(),
+        ),
+        migrations.RunSQL(CREATE_VIEW, DROP_VIEW),
+    ]
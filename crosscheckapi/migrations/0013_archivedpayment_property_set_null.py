@@ -0,0 +1,23 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crosscheckapi', '0012_big_archived_ids'),
+    ]
+
+    # on_delete is applied by Django, not by the database, so only the
+    # model state changes, as for payments in 0010
+    operations = [
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='archivedpayment',
+                name='rented_property',
+                field=models.ForeignKey(blank=True, default=None, null=True, on_delete=django.db.models.deletion.SET_NULL, to='crosscheckapi.property'),
+            ),
+        ]),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.1.7 on 2026-10-18 14:16
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+SUMMARY_FIELDS = ('landlord_id', 'rented_property_id', 'tenant_id', 'month', 'payment_type_id')
+
+
+def merge_duplicate_summaries(apps, schema_editor):
+    """Fold the rows that concurrent first payments created for one
+    summary key into the oldest of them
+    """
+    MonthlyIncome = apps.get_model('crosscheckapi', 'MonthlyIncome')
+    rows = MonthlyIncome.objects.using(schema_editor.connection.alias)
+
+    duplicates = rows.values(*SUMMARY_FIELDS).annotate(
+        rows=Count('id'), first=Min('id'), total_sum=Sum('total'),
+        count_sum=Sum('payment_count')).filter(rows__gt=1).order_by()
+    for key in list(duplicates):
+        fields = {field: key[field] for field in SUMMARY_FIELDS}
+        rows.filter(**fields).exclude(id=key['first']).delete()
+        rows.filter(id=key['first']).update(total=key['total_sum'], payment_count=key['count_sum'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('crosscheckapi', '0013_archivedpayment_property_set_null'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_summaries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='monthlyincome',
+            constraint=models.UniqueConstraint(condition=models.Q(rented_property__isnull=False), fields=('landlord', 'tenant', 'month', 'payment_type', 'rented_property'), name='income_summary_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='monthlyincome',
+            constraint=models.UniqueConstraint(condition=models.Q(rented_property__isnull=True), fields=('landlord', 'tenant', 'month', 'payment_type'), name='income_unassigned_summary_unique'),
+        ),
+    ]
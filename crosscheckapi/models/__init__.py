@@ -1,6 +1,10 @@
+from .archivedpayment import ArchivedPayment, PaymentHistory
 from .landlord import Landlord
+from .monthlyincome import MonthlyIncome
 from .payment import Payment
 from .paymenttype import PaymentType
 from .property import Property
+from .propertysearchtoken import PropertySearchToken
 from .tenant import Tenant
-from .tenantpropertyrel import TenantPropertyRel
\ No newline at end of file
+from .tenantpropertyrel import TenantPropertyRel
+from .tombstone import Tombstone
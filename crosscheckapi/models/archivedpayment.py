@@ -0,0 +1,60 @@
+from django.db import models
+from django.db.models import Q
+
+
+class ArchivedPayment(models.Model):
+    """A payment dated before the archive horizon, moved out of the
+    payment table by `archive_payments`. It keeps the payment's id.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    date = models.DateField(auto_now=False, auto_now_add=False)
+    amount = models.IntegerField()
+    ref_num = models.CharField(max_length=100)
+    tenant = models.ForeignKey("Tenant", on_delete=models.CASCADE)
+    rented_property = models.ForeignKey("Property", on_delete=models.SET_NULL, default=None, blank=True, null=True)
+    payment_type = models.ForeignKey("PaymentType", on_delete=models.CASCADE)
+    landlord = models.ForeignKey("Landlord", on_delete=models.CASCADE)
+    updated_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # The same date ordered index as payments, so archived
+            # payments are read by date range without sorting
+            models.Index(fields=['landlord', '-date', '-id'], name='archived_landlord_date_idx'),
+        ]
+
+
+class PaymentHistoryQuerySet(models.QuerySet):
+    """Custom queries for the payment history"""
+
+    def search(self, keyword, ranked=False):
+        """Filter payments whose ref_num or tenant name contains `keyword`
+
+        Archived payments are not in the full-text index, so the history
+        is always searched with `icontains` and never ranked.
+        """
+        return self.filter(
+            Q(ref_num__icontains=keyword) | Q(tenant__full_name__icontains=keyword))
+
+
+class PaymentHistory(models.Model):
+    """Read-only view of the payments and the archived payments together
+
+    Only queries that reach back past the archive horizon need it. The
+    database applies their filters to each table's own index.
+    """
+    date = models.DateField(auto_now=False, auto_now_add=False)
+    amount = models.IntegerField()
+    ref_num = models.CharField(max_length=100)
+    tenant = models.ForeignKey("Tenant", on_delete=models.DO_NOTHING, related_name='+')
+    rented_property = models.ForeignKey("Property", on_delete=models.DO_NOTHING, related_name='+',
+                                        default=None, blank=True, null=True)
+    payment_type = models.ForeignKey("PaymentType", on_delete=models.DO_NOTHING, related_name='+')
+    landlord = models.ForeignKey("Landlord", on_delete=models.DO_NOTHING, related_name='+')
+    updated_at = models.DateTimeField()
+
+    objects = PaymentHistoryQuerySet.as_manager()
+
+    class Meta:
+        managed = False
+        db_table = 'crosscheckapi_payment_history'
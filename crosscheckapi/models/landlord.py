@@ -2,4 +2,6 @@ from django.db import models
 from django.contrib.auth.models import User
 
 class Landlord(models.Model):
-    user = models.OneToOneField(User, on_delete=models.CASCADE)
\ No newline at end of file
+    user = models.OneToOneField(User, on_delete=models.CASCADE)
+    # The database alias holding this landlord's rows, see crosscheckapi.shards
+    shard = models.CharField(max_length=50, default='default')
@@ -0,0 +1,29 @@
+from django.db import models
+
+class MonthlyIncome(models.Model):
+    """Payment totals per landlord, property, tenant, month and payment
+    type, kept up to date as payments change
+    """
+    month = models.DateField(auto_now=False, auto_now_add=False)
+    total = models.IntegerField(default=0)
+    payment_count = models.IntegerField(default=0)
+    landlord = models.ForeignKey("Landlord", on_delete=models.CASCADE)
+    rented_property = models.ForeignKey("Property", on_delete=models.CASCADE, default=None, blank=True, null=True)
+    tenant = models.ForeignKey("Tenant", on_delete=models.CASCADE)
+    payment_type = models.ForeignKey("PaymentType", on_delete=models.CASCADE)
+
+    class Meta:
+        # One row per summary key. Two constraints, since NULLs never
+        # conflict in a unique index and payments may have no property.
+        constraints = [
+            models.UniqueConstraint(
+                fields=['landlord', 'tenant', 'month', 'payment_type', 'rented_property'],
+                condition=models.Q(rented_property__isnull=False), name='income_summary_unique'),
+            models.UniqueConstraint(
+                fields=['landlord', 'tenant', 'month', 'payment_type'],
+                condition=models.Q(rented_property__isnull=True), name='income_unassigned_summary_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['landlord', 'month'], name='income_landlord_month_idx'),
+            models.Index(fields=['landlord', 'tenant', 'month'], name='income_landlord_tenant_idx'),
+        ]
@@ -1,10 +1,60 @@
-from django.db import models
+import re
+from django.db import connections, models
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+
+class PaymentQuerySet(models.QuerySet):
+    """Custom queries for payments"""
+
+    def search(self, keyword, ranked=False):
+        """Filter payments whose ref_num or tenant name matches `keyword`
+
+        On SQLite this uses the crosscheckapi_payment_fts index: every word in
+        the keyword must prefix-match a word of the ref_num or tenant name.
+        With `ranked`, results are ordered by bm25 relevance, best first.
+        Other databases fall back to `icontains`.
+        """
+        terms = re.findall(r'\w+', keyword)
+        if not terms or connections[self.db].vendor != 'sqlite':
+            return self.filter(
+                Q(ref_num__icontains=keyword) | Q(tenant__full_name__icontains=keyword))
+
+        match = ' '.join('"{}"*'.format(term) for term in terms)
+        payments = self.filter(id__in=RawSQL(
+            "SELECT rowid FROM crosscheckapi_payment_fts "
+            "WHERE crosscheckapi_payment_fts MATCH %s", [match]))
+
+        if ranked:
+            payments = payments.annotate(search_rank=RawSQL(
+                "SELECT rank FROM crosscheckapi_payment_fts "
+                "WHERE crosscheckapi_payment_fts MATCH %s "
+                "AND rowid = crosscheckapi_payment.id", [match]
+            )).order_by('search_rank', '-date', '-id')
+
+        return payments
+
 
 class Payment(models.Model):
     date = models.DateField(auto_now=False, auto_now_add=False)
     amount = models.IntegerField()
     ref_num = models.CharField(max_length=100)
     tenant = models.ForeignKey("Tenant", on_delete=models.CASCADE)
-    rented_property = models.ForeignKey("Property", on_delete=models.CASCADE, default=None, blank=True, null=True)
+    # Deleting a property keeps its payments, unassigned
+    rented_property = models.ForeignKey("Property", on_delete=models.SET_NULL, default=None, blank=True, null=True)
     payment_type = models.ForeignKey("PaymentType", on_delete=models.CASCADE)
-    landlord = models.ForeignKey("Landlord", on_delete=models.CASCADE)
\ No newline at end of file
+    landlord = models.ForeignKey("Landlord", on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PaymentQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves a landlord's payments newest first, optionally
+            # narrowed to a date range, without sorting
+            models.Index(fields=['landlord', '-date', '-id'], name='payment_landlord_date_idx'),
+            # Serves a single tenant's payment history, newest first
+            models.Index(fields=['landlord', 'tenant', '-date'], name='payment_landlord_tenant_idx'),
+            # Serves the payments changed since a /sync cursor
+            models.Index(fields=['landlord', 'updated_at'], name='payment_landlord_updated_idx'),
+        ]
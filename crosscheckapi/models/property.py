@@ -1,11 +1,70 @@
+import re
 from django.db import models
 
+# Common address words and their abbreviations. Both spellings are
+# indexed so "street", "st" and partial words like "stre" all match.
+ADDRESS_ABBREVIATIONS = {
+    'avenue': 'ave', 'boulevard': 'blvd', 'circle': 'cir', 'court': 'ct',
+    'drive': 'dr', 'highway': 'hwy', 'lane': 'ln', 'parkway': 'pkwy',
+    'place': 'pl', 'road': 'rd', 'street': 'st', 'terrace': 'ter',
+    'north': 'n', 'south': 's', 'east': 'e', 'west': 'w',
+    'apartment': 'apt', 'suite': 'ste',
+}
+ADDRESS_EXPANSIONS = {abbr: word for word, abbr in ADDRESS_ABBREVIATIONS.items()}
+
+
+def tokenize_address(*parts):
+    """Split address parts into lowercase word tokens
+
+    Returns:
+        set -- every word plus the other spelling of known abbreviations
+    """
+    tokens = set()
+    for part in parts:
+        for word in re.findall(r'\w+', (part or '').lower()):
+            tokens.add(word)
+            if word in ADDRESS_ABBREVIATIONS:
+                tokens.add(ADDRESS_ABBREVIATIONS[word])
+            if word in ADDRESS_EXPANSIONS:
+                tokens.add(ADDRESS_EXPANSIONS[word])
+    return tokens
+
+
+class PropertyQuerySet(models.QuerySet):
+    """Custom queries for properties"""
+
+    def search(self, text, landlord):
+        """Filter properties matching every word of `text` as a prefix
+        of an address token, e.g. "main 37203"
+
+        Each word is an index range scan over the landlord's
+        PropertySearchToken rows.
+        """
+        from .propertysearchtoken import PropertySearchToken
+
+        properties = self
+        for term in re.findall(r'\w+', text.lower()):
+            matches = PropertySearchToken.objects.filter(
+                landlord=landlord, token__gte=term, token__lt=term + '\uffff')
+            properties = properties.filter(id__in=matches.values('rented_property_id'))
+        return properties
+
+
 class Property(models.Model):
     street = models.CharField(max_length=100)
     city = models.CharField(max_length=50)
     state = models.CharField(max_length=50)
     postal_code = models.CharField(max_length=50)
     landlord = models.ForeignKey("Landlord", on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = PropertyQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serves the properties changed since a /sync cursor
+            models.Index(fields=['landlord', 'updated_at'], name='property_landlord_updated_idx'),
+        ]
 
     @property
     def lease(self):
@@ -13,4 +72,9 @@ class Property(models.Model):
 
     @lease.setter
     def lease(self, value):
-        self.__lease = value
\ No newline at end of file
+        self.__lease = value
+
+    @property
+    def address_tokens(self):
+        """The address tokens indexed for this property"""
+        return tokenize_address(self.street, self.city, self.state, self.postal_code)
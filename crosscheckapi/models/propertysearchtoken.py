@@ -0,0 +1,14 @@
+from django.db import models
+
+class PropertySearchToken(models.Model):
+    """One normalized address word of a property, rebuilt whenever
+    the property is saved
+    """
+    token = models.CharField(max_length=100)
+    rented_property = models.ForeignKey("Property", on_delete=models.CASCADE)
+    landlord = models.ForeignKey("Landlord", on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['landlord', 'token', 'rented_property'], name='property_token_idx'),
+        ]
@@ -1,10 +1,40 @@
 from django.db import models
+from django.db.models import Prefetch
+
+
+class TenantQuerySet(models.QuerySet):
+    """Custom queries for tenants"""
+
+    def with_leases(self):
+        """Prefetch every lease and leased property for the tenants
+        in a fixed number of queries. The leases are stored
+        on each tenant as the list `leases`.
+        """
+        from .tenantpropertyrel import TenantPropertyRel
+
+        # Ordered by tenant first, so the tenant_id index returns the
+        # leases of the prefetched tenants already sorted
+        leases = TenantPropertyRel.objects.select_related(
+            'rented_property').with_active().order_by('tenant_id', 'id')
+        return self.prefetch_related(
+            Prefetch('tenantpropertyrel_set', queryset=leases, to_attr='leases'))
+
 
 class Tenant(models.Model):
     phone_number = models.CharField(max_length=15, default=None, blank=True, null=True)
     email = models.CharField(max_length=150, default=None, blank=True, null=True)
     full_name = models.CharField(max_length=150)
     landlord = models.ForeignKey("Landlord", on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TenantQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['landlord', 'full_name'], name='tenant_landlord_name_idx'),
+            # Serves the tenants changed since a /sync cursor
+            models.Index(fields=['landlord', 'updated_at'], name='tenant_landlord_updated_idx'),
+        ]
 
     @property
     def rented_property(self):
@@ -12,4 +42,4 @@ class Tenant(models.Model):
 
     @rented_property.setter
     def rented_property(self, value):
-        self.__rented_property = value
\ No newline at end of file
+        self.__rented_property = value
@@ -1,4 +1,33 @@
+from datetime import date
 from django.db import models
+from django.db.models import BooleanField, Case, Value, When
+
+
+class TenantPropertyRelQuerySet(models.QuerySet):
+    """Custom queries for leases"""
+
+    def with_active(self):
+        """Annotate each lease with `active`, computed in SQL
+        from today's date and the lease date range. A lease is
+        active from its first through its last day.
+        """
+        current_day = date.today()
+        return self.annotate(active=Case(
+            When(lease_start__lte=current_day, lease_end__gte=current_day, then=Value(True)),
+            default=Value(False),
+            output_field=BooleanField()
+        ))
+
+
+    def covering(self, tenant, day):
+        """Leases of `tenant` whose date range contains `day`, the
+        latest starting first. Served by the (tenant, lease_start,
+        lease_end) index.
+        """
+        return self.filter(
+            tenant=tenant, lease_start__lte=day, lease_end__gte=day
+        ).order_by('-lease_start', '-id')
+
 
 class TenantPropertyRel(models.Model):
     lease_start = models.DateField(auto_now=False, auto_now_add=False)
@@ -6,6 +35,19 @@ class TenantPropertyRel(models.Model):
     rent = models.IntegerField()
     tenant = models.ForeignKey("Tenant", on_delete=models.CASCADE)
     rented_property = models.ForeignKey("Property", on_delete=models.CASCADE)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TenantPropertyRelQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Finds the lease covering a date for a tenant
+            models.Index(fields=['tenant', 'lease_start', 'lease_end'], name='lease_tenant_dates_idx'),
+            models.Index(fields=['rented_property', 'lease_start'], name='lease_property_start_idx'),
+            # Leases have no landlord column, so /sync scans the changed
+            # leases and keeps the landlord's
+            models.Index(fields=['updated_at'], name='lease_updated_idx'),
+        ]
 
     @property
     def active(self):
@@ -13,4 +55,4 @@ class TenantPropertyRel(models.Model):
 
     @active.setter
     def active(self, value):
-        self.__active = value
\ No newline at end of file
+        self.__active = value
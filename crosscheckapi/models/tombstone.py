@@ -0,0 +1,15 @@
+from django.db import models
+
+class Tombstone(models.Model):
+    """The id of a deleted tenant, property, payment or lease, kept so
+    that /sync can report the deletion
+    """
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+    landlord = models.ForeignKey("Landlord", on_delete=models.CASCADE)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['landlord', 'deleted_at'], name='tombstone_landlord_time_idx'),
+        ]
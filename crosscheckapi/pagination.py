@@ -0,0 +1,107 @@
+"""Cursor pagination for the list endpoints"""
+from django.db.models import Q
+from django.utils.dateparse import parse_date
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import Cursor, CursorPagination
+
+
+class IdCursorPagination(CursorPagination):
+    """Opaque cursor pagination ordered by id
+
+    Lists are only paginated when the client asks for it with
+    `?page_size=` or `?cursor=`, so existing clients still receive
+    the full list. Each page is fetched with a keyset filter on the
+    ordering rather than an OFFSET, so deep pages cost the same as
+    the first one.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_page_size(self, request):
+        if (self.cursor_query_param not in request.query_params and
+                self.page_size_query_param not in request.query_params):
+            return None
+
+        return super().get_page_size(request)
+
+
+class PaymentCursorPagination(IdCursorPagination):
+    """Keyset pagination for payments, newest first
+
+    DRF's CursorPagination only positions on the first ordering field
+    and pages through payments sharing a date with an OFFSET, which it
+    caps at `offset_cutoff`. Here the cursor holds the (date, id) of the
+    last payment shown, and the next page is the payments ordered after
+    it, however many share its date.
+    """
+    ordering = ('-date', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = None if self.cursor is None else self.decode_position(self.cursor.position)
+
+        if position is not None:
+            day, pk = position
+            # The redundant bound on the date keeps the scan a range of the index
+            if reverse:
+                queryset = queryset.filter(date__gte=day).filter(Q(date__gt=day) | Q(id__gt=pk))
+            else:
+                queryset = queryset.filter(date__lte=day).filter(Q(date__lt=day) | Q(id__lt=pk))
+        queryset = queryset.order_by('date', 'id') if reverse else queryset.order_by(*self.ordering)
+
+        # One extra row tells whether there is a following page
+        results = list(queryset[:self.page_size + 1])
+        has_following = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, has_following
+        else:
+            self.has_next, self.has_previous = has_following, position is not None
+
+        if self.has_next or self.has_previous:
+            self.display_page_controls = True
+        return self.page
+
+    def decode_position(self, position):
+        """Parse a `date_id` cursor position
+
+        Raises:
+            NotFound -- when the position is malformed
+        """
+        if position is None:
+            return None
+        try:
+            day, pk = position.split('_')
+            day, pk = parse_date(day), int(pk)
+        except ValueError:
+            day = None
+        if day is None:
+            raise NotFound(self.invalid_cursor_message)
+        return day, pk
+
+    def encode_position(self, payment, reverse):
+        """A cursor link positioned at a payment instance or values() row"""
+        if isinstance(payment, dict):
+            day, pk = payment['date'], payment['id']
+        else:
+            day, pk = payment.date, payment.id
+        position = '{}_{}'.format(day.isoformat(), pk)
+        return self.encode_cursor(Cursor(offset=0, reverse=reverse, position=position))
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_position(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_position(self.page[0], reverse=True)
@@ -0,0 +1,156 @@
+"""Vectorized rent reconciliation
+
+Compares the rent each lease expects every month with the payments its
+tenant actually made. All leases and payments of a landlord are loaded
+into NumPy arrays and reconciled in one pass, with no Python loop per
+lease or per payment.
+
+Rent is due on the first of each month, or on the lease start in its
+first month. A payment belongs to the tenant's lease whose
+[lease_start, lease_end] contains the payment date, the latest starting
+one when leases overlap, and to that lease's month of the payment date.
+"""
+from datetime import date
+import numpy as np
+from crosscheckapi.models import PaymentHistory, TenantPropertyRel
+
+# Large enough that (tenant, day) pairs encoded as tenant * DAY_SPAN + day
+# never collide for any date after 1970
+DAY_SPAN = 1 << 20
+
+
+def load_leases(landlord):
+    """Load every lease of the landlord as arrays"""
+    rows = list(TenantPropertyRel.objects.filter(tenant__landlord=landlord).values_list(
+        'id', 'tenant_id', 'rented_property_id', 'lease_start', 'lease_end', 'rent'))
+    columns = list(zip(*rows)) or [()] * 6
+    return {
+        'id': np.array(columns[0], dtype=np.int64),
+        'tenant': np.array(columns[1], dtype=np.int64),
+        'property': np.array(columns[2], dtype=np.int64),
+        'start': np.array(columns[3], dtype='datetime64[D]'),
+        'end': np.array(columns[4], dtype='datetime64[D]'),
+        'rent': np.array(columns[5], dtype=np.int64),
+    }
+
+
+def load_payments(landlord):
+    """Load every payment of the landlord, archived ones included, as arrays"""
+    rows = list(PaymentHistory.objects.filter(landlord=landlord).values_list(
+        'tenant_id', 'date', 'amount'))
+    columns = list(zip(*rows)) or [()] * 3
+    return {
+        'tenant': np.array(columns[0], dtype=np.int64),
+        'date': np.array(columns[1], dtype='datetime64[D]'),
+        'amount': np.array(columns[2], dtype=np.int64),
+    }
+
+
+def match_leases(leases, payments):
+    """Return the index of each payment's lease, or -1 when no lease of
+    the tenant covers the payment date
+
+    Like `TenantPropertyRel.objects.covering`, a payment matches the
+    tenant's latest starting lease whose range contains its date, so a
+    long lease is still found behind later, shorter ones.
+    """
+    lease_keys = leases['tenant'] * DAY_SPAN + leases['start'].astype(np.int64)
+    # Leases starting the same day are ordered by id, the latest last
+    order = np.lexsort((leases['id'], lease_keys))
+    lease_tenant = leases['tenant'][order]
+    lease_end = leases['end'][order]
+    payment_keys = payments['tenant'] * DAY_SPAN + payments['date'].astype(np.int64)
+
+    # The latest starting lease at or before each payment
+    candidate = np.searchsorted(lease_keys[order], payment_keys, side='right') - 1
+    lease = np.full(len(payment_keys), -1, dtype=np.int64)
+
+    # Step the unmatched payments back through their tenant's earlier
+    # leases together, one pass per lease overlapping behind another
+    pending = np.arange(len(payment_keys))
+    while len(pending):
+        step = candidate[pending]
+        same_tenant = step >= 0
+        same_tenant[same_tenant] = lease_tenant[step[same_tenant]] == payments['tenant'][pending[same_tenant]]
+        pending, step = pending[same_tenant], step[same_tenant]
+
+        covered = payments['date'][pending] <= lease_end[step]
+        lease[pending[covered]] = order[step[covered]]
+        pending = pending[~covered]
+        candidate[pending] = step[~covered] - 1
+    return lease
+
+
+def reconcile(leases, payments, as_of=None):
+    """Reconcile expected and received rent for every lease month due
+    by `as_of` (default today)
+
+    Returns:
+        dict -- per lease arrays: expected, received, arrears,
+        overpayment, late_months and max_days_late, plus the
+        count and total of payments that match no lease
+    """
+    as_of = np.datetime64(as_of or date.today(), 'D')
+    lease_count = len(leases['id'])
+
+    # Expand each lease into one row per month due so far
+    first_month = leases['start'].astype('datetime64[M]').astype(np.int64)
+    last_month = np.minimum(leases['end'], as_of).astype('datetime64[M]').astype(np.int64)
+    month_counts = np.maximum(last_month - first_month + 1, 0)
+    row_offsets = np.cumsum(month_counts) - month_counts
+    row_lease = np.repeat(np.arange(lease_count), month_counts)
+    row_month = first_month[row_lease] + np.arange(len(row_lease)) - row_offsets[row_lease]
+
+    expected = leases['rent'][row_lease]
+    due = np.maximum(row_month.astype('datetime64[M]').astype('datetime64[D]'),
+                     leases['start'][row_lease]).astype(np.int64)
+
+    # Place each payment in its lease month
+    lease = match_leases(leases, payments)
+    matched = lease >= 0
+    pay_lease = lease[matched]
+    pay_day = payments['date'][matched].astype(np.int64)
+    pay_amount = payments['amount'][matched]
+    month_offset = (payments['date'][matched].astype('datetime64[M]').astype(np.int64) -
+                    first_month[pay_lease])
+    in_range = month_offset < month_counts[pay_lease]
+    pay_row = (row_offsets[pay_lease] + month_offset)[in_range]
+    pay_day = pay_day[in_range]
+    pay_amount = pay_amount[in_range]
+
+    received = np.bincount(pay_row, weights=pay_amount, minlength=len(row_lease)).astype(np.int64)
+
+    # The day each month was paid in full: the first payment at which
+    # the running total within the month reaches the rent
+    order = np.lexsort((pay_day, pay_row))
+    sorted_row, sorted_day, sorted_amount = pay_row[order], pay_day[order], pay_amount[order]
+    running = np.cumsum(sorted_amount)
+    month_base = np.zeros(len(row_lease), dtype=np.int64)
+    unique_rows, first_index = np.unique(sorted_row, return_index=True)
+    month_base[unique_rows] = running[first_index] - sorted_amount[first_index]
+    covered = running - month_base[sorted_row] >= expected[sorted_row]
+
+    no_day = np.iinfo(np.int64).max
+    paid_day = np.full(len(row_lease), no_day, dtype=np.int64)
+    np.minimum.at(paid_day, sorted_row[covered], sorted_day[covered])
+
+    settled_day = np.where(paid_day == no_day, as_of.astype(np.int64), paid_day)
+    days_late = np.maximum(settled_day - due, 0)
+
+    lease_expected = np.bincount(row_lease, weights=expected, minlength=lease_count)
+    lease_received = np.bincount(row_lease, weights=received, minlength=lease_count)
+    balance = lease_expected - lease_received
+    max_days_late = np.zeros(lease_count, dtype=np.int64)
+    np.maximum.at(max_days_late, row_lease, days_late)
+
+    return {
+        'expected': lease_expected.astype(np.int64),
+        'received': lease_received.astype(np.int64),
+        'arrears': np.maximum(balance, 0).astype(np.int64),
+        'overpayment': np.maximum(-balance, 0).astype(np.int64),
+        'late_months': np.bincount(row_lease, weights=days_late > 0,
+                                   minlength=lease_count).astype(np.int64),
+        'max_days_late': max_days_late,
+        'unmatched_count': int(len(lease) - len(pay_row)),
+        'unmatched_total': int(payments['amount'].sum() - pay_amount.sum()),
+    }
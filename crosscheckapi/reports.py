@@ -0,0 +1,80 @@
+"""Incremental maintenance of the MonthlyIncome summary table"""
+from collections import Counter
+from datetime import date
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+from crosscheckapi.models import MonthlyIncome, PaymentHistory
+from crosscheckapi.shards import landlord_databases, shard_alias
+
+SUMMARY_FIELDS = ('landlord_id', 'rented_property_id', 'tenant_id', 'month', 'payment_type_id')
+
+
+def summary_key(payment):
+    """The MonthlyIncome row a payment is counted in"""
+    payment_date = payment.date
+    if isinstance(payment_date, str):
+        payment_date = date.fromisoformat(payment_date[:10])
+
+    return (payment.landlord_id, payment.rented_property_id, payment.tenant_id,
+            payment_date.replace(day=1), payment.payment_type_id)
+
+
+def apply_delta(key, total, count, using=None):
+    """Add `total` and `count` to the summary row for `key`, in the
+    `using` database or the routed one
+    """
+    fields = dict(zip(SUMMARY_FIELDS, key))
+    using = using or router.db_for_write(MonthlyIncome)
+    summaries = MonthlyIncome.objects.db_manager(using)
+    row = summaries.filter(**fields)
+
+    def add():
+        return row.update(total=F('total') + total, payment_count=F('payment_count') + count)
+
+    if not add() and count > 0:
+        try:
+            with transaction.atomic(using=using):
+                summaries.create(total=total, payment_count=count, **fields)
+        except IntegrityError:
+            # A concurrent first payment for the key created the row
+            add()
+    elif count < 0:
+        row.filter(payment_count__lte=0).delete()
+
+
+def record_payments(payments, sign=1):
+    """Count many payments at once, one summary update per row touched.
+    Used by paths that bypass the model signals, such as bulk_create.
+    """
+    totals = Counter()
+    counts = Counter()
+    for payment in payments:
+        key = summary_key(payment)
+        totals[key] += sign * payment.amount
+        counts[key] += sign
+
+    for key, count in counts.items():
+        apply_delta(key, totals[key], count)
+
+
+def rebuild_monthly_income(landlord=None):
+    """Recompute the summary table from the payments and the archived
+    payments, for one landlord in its shard or for all landlords in
+    every database
+    """
+    databases = landlord_databases() if landlord is None else [shard_alias(landlord)]
+    for using in databases:
+        rows = MonthlyIncome.objects.using(using)
+        payments = PaymentHistory.objects.using(using)
+        if landlord is not None:
+            rows = rows.filter(landlord=landlord)
+            payments = payments.filter(landlord=landlord)
+
+        with transaction.atomic(using=using):
+            rows.delete()
+            summary = payments.annotate(month=TruncMonth('date')).values(*SUMMARY_FIELDS).annotate(
+                total=Sum('amount'), payment_count=Count('id')).order_by()
+
+            MonthlyIncome.objects.using(using).bulk_create(
+                (MonthlyIncome(**row) for row in summary.iterator()), batch_size=1000)
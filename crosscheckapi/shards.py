@@ -0,0 +1,265 @@
+"""Per-landlord database shards
+
+Every landlord-scoped model (tenants, properties, leases, payments and
+the data derived from them) is stored in the database named by the
+landlord's `shard`. Landlords that were never moved keep 'default'.
+Users, tokens, landlords and payment types always live in 'default'.
+Landlords, their users and payment types are mirrored into the shards
+so that foreign keys still resolve there.
+
+The shard of a request is chosen from the authenticated landlord and
+kept in a context variable, which LandlordShardRouter reads. Code that
+runs outside a request selects a landlord's shard with `landlord_shard()`.
+
+Each database numbers its rows from its own offset, so primary keys are
+unique across databases and a landlord moves with its ids unchanged.
+SQLite continues a table's ids after the largest id ever inserted, so a
+landlord can only move to a database whose range is above its ids: out
+of 'default' into any shard, and from a shard to a later one.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count
+from crosscheckapi.models import (ArchivedPayment, Landlord, MonthlyIncome, Payment, PaymentHistory,
+                                  PaymentType, Property, PropertySearchToken, Tenant, TenantPropertyRel,
+                                  Tombstone)
+
+# Copied in this order, so rows only refer to rows already copied
+SHARDED_MODELS = [Property, Tenant, TenantPropertyRel, Payment, ArchivedPayment, MonthlyIncome,
+                  PropertySearchToken, Tombstone]
+# PaymentHistory is a view of the payment tables, so it is routed but not copied
+SHARDED_LABELS = {model._meta.label_lower for model in SHARDED_MODELS + [PaymentHistory]}
+
+# Ids of the n-th database of landlord_databases() start at n * SHARD_ID_SPAN
+SHARD_ID_SPAN = 1 << 40
+
+current_shard = ContextVar('current_shard', default=None)
+
+
+def shard_alias(landlord):
+    """The database holding `landlord`'s rows"""
+    return getattr(landlord, 'shard', None) or DEFAULT_DB_ALIAS
+
+
+def landlord_databases():
+    """Every database that can hold landlord rows"""
+    return [DEFAULT_DB_ALIAS] + list(getattr(settings, 'LANDLORD_SHARDS', []))
+
+
+def activate(landlord):
+    """Route landlord-scoped queries to `landlord`'s shard for the rest
+    of the current request
+    """
+    current_shard.set(shard_alias(landlord) if landlord is not None else None)
+
+
+@contextmanager
+def landlord_shard(landlord):
+    """Route landlord-scoped queries to `landlord`'s shard in the block"""
+    token = current_shard.set(shard_alias(landlord))
+    try:
+        yield
+    finally:
+        current_shard.reset(token)
+
+
+class LandlordShardRouter:
+    """Sends landlord-scoped models to the active shard and everything
+    else to 'default'
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in SHARDED_LABELS:
+            return DEFAULT_DB_ALIAS
+
+        # Related managers and descriptors pass the object they start from
+        instance = hints.get('instance')
+        if isinstance(instance, Landlord):
+            return shard_alias(instance)
+        if instance is not None and instance._meta.label_lower in SHARDED_LABELS and instance._state.db:
+            return instance._state.db
+        return current_shard.get()
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Shard rows may point at the global rows that are mirrored
+        if (obj1._meta.label_lower not in SHARDED_LABELS or
+                obj2._meta.label_lower not in SHARDED_LABELS):
+            return True
+        return None
+
+
+def choose_shard():
+    """The shard a new landlord is placed in: the one with the fewest
+    landlords, or 'default' when no shards are configured
+    """
+    shards = list(getattr(settings, 'LANDLORD_SHARDS', []))
+    if not shards:
+        return DEFAULT_DB_ALIAS
+
+    counts = dict(Landlord.objects.filter(shard__in=shards).values_list(
+        'shard').annotate(Count('id')).order_by())
+    return min(shards, key=lambda shard: (counts.get(shard, 0), shards.index(shard)))
+
+
+def id_offset(alias):
+    """The first primary key of rows created in `alias`"""
+    return landlord_databases().index(alias) * SHARD_ID_SPAN
+
+
+def prepare_shard(alias):
+    """Start the shard's primary keys at its own offset"""
+    offset = id_offset(alias)
+    if not offset or connections[alias].vendor != 'sqlite':
+        return
+
+    with connections[alias].cursor() as cursor:
+        for model in SHARDED_MODELS:
+            if model is ArchivedPayment:
+                # Archived payments keep the ids of their payments
+                continue
+            table = model._meta.db_table
+            cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [table])
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, offset])
+            elif row[0] < offset:
+                cursor.execute('UPDATE sqlite_sequence SET seq = %s WHERE name = %s', [offset, table])
+
+
+def mirror_landlord(landlord, alias):
+    """Copy the landlord and its user, without credentials, into `alias`"""
+    # A save with the primary key set updates the copy or inserts it
+    User(pk=landlord.user_id, username=landlord.user.username,
+         password=make_password(None)).save(using=alias)
+    Landlord(pk=landlord.pk, user_id=landlord.user_id, shard=landlord.shard).save(using=alias)
+
+
+def mirror_payment_types(alias):
+    """Copy every payment type into `alias`"""
+    for payment_type in PaymentType.objects.using(DEFAULT_DB_ALIAS):
+        payment_type.save(using=alias)
+
+
+# The landlord-scoped rows each sharded model refers to
+REFERENCES = {
+    Payment: ['tenant', 'rented_property'],
+    ArchivedPayment: ['tenant', 'rented_property'],
+    MonthlyIncome: ['tenant', 'rented_property'],
+    TenantPropertyRel: ['rented_property'],
+    PropertySearchToken: ['rented_property'],
+}
+
+
+def owner_field(model):
+    return 'tenant__landlord_id' if model is TenantPropertyRel else 'landlord_id'
+
+
+def landlord_rows(model, landlord, alias):
+    return model.objects.using(alias).filter(**{owner_field(model): landlord.pk})
+
+
+def crossing_models(landlord, alias):
+    """The models with rows that tie `landlord` to another landlord,
+    such as a payment on another landlord's tenant. Those rows cannot
+    be split between databases.
+    """
+    crossing = []
+    for model, fields in REFERENCES.items():
+        for field in fields:
+            others = {field + '__landlord_id': landlord.pk}
+            if (landlord_rows(model, landlord, alias).filter(**{field + '__isnull': False})
+                    .exclude(**others).exists() or
+                    model.objects.using(alias).filter(**others)
+                    .exclude(**{owner_field(model): landlord.pk}).exists()):
+                crossing.append(model.__name__)
+                break
+    return crossing
+
+
+def copy_rows(model, rows, alias):
+    """Insert `rows` into `alias` unchanged. bulk_create would reset
+    auto_now fields such as updated_at.
+    """
+    fields = model._meta.concrete_fields
+    size = connections[alias].ops.bulk_batch_size(fields, rows) or len(rows)
+    for start in range(0, len(rows), size):
+        # The raw insert that loaddata uses
+        model._base_manager.using(alias)._insert(
+            rows[start:start + size], fields=fields, using=alias, raw=True)
+
+
+def move_landlord(landlord, target, batch_size=2000):
+    """Move every row of `landlord` into the `target` database
+
+    Rows are copied and committed first, then the landlord is switched
+    to `target`, then the old rows are deleted. The landlord's requests
+    must be paused meanwhile, as writes to the old shard would be lost.
+
+    Returns:
+        int -- the number of rows moved
+
+    Raises:
+        ValueError -- when the landlord has ids above the target's range
+        or rows tied to other landlords
+    """
+    source = shard_alias(landlord)
+    if source == target:
+        return 0
+
+    crossing = crossing_models(landlord, source)
+    if crossing:
+        raise ValueError('Landlord {} shares {} rows with other landlords'.format(
+            landlord.pk, ', '.join(crossing)))
+
+    limit = id_offset(target) + SHARD_ID_SPAN
+    for model in SHARDED_MODELS:
+        if landlord_rows(model, landlord, source).filter(pk__gte=limit).exists():
+            raise ValueError('Landlord {} has {} rows created after {}, which would take '
+                             'ids from the next database'.format(landlord.pk, model.__name__, target))
+
+    prepare_shard(target)
+    mirror_payment_types(target)
+    moved = 0
+    with transaction.atomic(using=target):
+        # The mirror is saved with the target shard, as the landlord
+        # will be by the time the copy is visible
+        landlord.shard = target
+        mirror_landlord(landlord, target)
+        landlord.shard = source
+
+        for model in SHARDED_MODELS:
+            batch = []
+            for row in landlord_rows(model, landlord, source).order_by('pk').iterator(chunk_size=batch_size):
+                batch.append(row)
+                if len(batch) == batch_size:
+                    copy_rows(model, batch, target)
+                    moved += len(batch)
+                    batch = []
+            copy_rows(model, batch, target)
+            moved += len(batch)
+
+    landlord.shard = target
+    landlord.save(update_fields=['shard'])
+
+    # Raw deletes, since the copies are already counted in the target's
+    # monthly income and the cascade would fetch every row
+    with transaction.atomic(using=source), connections[source].cursor() as cursor:
+        for model in reversed(SHARDED_MODELS):
+            if model is TenantPropertyRel:
+                cursor.execute(
+                    'DELETE FROM {} WHERE tenant_id IN (SELECT id FROM {} WHERE landlord_id = %s)'.format(
+                        model._meta.db_table, Tenant._meta.db_table), [landlord.pk])
+            else:
+                cursor.execute('DELETE FROM {} WHERE landlord_id = %s'.format(
+                    model._meta.db_table), [landlord.pk])
+
+    if source != DEFAULT_DB_ALIAS:
+        User.objects.using(source).filter(pk=landlord.user_id).delete()
+
+    return moved
@@ -0,0 +1,243 @@
+"""Signal handlers that keep derived data in sync with the models
+and configure new database connections
+"""
+from contextvars import ContextVar
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import (post_delete, post_migrate, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from crosscheckapi.authentication import credential_cache
+from crosscheckapi.cache import bump_version, invalidate_responses
+from crosscheckapi.models import (ArchivedPayment, Landlord, MonthlyIncome, Payment, PaymentType,
+                                  Property, PropertySearchToken, Tenant, TenantPropertyRel, Tombstone)
+from crosscheckapi.reports import apply_delta, summary_key
+from crosscheckapi.shards import current_shard, mirror_landlord, mirror_payment_types, prepare_shard
+from crosscheckapi.views.paymenttype import invalidate_payment_types
+
+# The landlords whose deletion is cascading in this context
+deleting_landlords = ContextVar('deleting_landlords', default=frozenset())
+
+
+def invalidate(func, *args):
+    """Drop a cached value now and again once the transaction commits,
+    so a concurrent request cannot re-cache the uncommitted old value
+    """
+    func(*args)
+    transaction.on_commit(lambda: func(*args))
+
+
+@receiver(connection_created)
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """Apply settings.SQLITE_PRAGMAS to every new SQLite connection"""
+    if connection.vendor != 'sqlite':
+        return
+    for name, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+        connection.connection.execute('PRAGMA {} = {}'.format(name, value))
+
+
+@receiver(request_started)
+@receiver(request_finished)
+def reset_shard(sender, **kwargs):
+    """Forget a request's shard, as server threads are reused"""
+    current_shard.set(None)
+
+
+@receiver(post_migrate)
+def prepare_landlord_shard(sender, using, **kwargs):
+    """Offset a migrated shard's ids and copy the payment types into it"""
+    if using in getattr(settings, 'LANDLORD_SHARDS', []):
+        prepare_shard(using)
+        mirror_payment_types(using)
+
+
+@receiver(post_save, sender=Landlord)
+def mirror_sharded_landlord(sender, instance, created, using, **kwargs):
+    """Copy a new landlord into its shard, so the shard's rows can refer
+    to it. move_landlord copies the landlords it moves.
+    """
+    if created and using == DEFAULT_DB_ALIAS and instance.shard != DEFAULT_DB_ALIAS:
+        mirror_landlord(instance, instance.shard)
+
+
+@receiver(post_delete, sender=Landlord)
+def delete_sharded_landlord(sender, instance, using, **kwargs):
+    """Delete a landlord's mirror, and with it all its rows, from its shard"""
+    if using == DEFAULT_DB_ALIAS and instance.shard != DEFAULT_DB_ALIAS:
+        User.objects.using(instance.shard).filter(pk=instance.user_id).delete()
+
+
+@receiver(post_save, sender=PaymentType)
+def mirror_saved_payment_type(sender, instance, using, **kwargs):
+    """Keep the copies of the payment types in the shards current"""
+    if using == DEFAULT_DB_ALIAS:
+        for shard in getattr(settings, 'LANDLORD_SHARDS', []):
+            PaymentType(pk=instance.pk, label=instance.label).save(using=shard)
+
+
+@receiver(post_delete, sender=PaymentType)
+def delete_mirrored_payment_type(sender, instance, using, **kwargs):
+    if using == DEFAULT_DB_ALIAS:
+        for shard in getattr(settings, 'LANDLORD_SHARDS', []):
+            PaymentType.objects.using(shard).filter(pk=instance.pk).delete()
+
+
+@receiver(post_save, sender=Property)
+def index_property_address(sender, instance, using, **kwargs):
+    """Rebuild the address search tokens of a saved property"""
+    PropertySearchToken.objects.using(using).filter(rented_property=instance).delete()
+    PropertySearchToken.objects.using(using).bulk_create([
+        PropertySearchToken(token=token, rented_property=instance, landlord_id=instance.landlord_id)
+        for token in instance.address_tokens
+    ])
+
+
+@receiver(pre_delete, sender=Property)
+def unassign_property_payments(sender, instance, using, **kwargs):
+    """Keep a deleted property's payments, archived ones included, and
+    their monthly income, without a property
+    """
+    # Unassigned here rather than by SET_NULL so /sync resends them
+    Payment.objects.using(using).filter(rented_property=instance).update(
+        rented_property=None, updated_at=timezone.now())
+    ArchivedPayment.objects.using(using).filter(rented_property=instance).update(rented_property=None)
+
+    rows = MonthlyIncome.objects.using(using).filter(rented_property=instance)
+    for row in rows:
+        apply_delta((row.landlord_id, None, row.tenant_id, row.month, row.payment_type_id),
+                    row.total, row.payment_count, using)
+    rows.delete()
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_token_credentials(sender, instance, **kwargs):
+    """Forget cached credentials for a rotated or deleted token"""
+    invalidate(credential_cache.invalidate, instance.key)
+    invalidate(credential_cache.invalidate_user, instance.user_id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_credentials(sender, instance, **kwargs):
+    """Forget cached credentials when a user changes or is deleted"""
+    invalidate(credential_cache.invalidate_user, instance.id)
+
+
+@receiver(post_save, sender=Landlord)
+@receiver(post_delete, sender=Landlord)
+def invalidate_landlord_credentials(sender, instance, **kwargs):
+    """Forget cached credentials when a landlord changes or is deleted"""
+    invalidate(credential_cache.invalidate_user, instance.user_id)
+
+
+@receiver(post_save, sender=PaymentType)
+@receiver(post_delete, sender=PaymentType)
+def rebuild_payment_types(sender, instance, **kwargs):
+    """Drop the cached payment types response"""
+    invalidate(invalidate_payment_types)
+
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_delete, sender=Tenant)
+def bump_tenant_version(sender, instance, **kwargs):
+    """Invalidate the landlord's cached tenant table"""
+    invalidate(bump_version, 'tenants', instance.landlord_id)
+
+
+@receiver(post_save, sender=Tenant)
+@receiver(post_delete, sender=Tenant)
+@receiver(post_save, sender=Property)
+@receiver(post_delete, sender=Property)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def invalidate_landlord_responses(sender, instance, using, **kwargs):
+    """Drop the landlord's cached list responses"""
+    invalidate_responses(instance.landlord_id, using)
+
+
+def lease_landlord_id(lease, using):
+    """The landlord of `lease`'s tenant, looked up once per lease"""
+    if not hasattr(lease, '_landlord_id'):
+        if TenantPropertyRel.tenant.is_cached(lease):
+            lease._landlord_id = lease.tenant.landlord_id
+        else:
+            lease._landlord_id = Tenant.objects.using(using).filter(
+                pk=lease.tenant_id).values_list('landlord_id', flat=True).first()
+    return lease._landlord_id
+
+
+@receiver(post_save, sender=TenantPropertyRel)
+@receiver(post_delete, sender=TenantPropertyRel)
+def invalidate_lease_responses(sender, instance, using, **kwargs):
+    """Drop the cached list responses of the lease's landlord"""
+    invalidate_responses(lease_landlord_id(instance, using), using)
+
+
+@receiver(post_save, sender=PaymentType)
+@receiver(post_delete, sender=PaymentType)
+def invalidate_payment_type_responses(sender, instance, **kwargs):
+    """Drop every landlord's cached list responses, as payments
+    include their payment type
+    """
+    invalidate_responses(None)
+
+
+@receiver(pre_save, sender=Payment)
+def remember_payment_summary(sender, instance, using, **kwargs):
+    """Note which summary row an updated payment was counted in"""
+    instance._summary_before = None
+    if instance.pk is not None:
+        before = Payment.objects.using(using).filter(pk=instance.pk).first()
+        if before is not None:
+            instance._summary_before = (summary_key(before), before.amount)
+
+
+@receiver(post_save, sender=Payment)
+def count_saved_payment(sender, instance, using, **kwargs):
+    """Move a saved payment's amount into its monthly income row"""
+    before = getattr(instance, '_summary_before', None)
+    if before is not None:
+        apply_delta(before[0], -before[1], -1, using)
+    apply_delta(summary_key(instance), instance.amount, 1, using)
+
+
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=ArchivedPayment)
+def uncount_deleted_payment(sender, instance, using, **kwargs):
+    """Remove a deleted payment's amount from its monthly income row"""
+    apply_delta(summary_key(instance), -instance.amount, -1, using)
+
+
+@receiver(pre_delete, sender=Landlord)
+def start_landlord_delete(sender, instance, **kwargs):
+    """Skip the tombstones of a deleted landlord's rows, since nobody
+    will sync them again
+    """
+    deleting_landlords.set(deleting_landlords.get() | {instance.pk})
+
+
+@receiver(post_delete, sender=Landlord)
+def finish_landlord_delete(sender, instance, **kwargs):
+    deleting_landlords.set(deleting_landlords.get() - {instance.pk})
+
+
+@receiver(post_delete, sender=Tenant)
+@receiver(post_delete, sender=Property)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=TenantPropertyRel)
+def record_tombstone(sender, instance, using, **kwargs):
+    """Log a deleted row for /sync"""
+    if sender is TenantPropertyRel:
+        landlord_id = lease_landlord_id(instance, using)
+    else:
+        landlord_id = instance.landlord_id
+    if landlord_id is None or landlord_id in deleting_landlords.get():
+        return
+    Tombstone.objects.using(using).create(
+        model=sender._meta.model_name, object_id=instance.pk, landlord_id=landlord_id)
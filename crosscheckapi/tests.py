@@ -1,3 +1,1438 @@
-from django.test import TestCase
+import json
+import re
+from io import StringIO
+from datetime import date, timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from crosscheckapi.authentication import credential_cache
+from crosscheckapi.benchmark import ENDPOINTS, generate_portfolio, measure_endpoint, portfolio_fixtures
+from crosscheckapi.cache import bump_version, response_stats
+from crosscheckapi.middleware import fingerprint
+from crosscheckapi.models import (ArchivedPayment, Landlord, MonthlyIncome, Payment, PaymentType,
+                                  Property, Tenant, TenantPropertyRel, Tombstone)
+from crosscheckapi.reconciliation import load_leases, load_payments, match_leases
+from crosscheckapi.reports import apply_delta, rebuild_monthly_income
+from crosscheckapi.shards import landlord_shard, move_landlord
+from crosscheckapi.views.paymenttype import invalidate_payment_types
 
-# Create your tests here.
+
+UNCACHED = dict(settings.RESPONSE_CACHE, ENABLED=False)
+
+
+class CrossCheckMixin:
+    """An authenticated landlord and helpers for test cases"""
+
+    # Payment types are mirrored into the shards
+    databases = '__all__'
+
+    def setUp(self):
+        # Cached responses do not survive the rollback between tests
+        invalidate_payment_types()
+        for backend in caches.all():
+            backend.clear()
+        user = User.objects.create_user(username='landlord@example.com', password='password')
+        self.landlord = Landlord.objects.create(user=user)
+        self.token = Token.objects.create(user=user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+
+    def create_tenants(self, count):
+        """Create `count` tenants, each leasing their own property"""
+        today = date.today()
+        for i in range(count):
+            tenant = Tenant.objects.create(
+                full_name='Tenant {}'.format(i), landlord=self.landlord)
+            rental = Property.objects.create(
+                street='{} Main St'.format(i), city='Nashville', state='TN',
+                postal_code='37203', landlord=self.landlord)
+            TenantPropertyRel.objects.create(
+                tenant=tenant, rented_property=rental, rent=1000,
+                lease_start=today - timedelta(days=30),
+                lease_end=today + timedelta(days=335))
+
+    def count_queries(self, url):
+        """Request `url` and return the number of SQL queries it ran
+        once the landlord's credentials are cached, but not the response
+        """
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries, override_settings(RESPONSE_CACHE=UNCACHED):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assert_fast_output_matches(self, url, params=None):
+        """The `?fast` rendering of `url` must be byte-identical to the
+        DRF serializer rendering
+        """
+        params = dict(params or {})
+        expected = self.client.get(url, params)
+        params['fast'] = 'true'
+        fast = self.client.get(url, params)
+        self.assertEqual(fast.status_code, expected.status_code)
+        self.assertEqual(fast['Content-Type'], expected['Content-Type'])
+        # Page links keep the opt-in so the client stays on the fast path
+        self.assertEqual(fast.content.replace(b'fast=true&', b''), expected.content)
+
+
+class CrossCheckTestCase(CrossCheckMixin, TestCase):
+    """Base test case with an authenticated landlord"""
+
+class AuthenticationTests(CrossCheckTestCase):
+    """Tests for LandlordTokenAuthentication"""
+
+    def test_cached_credentials_skip_the_database(self):
+        # Only the property query itself runs
+        self.assertEqual(self.count_queries('/properties'), 1)
+
+    def test_first_request_resolves_credentials_in_one_query(self):
+        credential_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/properties')
+        self.assertEqual(len(queries), 2)
+
+    def test_deleted_token_is_rejected(self):
+        self.count_queries('/properties')
+        self.token.delete()
+        self.assertEqual(self.client.get('/properties').status_code, 401)
+
+    def test_deactivated_user_is_rejected(self):
+        self.count_queries('/properties')
+        self.landlord.user.is_active = False
+        self.landlord.user.save()
+        self.assertEqual(self.client.get('/properties').status_code, 401)
+
+
+class TenantTests(CrossCheckTestCase):
+    """Tests for the tenants resource"""
+
+    def test_list_query_count_is_constant(self):
+        self.create_tenants(2)
+        small = self.count_queries('/tenants')
+        self.create_tenants(20)
+        self.assertEqual(self.count_queries('/tenants'), small)
+
+    def test_list_includes_active_leases(self):
+        self.create_tenants(1)
+        Tenant.objects.create(full_name='No Lease', landlord=self.landlord)
+
+        response = self.client.get('/tenants')
+
+        leased, unleased = response.data
+        self.assertTrue(leased['rented_property'][0]['active'])
+        self.assertEqual(leased['rented_property'][0]['rented_property']['postal_code'], '37203')
+        self.assertIsNone(unleased['rented_property'])
+
+    def test_list_cursor_pagination(self):
+        self.create_tenants(5)
+
+        response = self.client.get('/tenants', {'page_size': 2})
+        ids = [t['id'] for t in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            ids += [t['id'] for t in response.data['results']]
+
+        self.assertEqual(ids, list(Tenant.objects.order_by('id').values_list('id', flat=True)))
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_fast_list_matches_serializer(self):
+        self.create_tenants(3)
+        Tenant.objects.create(full_name='Zo\u00eb \u2028 "Q"', landlord=self.landlord)
+
+        self.assert_fast_output_matches('/tenants')
+        self.assert_fast_output_matches('/tenants', {'search': 'Tenant'})
+        self.assert_fast_output_matches('/tenants', {'page_size': 2})
+
+    def test_table_maps_ids_to_names(self):
+        self.create_tenants(2)
+        response = self.client.get('/tenants', {'table': 'true'})
+
+        expected = {str(t.id): t.full_name for t in Tenant.objects.all()}
+        self.assertEqual(json.loads(response.json()), expected)
+
+    def test_table_is_cached_per_landlord(self):
+        self.create_tenants(2)
+        self.assertEqual(self.count_queries('/tenants?table=true'), 0)
+
+    def test_table_supports_conditional_get(self):
+        self.create_tenants(2)
+        etag = self.client.get('/tenants', {'table': 'true'})['ETag']
+
+        response = self.client.get('/tenants', {'table': 'true'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        tenant = Tenant.objects.first()
+        tenant.full_name = 'Renamed'
+        tenant.save()
+        response = self.client.get('/tenants', {'table': 'true'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Renamed', json.loads(response.json()).values())
+
+        etag = response['ETag']
+        tenant.delete()
+        response = self.client.get('/tenants', {'table': 'true'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(json.loads(response.json())), 1)
+
+    def test_retrieve_query_count_is_constant(self):
+        self.create_tenants(1)
+        tenant = Tenant.objects.get()
+        single = self.count_queries('/tenants/{}'.format(tenant.id))
+
+        rental = Property.objects.get()
+        for _ in range(10):
+            TenantPropertyRel.objects.create(
+                tenant=tenant, rented_property=rental, rent=900,
+                lease_start=date(2019, 1, 1), lease_end=date(2019, 12, 31))
+
+        self.assertEqual(self.count_queries('/tenants/{}'.format(tenant.id)), single)
+
+
+class PaymentTests(CrossCheckTestCase):
+    """Tests for the payments resource"""
+
+    def setUp(self):
+        super().setUp()
+        self.payment_type = PaymentType.objects.create(label='Check')
+        self.tenant = Tenant.objects.create(full_name='Jane Doe', landlord=self.landlord)
+
+    def create_payment(self, payment_date, ref_num='P100', tenant=None):
+        return Payment.objects.create(
+            date=payment_date, amount=1000, ref_num=ref_num,
+            tenant=tenant or self.tenant, payment_type=self.payment_type,
+            landlord=self.landlord)
+
+    def test_list_is_sorted_newest_first(self):
+        older = self.create_payment(date(2021, 1, 1))
+        newest = self.create_payment(date(2021, 3, 1))
+        middle = self.create_payment(date(2021, 2, 1))
+
+        response = self.client.get('/payments')
+
+        self.assertEqual([p['id'] for p in response.data], [newest.id, middle.id, older.id])
+
+    def test_list_filters_in_sql(self):
+        other = Tenant.objects.create(full_name='John Smith', landlord=self.landlord)
+        match = self.create_payment(date(2021, 2, 1), ref_num='ABC123')
+        self.create_payment(date(2021, 2, 2), ref_num='XYZ', tenant=other)
+        self.create_payment(date(2020, 2, 1), ref_num='ABC999')
+
+        response = self.client.get('/payments', {'keyword': 'abc', 'date': '2021-01-01/2021-12-31'})
+        self.assertEqual([p['id'] for p in response.data], [match.id])
+
+        response = self.client.get('/payments', {'keyword': 'smith'})
+        self.assertEqual([p['tenant']['full_name'] for p in response.data], ['John Smith'])
+
+        response = self.client.get('/payments', {'tenant': other.id})
+        self.assertEqual(len(response.data), 1)
+
+    def test_list_cursor_pagination(self):
+        for day in range(1, 8):
+            self.create_payment(date(2021, 1, day))
+            self.create_payment(date(2021, 1, day))
+
+        response = self.client.get('/payments', {'page_size': 3})
+        pages = [response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            pages.append(response.data['results'])
+
+        ids = [p['id'] for page in pages for p in page]
+        expected = Payment.objects.order_by('-date', '-id').values_list('id', flat=True)
+        self.assertEqual(ids, list(expected))
+        self.assertEqual(len(pages), 5)
+
+    def test_deleting_a_property_keeps_its_payments(self):
+        rental = Property.objects.create(street='1 Main St', city='Nashville', state='TN',
+                                         postal_code='37203', landlord=self.landlord)
+        TenantPropertyRel.objects.create(tenant=self.tenant, rented_property=rental, rent=1000,
+                                         lease_start=date(2021, 1, 1), lease_end=date(2021, 12, 31))
+        # Created through the API, which attaches the lease's property
+        payment_id = self.client.post('/payments', {
+            'full_name': self.tenant.id, 'date': '2021-02-01', 'amount': 1000, 'ref_num': 'P1',
+            'type': self.payment_type.id}, format='json').json()['id']
+        self.create_payment(date(2020, 2, 1))
+        self.assertEqual(Payment.objects.get(pk=payment_id).rented_property, rental)
+        report = self.client.get('/reports/monthly', {'by': 'tenant'}).json()
+
+        response = self.client.delete('/properties/{}'.format(rental.id))
+        self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(Payment.objects.count(), 2)
+        self.assertIsNone(Payment.objects.get(pk=payment_id).rented_property)
+        self.assertEqual(self.client.get('/reports/monthly', {'by': 'tenant'}).json(), report)
+        self.assertEqual(MonthlyIncome.objects.get(month=date(2021, 2, 1)).rented_property, None)
+
+    def test_pagination_walks_past_many_payments_on_one_date(self):
+        # More payments share the date than DRF's offset_cutoff of 1000
+        Payment.objects.bulk_create([
+            Payment(date=date(2021, 1, 1), amount=1000, ref_num='P{}'.format(i), tenant=self.tenant,
+                    payment_type=self.payment_type, landlord=self.landlord)
+            for i in range(1250)])
+        expected = list(Payment.objects.order_by('-date', '-id').values_list('id', flat=True))
+
+        response = self.client.get('/payments', {'page_size': 100, 'fast': 'true'})
+        pages = [response.json()['results']]
+        # Bounded, since a cursor that repeats pages never ends
+        while response.json()['next'] and len(pages) < 20:
+            response = self.client.get(response.json()['next'])
+            pages.append(response.json()['results'])
+        self.assertEqual([p['id'] for page in pages for p in page], expected)
+        self.assertEqual(len(pages), 13)
+
+        # And back again from the last page
+        backwards = []
+        while response.json()['previous'] and len(backwards) < 2000:
+            response = self.client.get(response.json()['previous'])
+            backwards = response.json()['results'] + backwards
+        self.assertEqual([p['id'] for p in backwards], expected[:1200])
+
+    def test_malformed_cursors_are_not_found(self):
+        response = self.client.get('/payments', {'cursor': 'cD0yMDIxLTEzLTAxXzU='})
+        self.assertEqual(response.status_code, 404)
+
+    def test_fast_list_matches_serializer(self):
+        for day in range(1, 6):
+            self.create_payment(date(2021, 1, day), ref_num='P{}'.format(day))
+        self.tenant.email = 'jane\u00e9@example.com'
+        self.tenant.save()
+
+        self.assert_fast_output_matches('/payments')
+        self.assert_fast_output_matches('/payments', {'keyword': 'P3', 'sort': 'relevance'})
+        self.assert_fast_output_matches('/payments', {'date': '2021-01-02/2021-01-04'})
+        self.assert_fast_output_matches('/payments', {'page_size': 2})
+
+    def test_keyword_search_matches_word_prefixes(self):
+        match = self.create_payment(date(2021, 1, 1), ref_num='CHK-4471')
+        self.create_payment(date(2021, 1, 2), ref_num='WIRE-8812')
+
+        response = self.client.get('/payments', {'keyword': 'jane chk-44'})
+        self.assertEqual([p['id'] for p in response.data], [match.id])
+
+        response = self.client.get('/payments', {'keyword': 'do'})
+        self.assertEqual(len(response.data), 2)
+
+    def test_keyword_search_follows_tenant_renames(self):
+        payment = self.create_payment(date(2021, 1, 1))
+        self.tenant.full_name = 'Janet Roe'
+        self.tenant.save()
+
+        self.assertFalse(Payment.objects.search('doe').exists())
+        self.assertEqual(list(Payment.objects.search('roe')), [payment])
+
+        payment.delete()
+        self.assertFalse(Payment.objects.search('roe').exists())
+
+    def test_keyword_search_ranked_by_relevance(self):
+        partial = self.create_payment(date(2021, 3, 1), ref_num='jane')
+        exact = self.create_payment(date(2021, 1, 1), ref_num='jane doe jane')
+
+        response = self.client.get('/payments', {'keyword': 'jane', 'sort': 'relevance'})
+        self.assertEqual([p['id'] for p in response.data], [exact.id, partial.id])
+
+    def test_create_parses_dollar_amounts(self):
+        response = self.client.post('/payments', {
+            'date': '2021-03-01T05:00:00.000Z', 'amount': '$1,200.99', 'ref_num': 'C1',
+            'full_name': self.tenant.id, 'type': self.payment_type.id}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['date'], '2021-03-01')
+        self.assertEqual(response.data['amount'], 1200)
+
+    def test_import_csv_in_batches(self):
+        other = Tenant.objects.create(full_name='John Smith', landlord=self.landlord)
+        body = (
+            'date,amount,ref_num,tenant,type\n'
+            '2021-01-01,1000,A1,Jane Doe,Check\n'
+            '2021-01-02T00:00:00Z,"$1,250.50",A2,{},{}\n'
+            '2021-01-03,900,A3,john smith,check\n'
+            'not a date,900,A4,Jane Doe,Check\n'
+            '2021-01-05,900,A5,Nobody,Check\n'
+            '2021-01-06,900,,Jane Doe,Check\n'
+        ).format(other.id, self.payment_type.id)
+
+        response = self.client.post(
+            '/payments/import?batch_size=2', body, content_type='text/csv')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 3)
+        self.assertEqual([e['row'] for e in response.data['errors']], [4, 5, 6])
+        self.assertEqual(Payment.objects.get(ref_num='A2').amount, 1250)
+        self.assertEqual(Payment.objects.filter(tenant=other).count(), 2)
+
+    def test_import_ndjson(self):
+        body = '\n'.join([
+            json.dumps({'date': '2021-01-01', 'amount': 1000, 'ref_num': 'N1',
+                        'tenant': self.tenant.id, 'type': 'Check'}),
+            '{broken',
+            '',
+        ])
+
+        response = self.client.post(
+            '/payments/import', body, content_type='application/x-ndjson')
+
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.assertTrue(Payment.objects.search('N1').exists())
+
+    def test_import_rejects_other_content_types(self):
+        response = self.client.post('/payments/import', {}, format='json')
+        self.assertEqual(response.status_code, 415)
+
+    def test_export_csv_honors_filters(self):
+        self.create_payment(date(2021, 1, 1), ref_num='OLD')
+        self.create_payment(date(2021, 6, 1), ref_num='NEW1')
+        self.create_payment(date(2021, 7, 1), ref_num='NEW2')
+
+        response = self.client.get('/payments/export', {'date': '2021-02-01/2021-12-31'})
+
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,date,amount,ref_num,tenant_id,tenant,type')
+        self.assertEqual([line.split(',')[3] for line in lines[1:]], ['NEW2', 'NEW1'])
+        self.assertTrue(lines[1].endswith(',Jane Doe,Check'))
+
+    def test_export_ndjson(self):
+        payment = self.create_payment(date(2021, 1, 1), ref_num='R1')
+
+        response = self.client.get('/payments/export', {'output': 'ndjson', 'keyword': 'r1'})
+
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(rows, [{
+            'id': payment.id, 'date': '2021-01-01', 'amount': 1000, 'ref_num': 'R1',
+            'tenant_id': self.tenant.id, 'tenant': 'Jane Doe', 'type': 'Check'}])
+
+    def test_list_rejects_malformed_date_range(self):
+        response = self.client.get('/payments', {'date': '2021-01-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_query_count_is_constant(self):
+        self.create_payment(date(2021, 1, 1))
+        single = self.count_queries('/payments')
+        for day in range(1, 20):
+            self.create_payment(date(2021, 2, day))
+        self.assertEqual(self.count_queries('/payments'), single)
+
+
+class PropertyTests(CrossCheckTestCase):
+    """Tests for the properties resource"""
+
+    def test_list_cursor_pagination(self):
+        self.create_tenants(3)
+
+        first = self.client.get('/properties', {'page_size': 2})
+        second = self.client.get(first.data['next'])
+
+        ids = [p['id'] for p in first.data['results'] + second.data['results']]
+        self.assertEqual(ids, list(Property.objects.order_by('id').values_list('id', flat=True)))
+        self.assertIsNone(second.data['next'])
+
+    def test_search_matches_every_word_prefix(self):
+        main = Property.objects.create(
+            street='100 Main Street', city='Nashville', state='TN',
+            postal_code='37203', landlord=self.landlord)
+        Property.objects.create(
+            street='100 Main St', city='Franklin', state='TN',
+            postal_code='37064', landlord=self.landlord)
+
+        def search(text):
+            response = self.client.get('/properties', {'search': text})
+            return sorted(p['id'] for p in response.data)
+
+        self.assertEqual(len(search('main')), 2)
+        self.assertEqual(search('main 37203'), [main.id])
+        self.assertEqual(search('MAIN st nash'), [main.id])
+        self.assertEqual(search('main 372'), [main.id])
+        self.assertEqual(search('elm'), [])
+
+    def test_search_index_follows_updates(self):
+        rental = Property.objects.create(
+            street='1 Elm Ave', city='Memphis', state='TN',
+            postal_code='38103', landlord=self.landlord)
+        rental.street = '9 Oak Ave'
+        rental.save()
+
+        self.assertFalse(Property.objects.search('elm', self.landlord).exists())
+        self.assertEqual(list(Property.objects.search('oak avenue', self.landlord)), [rental])
+
+    def test_fast_list_matches_serializer(self):
+        self.create_tenants(3)
+        self.assert_fast_output_matches('/properties')
+        self.assert_fast_output_matches('/properties', {'search': 'main'})
+        self.assert_fast_output_matches('/properties', {'page_size': 2})
+
+    def test_retrieve_query_count_is_constant(self):
+        self.create_tenants(1)
+        rental = Property.objects.get()
+        url = '/properties/{}'.format(rental.id)
+        single = self.count_queries(url)
+
+        for i in range(5):
+            tenant = Tenant.objects.create(full_name='Past {}'.format(i), landlord=self.landlord)
+            TenantPropertyRel.objects.create(
+                tenant=tenant, rented_property=rental, rent=900,
+                lease_start=date(2019, 1, 1), lease_end=date(2019, 12, 31))
+        self.assertEqual(self.count_queries(url), single)
+
+        leases = self.client.get(url).data['lease']
+        self.assertEqual([lease['active'] for lease in leases], [True] + [False] * 5)
+        self.assertEqual(leases[0]['tenant']['landlord'], {'id': self.landlord.id, 'user': self.landlord.user_id})
+        self.assert_fast_output_matches(url)
+
+    def test_lease_is_active_on_its_first_and_last_day(self):
+        today = date.today()
+        rental = Property.objects.create(
+            street='1 Elm Ave', city='Memphis', state='TN',
+            postal_code='38103', landlord=self.landlord)
+        for start, end in ((today, today + timedelta(days=30)),
+                           (today - timedelta(days=30), today),
+                           (today + timedelta(days=1), today + timedelta(days=30))):
+            tenant = Tenant.objects.create(full_name='Tenant', landlord=self.landlord)
+            TenantPropertyRel.objects.create(
+                tenant=tenant, rented_property=rental, rent=900,
+                lease_start=start, lease_end=end)
+
+        by_property = self.client.get('/properties/{}'.format(rental.id)).data['lease']
+        by_tenant = [t['rented_property'][0] for t in self.client.get('/tenants').data]
+        for leases in (by_property, by_tenant):
+            self.assertEqual([lease['active'] for lease in leases], [True, True, False])
+
+    def test_list_is_unpaginated_by_default(self):
+        self.create_tenants(12)
+        self.assertEqual(len(self.client.get('/properties').data), 12)
+
+
+class QueryPlanTests(CrossCheckTestCase):
+    """EXPLAIN QUERY PLAN regression tests for the list and retrieve views
+
+    Every SELECT a view runs must be answered through an index. A plan
+    step of `SCAN <table>` without `USING ... INDEX` is a full table scan,
+    and `USE TEMP B-TREE FOR ... ORDER BY` sorts rows the index should
+    have returned in order.
+    """
+    # The payment types lookup table is read in full by design
+    FULL_READS = {'crosscheckapi_paymenttype'}
+    TABLE_SCAN = re.compile(r'^SCAN (TABLE )?(?P<table>\w+)$')
+    SORT = re.compile(r'^USE TEMP B-TREE FOR .*ORDER BY$')
+
+    def setUp(self):
+        super().setUp()
+        self.create_tenants(3)
+        tenant = Tenant.objects.first()
+        payment_type = PaymentType.objects.create(label='Check')
+        for day in range(1, 4):
+            Payment.objects.create(
+                date=date(2021, 1, day), amount=1000, ref_num='P{}'.format(day),
+                tenant=tenant, payment_type=payment_type, landlord=self.landlord)
+
+    def explain(self, url, params=None):
+        """Request `url` and return the query plan of each SELECT it ran"""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                if query['sql'].startswith('SELECT'):
+                    cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                    plans.append((query['sql'], [row[-1] for row in cursor.fetchall()]))
+        return plans
+
+    def assert_indexed(self, url, params=None):
+        for sql, plan in self.explain(url, params):
+            for step in plan:
+                scan = self.TABLE_SCAN.match(step)
+                if scan and scan.group('table') not in self.FULL_READS:
+                    self.fail('Table scan in {}\n{}\n{}'.format(url, sql, '\n'.join(plan)))
+                if self.SORT.match(step):
+                    self.fail('Sort in {}\n{}\n{}'.format(url, sql, '\n'.join(plan)))
+
+    def test_payment_queries_use_indexes(self):
+        payment = Payment.objects.first()
+        self.assert_indexed('/payments')
+        self.assert_indexed('/payments', {'page_size': 2})
+        self.assert_indexed('/payments', {'date': '2021-01-01/2021-01-02'})
+        self.assert_indexed('/payments', {'tenant': payment.tenant_id})
+        self.assert_indexed('/payments', {'keyword': 'P1'})
+        self.assert_indexed('/payments', {'fast': 'true'})
+        self.assert_indexed('/payments/{}'.format(payment.id))
+
+    @override_settings(RESPONSE_CACHE=UNCACHED)
+    def test_history_reads_only_the_archived_range(self):
+        # An archive range read is a search of the archive's date index,
+        # however many years the archive holds outside the range
+        call_command('archive_payments', before='2021-01-03', stdout=StringIO())
+        history = {'date': '2021-01-01/2021-01-02'}
+        self.assert_indexed('/payments', history)
+        self.assert_indexed('/payments', dict(history, page_size=1))
+
+        archive_steps = [step for sql, plan in self.explain('/payments', history)
+                         if 'crosscheckapi_payment_history' in sql for step in plan
+                         if 'archivedpayment' in step]
+        self.assertTrue(archive_steps)
+        for step in archive_steps:
+            self.assertIn('archived_landlord_date_idx (landlord_id=? AND date>? AND date<?)', step)
+
+    def test_tenant_queries_use_indexes(self):
+        self.assert_indexed('/tenants')
+        self.assert_indexed('/tenants', {'page_size': 2})
+        self.assert_indexed('/tenants', {'table': 'true'})
+        self.assert_indexed('/tenants', {'search': 'Tenant'})
+        self.assert_indexed('/tenants', {'fast': 'true'})
+        self.assert_indexed('/tenants', {'fast': 'true', 'page_size': 2})
+        self.assert_indexed('/tenants/{}'.format(Tenant.objects.first().id))
+
+    def test_property_queries_use_indexes(self):
+        self.assert_indexed('/properties')
+        self.assert_indexed('/properties', {'page_size': 2})
+        self.assert_indexed('/properties', {'search': 'Main'})
+        self.assert_indexed('/properties', {'fast': 'true'})
+        self.assert_indexed('/properties/{}'.format(Property.objects.first().id))
+
+    def test_report_queries_use_indexes(self):
+        self.assert_indexed('/reports/monthly')
+        self.assert_indexed('/reports/monthly', {'date': '2021-01-01/2021-06-30', 'by': 'tenant'})
+
+    def test_payment_type_queries_use_indexes(self):
+        self.assert_indexed('/paymenttypes')
+
+
+class ResponseCacheTests(CrossCheckTestCase):
+    """Tests for the cached list responses"""
+
+    def setUp(self):
+        super().setUp()
+        response_stats.clear()
+        self.create_tenants(2)
+        self.check = PaymentType.objects.create(label='Check')
+        self.tenant = Tenant.objects.first()
+
+    def test_repeated_lists_are_served_from_the_cache(self):
+        for url in ('/payments', '/tenants', '/properties?page_size=1&search=main'):
+            first = self.client.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                second = self.client.get(url)
+            self.assertEqual((first['X-Cache'], second['X-Cache']), ('MISS', 'HIT'))
+            self.assertEqual(second.content, first.content)
+            self.assertEqual(len(queries), 0)
+
+        # The order of the query parameters does not matter
+        self.assertEqual(self.client.get('/properties?search=main&page_size=1')['X-Cache'], 'HIT')
+        self.assertEqual(response_stats.snapshot()['properties'], {'hits': 2, 'misses': 1})
+
+    def test_writes_drop_the_landlords_responses(self):
+        self.client.get('/tenants')
+        self.client.get('/payments')
+        Payment.objects.create(date=date(2021, 1, 5), amount=1000, ref_num='R1', tenant=self.tenant,
+                               payment_type=self.check, landlord=self.landlord)
+
+        response = self.client.get('/payments')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()), 1)
+
+        TenantPropertyRel.objects.filter(tenant=self.tenant).get().delete()
+        response = self.client.get('/tenants')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIsNone(response.json()[0]['rented_property'])
+
+    def test_other_landlords_writes_keep_the_cache(self):
+        self.client.get('/tenants')
+        user = User.objects.create_user(username='other@example.com', password='password')
+        Tenant.objects.create(full_name='Other', landlord=Landlord.objects.create(user=user))
+
+        self.assertEqual(self.client.get('/tenants')['X-Cache'], 'HIT')
+
+    def test_imports_drop_the_landlords_responses(self):
+        self.client.get('/payments')
+        body = 'date,amount,ref_num,tenant,type\n2021-04-01,800,I1,{},Check\n'.format(
+            self.tenant.full_name)
+        self.client.post('/payments/import', body, content_type='text/csv')
+
+        response = self.client.get('/payments')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.json()), 1)
+
+
+class PaymentTypeTests(CrossCheckTestCase):
+    """Tests for the payment types resource"""
+
+    def setUp(self):
+        super().setUp()
+        self.check = PaymentType.objects.create(label='Check')
+
+    def test_list_returns_id_label_table(self):
+        response = self.client.get('/paymenttypes')
+        self.assertEqual(json.loads(response.json()), {str(self.check.id): 'Check'})
+
+    def test_list_is_served_from_memory(self):
+        self.client.get('/paymenttypes')
+        self.assertEqual(self.count_queries('/paymenttypes'), 0)
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get('/paymenttypes')['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/paymenttypes', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 0)
+
+    def test_saving_a_payment_type_changes_the_etag(self):
+        etag = self.client.get('/paymenttypes')['ETag']
+        PaymentType.objects.create(label='Cash')
+
+        response = self.client.get('/paymenttypes', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertIn('Cash', json.loads(response.json()).values())
+
+    def test_changes_from_other_processes_rebuild_the_list(self):
+        self.client.get('/paymenttypes')
+        # Another process renames the type: its signal only reaches the
+        # shared cache, not this process's copy of the response
+        PaymentType.objects.filter(pk=self.check.pk).update(label='Cheque')
+        bump_version('paymenttypes', 'all')
+
+        response = self.client.get('/paymenttypes')
+        self.assertEqual(json.loads(response.json()), {str(self.check.id): 'Cheque'})
+
+
+class MonthlyIncomeTests(CrossCheckTestCase):
+    """Tests for the monthly income summary and report"""
+
+    def setUp(self):
+        super().setUp()
+        self.check = PaymentType.objects.create(label='Check')
+        self.cash = PaymentType.objects.create(label='Cash')
+        self.tenant = Tenant.objects.create(full_name='Jane Doe', landlord=self.landlord)
+
+    def pay(self, payment_date, amount, payment_type=None):
+        return Payment.objects.create(
+            date=payment_date, amount=amount, ref_num='R', tenant=self.tenant,
+            payment_type=payment_type or self.check, landlord=self.landlord)
+
+    def summary(self):
+        return sorted(MonthlyIncome.objects.values_list(
+            'month', 'payment_type_id', 'total', 'payment_count'))
+
+    def test_summary_follows_inserts_updates_and_deletes(self):
+        first = self.pay(date(2021, 1, 5), 1000)
+        self.pay(date(2021, 1, 20), 500)
+        moved = self.pay(date(2021, 2, 1), 700)
+
+        moved.date = date(2021, 3, 1)
+        moved.payment_type = self.cash
+        moved.save()
+        first.amount = 1100
+        first.save()
+        Payment.objects.filter(amount=500).get().delete()
+
+        self.assertEqual(self.summary(), [
+            (date(2021, 1, 1), self.check.id, 1100, 1),
+            (date(2021, 3, 1), self.cash.id, 700, 1),
+        ])
+
+        expected = self.summary()
+        rebuild_monthly_income(self.landlord)
+        self.assertEqual(self.summary(), expected)
+
+    def test_a_summary_key_has_one_row(self):
+        rental = Property.objects.create(street='1 Main St', city='Nashville', state='TN',
+                                         postal_code='37203', landlord=self.landlord)
+        self.pay(date(2021, 1, 5), 1000)
+        key = (self.landlord.id, rental.id, self.tenant.id, date(2021, 1, 1), self.check.id)
+        apply_delta(key, 500, 1)
+        apply_delta(key, 300, 1)
+
+        # With and without a property, a second row for a key is refused
+        for row in MonthlyIncome.objects.all():
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                MonthlyIncome.objects.create(
+                    month=row.month, total=1, payment_count=1, landlord=self.landlord,
+                    rented_property=row.rented_property, tenant=self.tenant, payment_type=self.check)
+        self.assertEqual(sorted(MonthlyIncome.objects.values_list('total', 'payment_count')),
+                         [(800, 2), (1000, 1)])
+
+    def test_import_updates_summary(self):
+        body = 'date,amount,ref_num,tenant,type\n2021-04-01,800,I1,Jane Doe,Cash\n2021-04-02,200,I2,Jane Doe,Cash\n'
+        self.client.post('/payments/import', body, content_type='text/csv')
+        self.assertEqual(self.summary(), [(date(2021, 4, 1), self.cash.id, 1000, 2)])
+
+    def test_monthly_report_reads_only_the_summary(self):
+        self.pay(date(2021, 1, 5), 1000)
+        self.pay(date(2021, 1, 6), 300, self.cash)
+        self.pay(date(2021, 2, 5), 1000)
+        self.pay(date(2022, 1, 5), 1000)
+
+        self.client.get('/reports/monthly')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                '/reports/monthly', {'date': '2021-01-15/2021-12-31', 'by': 'tenant'})
+
+        self.assertFalse(any('"crosscheckapi_payment"' in q['sql'] for q in queries))
+        self.assertEqual(response.data, [
+            {'tenant': self.tenant.id, 'month': '2021-01', 'total': 1300, 'count': 2},
+            {'tenant': self.tenant.id, 'month': '2021-02', 'total': 1000, 'count': 1},
+        ])
+
+    def test_monthly_report_rejects_bad_filters(self):
+        self.pay(date(2021, 1, 5), 1000)
+        for params in ({'tenant': 'jane'}, {'property': '1.5'}, {'date': '2021-01'}):
+            response = self.client.get('/reports/monthly', params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('message', response.data)
+
+        response = self.client.get('/reports/monthly', {'tenant': self.tenant.id, 'by': 'tenant'})
+        self.assertEqual(response.data, [
+            {'tenant': self.tenant.id, 'month': '2021-01', 'total': 1000, 'count': 1}])
+
+
+class ReconciliationTests(CrossCheckTestCase):
+    """Tests for the rent reconciliation report"""
+
+    def setUp(self):
+        super().setUp()
+        self.check = PaymentType.objects.create(label='Check')
+        rental = Property.objects.create(
+            street='1 Main St', city='Nashville', state='TN', postal_code='37203',
+            landlord=self.landlord)
+        self.late = Tenant.objects.create(full_name='Late Payer', landlord=self.landlord)
+        self.early = Tenant.objects.create(full_name='Early Payer', landlord=self.landlord)
+        self.late_lease = TenantPropertyRel.objects.create(
+            tenant=self.late, rented_property=rental, rent=1000,
+            lease_start=date(2021, 1, 1), lease_end=date(2021, 12, 31))
+        self.early_lease = TenantPropertyRel.objects.create(
+            tenant=self.early, rented_property=rental, rent=500,
+            lease_start=date(2021, 3, 15), lease_end=date(2021, 12, 31))
+
+    def pay(self, tenant, payment_date, amount):
+        Payment.objects.create(
+            date=payment_date, amount=amount, ref_num='R', tenant=tenant,
+            payment_type=self.check, landlord=self.landlord)
+
+    def test_reconciliation(self):
+        self.pay(self.late, date(2021, 1, 3), 1000)
+        self.pay(self.late, date(2021, 2, 1), 600)
+        self.pay(self.late, date(2021, 2, 10), 400)
+        self.pay(self.late, date(2021, 3, 1), 1500)
+        self.pay(self.late, date(2020, 6, 1), 700)
+        self.pay(self.early, date(2021, 3, 15), 500)
+        self.pay(self.early, date(2021, 4, 1), 700)
+
+        response = self.client.get('/reports/reconciliation', {'as_of': '2021-04-10'})
+
+        leases = {row['lease']: row for row in response.data['leases']}
+        self.assertEqual(leases[self.late_lease.id], {
+            'lease': self.late_lease.id, 'tenant': self.late.id,
+            'property': self.late_lease.rented_property_id,
+            'expected': 4000, 'received': 3500, 'arrears': 500, 'overpayment': 0,
+            'late_months': 3, 'max_days_late': 9})
+        self.assertEqual(leases[self.early_lease.id]['expected'], 1000)
+        self.assertEqual(leases[self.early_lease.id]['overpayment'], 200)
+        self.assertEqual(leases[self.early_lease.id]['late_months'], 0)
+        self.assertEqual(response.data['unmatched'], {'count': 1, 'total': 700})
+
+        response = self.client.get(
+            '/reports/reconciliation', {'as_of': '2021-04-10', 'delinquent': 'true'})
+        self.assertEqual([row['lease'] for row in response.data['leases']], [self.late_lease.id])
+
+    def test_payments_match_a_long_lease_behind_a_shorter_one(self):
+        # A month long lease inside the late payer's year long one
+        rental = self.late_lease.rented_property
+        summer = TenantPropertyRel.objects.create(
+            tenant=self.late, rented_property=rental, rent=300,
+            lease_start=date(2021, 2, 1), lease_end=date(2021, 2, 28))
+        self.pay(self.late, date(2021, 2, 10), 300)
+        self.pay(self.late, date(2021, 3, 1), 1000)
+        self.pay(self.late, date(2021, 1, 5), 1000)
+
+        leases = load_leases(self.landlord)
+        payments = load_payments(self.landlord)
+        matched = leases['id'][match_leases(leases, payments)]
+        self.assertEqual(dict(zip(payments['date'].astype(object), matched)), {
+            date(2021, 2, 10): summer.id,
+            date(2021, 3, 1): self.late_lease.id,
+            date(2021, 1, 5): self.late_lease.id,
+        })
+
+        response = self.client.get('/reports/reconciliation', {'as_of': '2021-03-10'})
+        self.assertEqual(response.data['unmatched'], {'count': 0, 'total': 0})
+
+    def test_reconciliation_without_leases(self):
+        TenantPropertyRel.objects.all().delete()
+        response = self.client.get('/reports/reconciliation')
+        self.assertEqual(response.data['leases'], [])
+
+
+class LeaseResolutionTests(CrossCheckTestCase):
+    """Tests for attaching the leased property to payments"""
+
+    def setUp(self):
+        super().setUp()
+        self.check = PaymentType.objects.create(label='Check')
+        self.tenant = Tenant.objects.create(full_name='Jane Doe', landlord=self.landlord)
+        self.first, self.second = [
+            Property.objects.create(street='{} Main St'.format(i), city='Nashville', state='TN',
+                                    postal_code='37203', landlord=self.landlord)
+            for i in range(2)]
+        TenantPropertyRel.objects.create(
+            tenant=self.tenant, rented_property=self.first, rent=1000,
+            lease_start=date(2020, 1, 1), lease_end=date(2020, 12, 31))
+        TenantPropertyRel.objects.create(
+            tenant=self.tenant, rented_property=self.second, rent=1200,
+            lease_start=date(2021, 1, 1), lease_end=date(2021, 12, 31))
+
+    def test_create_and_update_attach_the_covering_lease(self):
+        response = self.client.post('/payments', {
+            'date': '2020-06-01', 'amount': 1000, 'ref_num': 'L1',
+            'full_name': self.tenant.id, 'type': self.check.id}, format='json')
+        payment = Payment.objects.get(pk=response.data['id'])
+        self.assertEqual(payment.rented_property, self.first)
+
+        self.client.put('/payments/{}'.format(payment.id), {
+            'date': '2021-06-01', 'amount': 1000, 'ref_num': 'L1',
+            'full_name': self.tenant.id, 'type': self.check.id}, format='json')
+        payment.refresh_from_db()
+        self.assertEqual(payment.rented_property, self.second)
+
+        self.client.put('/payments/{}'.format(payment.id), {
+            'date': '2019-06-01', 'amount': 1000, 'ref_num': 'L1',
+            'full_name': self.tenant.id, 'type': self.check.id}, format='json')
+        payment.refresh_from_db()
+        self.assertIsNone(payment.rented_property)
+
+    def test_import_attaches_leases(self):
+        body = 'date,amount,ref_num,tenant,type\n2020-02-01,1,A,Jane Doe,Check\n2021-02-01,1,B,Jane Doe,Check\n'
+        self.client.post('/payments/import', body, content_type='text/csv')
+        self.assertEqual(
+            dict(Payment.objects.values_list('ref_num', 'rented_property_id')),
+            {'A': self.first.id, 'B': self.second.id})
+
+    def test_backfill_command(self):
+        for day in (date(2020, 3, 1), date(2021, 3, 1), date(2022, 3, 1)):
+            Payment.objects.create(
+                date=day, amount=1000, ref_num='B', tenant=self.tenant,
+                payment_type=self.check, landlord=self.landlord)
+
+        call_command('backfill_payment_properties', chunk_size=2, stdout=StringIO())
+
+        self.assertEqual(
+            list(Payment.objects.order_by('date').values_list('rented_property_id', flat=True)),
+            [self.first.id, self.second.id, None])
+        self.assertEqual(
+            MonthlyIncome.objects.get(month=date(2021, 3, 1)).rented_property, self.second)
+
+    def test_backfill_covers_archived_payments(self):
+        for day in (date(2020, 3, 1), date(2021, 3, 1)):
+            Payment.objects.create(
+                date=day, amount=1000, ref_num='B', tenant=self.tenant,
+                payment_type=self.check, landlord=self.landlord)
+        call_command('archive_payments', before='2021-01-01', stdout=StringIO())
+
+        call_command('backfill_payment_properties', stdout=StringIO())
+
+        self.assertEqual(ArchivedPayment.objects.get().rented_property, self.first)
+        self.assertEqual(Payment.objects.get().rented_property, self.second)
+        self.assertEqual(
+            MonthlyIncome.objects.get(month=date(2020, 3, 1)).rented_property, self.first)
+
+
+class InstrumentationTests(CrossCheckTestCase):
+    """Tests for the query_instrumentation middleware"""
+
+    def get(self, url):
+        """Request `url` with a client that loads the current middleware settings"""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + self.token.key)
+        return client.get(url)
+
+    def test_server_timing_counts_queries(self):
+        self.create_tenants(2)
+        self.get('/tenants')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get('/tenants')
+
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;desc="{} queries";dur=[\d.]+, total;dur=[\d.]+$'.format(len(queries)))
+
+    def test_slow_requests_are_logged(self):
+        self.create_tenants(2)
+        with override_settings(REQUEST_INSTRUMENTATION={'SLOW_REQUEST_MS': 0, 'REPEATED_QUERIES': 1}):
+            with self.assertLogs('crosscheckapi.requests', 'WARNING') as logs:
+                self.get('/tenants?search=Tenant')
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['path'], '/tenants?search=Tenant')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(len(record['slowest']), min(record['queries'], 5))
+        self.assertTrue(all(entry['count'] >= 1 for entry in record['repeated']))
+
+    def test_disabled_middleware_is_removed(self):
+        with override_settings(REQUEST_INSTRUMENTATION={'ENABLED': False}):
+            response = self.get('/paymenttypes')
+        self.assertNotIn('Server-Timing', response)
+
+    def test_fingerprint_ignores_arguments(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s) AND n = 3'),
+            fingerprint('SELECT * FROM t WHERE id IN (%s, %s, %s) AND n = 42'))
+        self.assertNotEqual(fingerprint('SELECT a FROM t'), fingerprint('SELECT b FROM t'))
+
+
+class AsyncReadTests(CrossCheckMixin, TransactionTestCase):
+    """Tests for the async read endpoints
+
+    The async views query from worker threads with their own
+    connections, which only see committed data.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.create_tenants(3)
+        payment_type = PaymentType.objects.create(label='Check')
+        for tenant in Tenant.objects.all():
+            Payment.objects.create(
+                date=date(2021, 1, tenant.id), amount=1000, ref_num='P{}'.format(tenant.id),
+                tenant=tenant, payment_type=payment_type, landlord=self.landlord)
+
+    def assert_same_response(self, url, params=None):
+        expected = self.client.get(url, params)
+        response = self.client.get('/async' + url, params)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.content.replace(b'/async/', b'/'), expected.content)
+
+    def test_responses_match_the_viewsets(self):
+        for resource in ('payments', 'tenants', 'properties'):
+            self.assert_same_response('/' + resource)
+            self.assert_same_response('/' + resource, {'page_size': 2})
+        self.assert_same_response('/payments', {'keyword': 'P1', 'date': '2021-01-01/2021-12-31'})
+        self.assert_same_response('/tenants', {'search': 'Tenant 1'})
+        self.assert_same_response('/properties', {'search': 'main'})
+
+        self.assert_same_response('/payments/{}'.format(Payment.objects.first().id))
+        self.assert_same_response('/tenants/{}'.format(Tenant.objects.first().id))
+        self.assert_same_response('/properties/{}'.format(Property.objects.first().id))
+
+    def test_archived_payment_detail_matches_the_viewset(self):
+        payment = Payment.objects.first()
+        call_command('archive_payments', before='2021-12-31', stdout=StringIO())
+        self.assertTrue(ArchivedPayment.objects.filter(pk=payment.id).exists())
+
+        self.assert_same_response('/payments/{}'.format(payment.id))
+        self.assertEqual(self.client.get('/async/payments/{}'.format(payment.id)).json()['id'], payment.id)
+        self.assert_same_response('/payments/{}'.format(payment.id + 1000))
+
+    def test_missing_and_invalid_credentials_are_rejected(self):
+        self.assertEqual(APIClient().get('/async/payments').status_code, 401)
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token invalid')
+        response = client.get('/async/tenants')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'detail': 'Invalid token.'})
+
+    def test_only_get_is_allowed(self):
+        self.assertEqual(self.client.post('/async/payments').status_code, 405)
+
+
+class ShardTests(CrossCheckTestCase):
+    """Tests for the per-landlord shard databases"""
+
+    def register(self, email):
+        response = APIClient().post('/register', {'email': email, 'password': 'password'}, format='json')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + response.json()['token'])
+        return Landlord.objects.get(user__username=email), client
+
+    def test_new_landlords_are_spread_over_the_shards(self):
+        first, _ = self.register('first@example.com')
+        second, _ = self.register('second@example.com')
+
+        self.assertEqual({first.shard, second.shard}, set(settings.LANDLORD_SHARDS))
+        self.assertTrue(Landlord.objects.using(first.shard).filter(pk=first.pk).exists())
+
+    def test_requests_use_the_landlords_shard(self):
+        landlord, client = self.register('sharded@example.com')
+        response = client.post('/tenants', {
+            'full_name': 'Jane Doe', 'email': 'jane@example.com', 'phone_number': '5555555555'
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+        self.assertTrue(Tenant.objects.using(landlord.shard).filter(full_name='Jane Doe').exists())
+        self.assertFalse(Tenant.objects.filter(full_name='Jane Doe').exists())
+        self.assertEqual([tenant['full_name'] for tenant in client.get('/tenants').json()], ['Jane Doe'])
+        self.assertEqual(self.client.get('/tenants').json(), [])
+
+    def test_moved_landlords_keep_their_ids_and_responses(self):
+        self.create_tenants(2)
+        payment_type = PaymentType.objects.create(label='Check')
+        for tenant in Tenant.objects.all():
+            Payment.objects.create(
+                date=date(2021, 1, 5), amount=1000, ref_num='P{}'.format(tenant.id),
+                tenant=tenant, payment_type=payment_type, landlord=self.landlord)
+        expected = [self.client.get(url).content for url in ('/payments', '/tenants', '/reports/monthly')]
+        payment_ids = set(Payment.objects.values_list('id', flat=True))
+
+        move_landlord(self.landlord, 'shard_1', batch_size=1)
+
+        self.assertFalse(Payment.objects.exists())
+        self.assertFalse(MonthlyIncome.objects.exists())
+        self.assertEqual(set(Payment.objects.using('shard_1').values_list('id', flat=True)), payment_ids)
+        self.assertEqual(
+            [self.client.get(url).content for url in ('/payments', '/tenants', '/reports/monthly')],
+            expected)
+
+    def test_landlords_sharing_rows_are_not_moved(self):
+        self.create_tenants(1)
+        other, _ = self.register('other@example.com')
+        Payment.objects.create(
+            date=date(2021, 1, 5), amount=1000, ref_num='X', tenant=Tenant.objects.get(),
+            payment_type=PaymentType.objects.create(label='Check'), landlord=other)
+
+        with self.assertRaises(ValueError):
+            move_landlord(self.landlord, 'shard_1')
+        self.assertEqual(self.landlord.shard, 'default')
+        self.assertEqual(Tenant.objects.count(), 1)
+
+    def test_moves_cannot_take_ids_from_the_next_database(self):
+        move_landlord(self.landlord, 'shard_2')
+        with landlord_shard(self.landlord):
+            Tenant.objects.create(full_name='Jane Doe', landlord=self.landlord)
+
+        with self.assertRaises(ValueError):
+            move_landlord(self.landlord, 'shard_1')
+
+
+class SyncTests(CrossCheckTestCase):
+    """Tests for the /sync changes feed"""
+
+    def setUp(self):
+        super().setUp()
+        self.create_tenants(2)
+        self.tenant = Tenant.objects.order_by('id').first()
+        Payment.objects.create(date=date(2021, 1, 5), amount=1000, ref_num='R1', tenant=self.tenant,
+                               payment_type=PaymentType.objects.create(label='Check'),
+                               landlord=self.landlord)
+
+    def test_only_sync_sends_change_times(self):
+        rental = Property.objects.order_by('id').first()
+        for url in ('/tenants', '/tenants/{}'.format(self.tenant.id), '/properties',
+                    '/properties/{}'.format(rental.id), '/payments'):
+            for params in ({}, {'fast': 'true'}):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                self.assertNotIn(b'updated_at', response.content, url)
+
+        self.assertIn(b'updated_at', self.client.get('/sync').content)
+
+    def sync(self, since=None):
+        response = self.client.get('/sync', {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_first_sync_returns_every_record(self):
+        body = self.sync()
+
+        self.assertTrue(body['reset'])
+        self.assertEqual([len(body[key]) for key in ('tenants', 'properties', 'leases', 'payments')],
+                         [2, 2, 2, 1])
+        self.assertEqual(body['payments'][0]['tenant'], self.tenant.id)
+        self.assertEqual(body['deleted'], {'tenants': [], 'properties': [], 'leases': [], 'payments': []})
+
+    @override_settings(SYNC={'OVERLAP_SECONDS': 0, 'TOMBSTONE_DAYS': 30})
+    def test_later_syncs_return_the_changes_since_the_cursor(self):
+        cursor = self.sync()['cursor']
+        self.tenant.email = 'jane@example.com'
+        self.tenant.save()
+        lease_id = TenantPropertyRel.objects.get(tenant=self.tenant).id
+        TenantPropertyRel.objects.filter(id=lease_id).delete()
+
+        body = self.sync(cursor)
+        self.assertFalse(body['reset'])
+        self.assertEqual([tenant['email'] for tenant in body['tenants']], ['jane@example.com'])
+        self.assertEqual((body['properties'], body['leases'], body['payments']), ([], [], []))
+        self.assertEqual(body['deleted']['leases'], [lease_id])
+
+        self.assertEqual(self.sync(body['cursor'])['deleted']['leases'], [])
+
+    def test_deleting_a_tenant_records_its_cascaded_rows(self):
+        cursor = self.sync()['cursor']
+        lease_id = TenantPropertyRel.objects.get(tenant=self.tenant).id
+        payment_id = Payment.objects.get().id
+        tenant_id = self.tenant.id
+        self.tenant.delete()
+
+        deleted = self.sync(cursor)['deleted']
+        self.assertEqual(deleted['tenants'], [tenant_id])
+        self.assertEqual(deleted['leases'], [lease_id])
+        self.assertEqual(deleted['payments'], [payment_id])
+
+    def test_expired_cursors_reset(self):
+        body = self.sync('2000-01-01T00:00:00Z')
+        self.assertTrue(body['reset'])
+        self.assertEqual(len(body['tenants']), 2)
+
+    def test_invalid_cursors_are_rejected(self):
+        for since in ('yesterday', '2021-13-01T00:00:00Z', '2021-01-01T00:00:00'):
+            response = self.client.get('/sync', {'since': since})
+            self.assertEqual(response.status_code, 400)
+
+    def test_deleting_a_landlord_records_no_tombstones(self):
+        self.landlord.user.delete()
+        self.assertFalse(Tombstone.objects.exists())
+
+    def test_sync_runs_one_query_per_model(self):
+        cursor = self.sync()['cursor']
+        # Four record queries and the tombstones
+        self.assertEqual(self.count_queries('/sync?since=' + cursor), 5)
+
+
+class BatchTests(CrossCheckTestCase):
+    """Tests for the /batch endpoint"""
+
+    def setUp(self):
+        super().setUp()
+        self.check = PaymentType.objects.create(label='Check')
+
+    def batch(self, *operations):
+        return self.client.post('/batch', {'operations': list(operations)}, format='json')
+
+    def test_operations_can_refer_to_rows_created_earlier(self):
+        response = self.batch(
+            {'op': 'create', 'resource': 'tenants', 'ref': 'jane', 'data': {'full_name': 'Jane Doe'}},
+            {'op': 'create', 'resource': 'properties', 'ref': 'home', 'data': {
+                'street': '1 Main St', 'city': 'Nashville', 'state': 'TN', 'postal_code': '37203'}},
+            {'op': 'create', 'resource': 'leases', 'data': {
+                'tenant': {'ref': 'jane'}, 'rented_property': {'ref': 'home'},
+                'lease_start': '2021-01-01', 'lease_end': '2021-12-31', 'rent': 1000}},
+            {'op': 'create', 'resource': 'payments', 'data': {
+                'tenant': {'ref': 'jane'}, 'payment_type': self.check.id,
+                'date': '2021-02-01', 'amount': '$1,000', 'ref_num': 'B1'}},
+            {'op': 'create', 'resource': 'payments', 'data': {
+                'tenant': {'ref': 'jane'}, 'payment_type': self.check.id,
+                'date': '2021-03-01', 'amount': 1000, 'ref_num': 'B2'}},
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], [201] * 5)
+
+        tenant = Tenant.objects.get()
+        self.assertEqual(results[0]['id'], tenant.id)
+        payments = Payment.objects.order_by('date')
+        self.assertEqual([payment.rented_property_id for payment in payments],
+                         [results[1]['id']] * 2)
+        self.assertEqual(MonthlyIncome.objects.filter(landlord=self.landlord).count(), 2)
+        self.assertEqual(len(self.client.get('/payments').json()), 2)
+
+    def test_updates_and_deletes(self):
+        self.create_tenants(2)
+        first, second = Tenant.objects.order_by('id')
+        lease_ids = list(TenantPropertyRel.objects.values_list('id', flat=True))
+
+        response = self.batch(
+            {'op': 'update', 'resource': 'tenants', 'id': first.id, 'data': {'email': 'jane@example.com'}},
+            {'op': 'delete', 'resource': 'leases', 'id': lease_ids[0]},
+            {'op': 'delete', 'resource': 'leases', 'id': lease_ids[1]},
+        )
+        self.assertEqual([result['status'] for result in response.json()['results']], [204] * 3)
+        self.assertEqual(Tenant.objects.get(id=first.id).email, 'jane@example.com')
+        self.assertEqual(Tenant.objects.get(id=second.id).full_name, 'Tenant 1')
+        self.assertFalse(TenantPropertyRel.objects.exists())
+
+    def test_a_failed_operation_rolls_the_batch_back(self):
+        response = self.batch(
+            {'op': 'create', 'resource': 'tenants', 'ref': 'jane', 'data': {'full_name': 'Jane Doe'}},
+            {'op': 'create', 'resource': 'payments', 'data': {
+                'tenant': {'ref': 'jane'}, 'payment_type': self.check.id,
+                'date': 'soon', 'amount': 1000, 'ref_num': 'B1'}},
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['index'], 1)
+        self.assertFalse(Tenant.objects.exists())
+
+    def test_updates_cannot_clear_required_fields(self):
+        self.create_tenants(1)
+        tenant = Tenant.objects.get()
+        rental = Property.objects.get()
+        payment = Payment.objects.create(date=date(2021, 2, 1), amount=1000, ref_num='B1', tenant=tenant,
+                                         payment_type=self.check, landlord=self.landlord)
+
+        for resource, row, data in (('tenants', tenant, {'full_name': None}),
+                                    ('properties', rental, {'street': ''}),
+                                    ('properties', rental, {'city': 'Franklin', 'postal_code': None}),
+                                    ('payments', payment, {'ref_num': ''})):
+            response = self.batch({'op': 'update', 'resource': resource, 'id': row.id, 'data': data})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('cannot be empty', response.json()['message'])
+
+        self.assertEqual(Tenant.objects.get().full_name, tenant.full_name)
+        self.assertEqual(Property.objects.get().street, rental.street)
+        self.assertEqual(Property.objects.get().city, rental.city)
+        self.assertEqual(Payment.objects.get().ref_num, 'B1')
+
+        # Optional fields can still be cleared
+        response = self.batch({'op': 'update', 'resource': 'tenants', 'id': tenant.id, 'data': {'email': None}})
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(Tenant.objects.get().email)
+
+    def test_other_landlords_rows_are_not_found(self):
+        user = User.objects.create_user(username='other@example.com', password='password')
+        other = Tenant.objects.create(full_name='Other', landlord=Landlord.objects.create(user=user))
+
+        for operation in ({'op': 'delete', 'resource': 'tenants', 'id': other.id},
+                          {'op': 'create', 'resource': 'payments', 'data': {
+                              'tenant': other.id, 'payment_type': self.check.id,
+                              'date': '2021-02-01', 'amount': 1000, 'ref_num': 'B1'}}):
+            self.assertEqual(self.batch(operation).status_code, 400)
+        self.assertTrue(Tenant.objects.filter(id=other.id).exists())
+
+    def test_runs_of_creates_are_inserted_together(self):
+        self.create_tenants(1)
+        tenant = Tenant.objects.get()
+        payments = [{'op': 'create', 'resource': 'payments', 'data': {
+            'tenant': tenant.id, 'payment_type': self.check.id,
+            'date': '2021-02-{:02}'.format(day), 'amount': 100, 'ref_num': 'B{}'.format(day)}}
+            for day in range(1, 21)]
+        self.batch(*payments)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.batch(*payments)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Payment.objects.count(), 40)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "crosscheckapi_payment"')]
+        self.assertEqual(len(inserts), 1)
+
+
+class ArchiveTests(CrossCheckTestCase):
+    """Tests for the payment archive"""
+
+    def setUp(self):
+        super().setUp()
+        self.create_tenants(1)
+        self.tenant = Tenant.objects.get()
+        check = PaymentType.objects.create(label='Check')
+        today = date.today()
+        for days in (1000, 900, 10):
+            Payment.objects.create(date=today - timedelta(days=days), amount=days, ref_num='R{}'.format(days),
+                                   tenant=self.tenant, payment_type=check, landlord=self.landlord)
+        self.history = '/payments?date=2000-01-01/{}'.format(today.isoformat())
+
+    def archive(self, **options):
+        call_command('archive_payments', stdout=StringIO(), **options)
+
+    def test_old_payments_move_to_the_archive(self):
+        report = self.client.get('/reports/monthly').content
+        self.archive(batch_size=1)
+
+        self.assertEqual(list(Payment.objects.values_list('amount', flat=True)), [10])
+        self.assertEqual(set(ArchivedPayment.objects.values_list('amount', flat=True)), {1000, 900})
+        self.assertEqual([payment['amount'] for payment in self.client.get('/payments').json()], [10])
+        # Archived payments are still counted in the reports
+        self.assertEqual(self.client.get('/reports/monthly').content, report)
+
+    def test_date_ranges_reaching_back_read_the_archive(self):
+        expected = self.client.get(self.history).content
+        self.archive()
+
+        self.assertEqual(self.client.get(self.history).content, expected)
+        self.assert_fast_output_matches('/payments', {'date': self.history.split('=')[1], 'page_size': 2})
+        self.assertEqual([payment['amount'] for payment in self.client.get(
+            '/payments', {'date': self.history.split('=')[1], 'keyword': 'R9'}).json()], [900])
+
+    def test_archived_payments_leave_sync(self):
+        cursor = self.client.get('/sync').json()['cursor']
+        self.archive()
+
+        self.assertEqual(len(self.client.get('/sync', {'since': cursor}).json()['deleted']['payments']), 2)
+
+    def test_rebuilt_summaries_include_the_archive(self):
+        self.archive()
+        rebuild_monthly_income(self.landlord)
+        self.assertEqual(sum(MonthlyIncome.objects.values_list('total', flat=True)), 1910)
+
+        self.tenant.delete()
+        self.assertFalse(ArchivedPayment.objects.exists())
+        self.assertFalse(MonthlyIncome.objects.exists())
+
+    def test_archives_move_with_their_landlord(self):
+        self.archive()
+        move_landlord(self.landlord, 'shard_1')
+
+        self.assertEqual(ArchivedPayment.objects.using('shard_1').count(), 2)
+        self.assertEqual(len(self.client.get(self.history).json()), 3)
+
+    def test_deleting_a_property_keeps_its_archived_payments(self):
+        rental = Property.objects.create(street='1 Main St', city='Nashville', state='TN',
+                                         postal_code='37203', landlord=self.landlord)
+        Payment.objects.filter(amount=1000).update(rented_property=rental)
+        self.archive()
+
+        rental.delete()
+        self.assertEqual(ArchivedPayment.objects.count(), 2)
+        self.assertIsNone(ArchivedPayment.objects.get(amount=1000).rented_property)
+
+    def test_archived_payments_are_read_only(self):
+        self.archive()
+        archived = ArchivedPayment.objects.get(amount=1000)
+        url = '/payments/{}'.format(archived.id)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['id'], response.json()['amount']), (archived.id, 1000))
+
+        response = self.client.put(url, {
+            'date': '2021-06-01', 'amount': 5, 'ref_num': 'R5',
+            'full_name': self.tenant.id, 'type': archived.payment_type_id}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.delete(url).status_code, 409)
+        self.assertEqual(ArchivedPayment.objects.get(pk=archived.id).amount, 1000)
+        self.assertFalse(Payment.objects.filter(pk=archived.id).exists())
+
+        missing = '/payments/{}'.format(archived.id + 1000)
+        self.assertEqual(self.client.get(missing).status_code, 404)
+        self.assertEqual(self.client.put(missing, {
+            'date': '2021-06-01', 'amount': 5, 'ref_num': 'R5',
+            'full_name': self.tenant.id, 'type': archived.payment_type_id},
+            format='json').status_code, 404)
+        self.assertEqual(self.client.delete(missing).status_code, 404)
+
+
+class SQLiteProfileTests(TestCase):
+    """Tests for the SQLite connection profile"""
+
+    def test_connections_apply_the_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout'])
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+
+@override_settings(RESPONSE_CACHE=UNCACHED)
+class QueryBudgetTests(TestCase):
+    """Every route of the endpoint benchmark stays within its query
+    budget, whatever the size of the landlord's portfolio
+    """
+
+    databases = '__all__'
+
+    def test_endpoints_stay_within_query_budgets(self):
+        for tenants in (2, 20):
+            cache.clear()
+            landlord, token = generate_portfolio(
+                'budget-{}@example.com'.format(tenants), tenants, tenants * 12, years=1)
+            fixtures = portfolio_fixtures(landlord)
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+
+            for endpoint in ENDPOINTS:
+                with self.subTest(endpoint=endpoint.name, tenants=tenants):
+                    stats = measure_endpoint(client, endpoint, fixtures, repeat=2)
+                    self.assertLessEqual(stats['queries'], endpoint.budget)
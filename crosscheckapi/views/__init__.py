@@ -3,4 +3,10 @@ from .auth import login_user
 from .tenant import Tenants
 from .payment import Payments
 from .property import Properties
-from .paymenttype import PaymentTypes
\ No newline at end of file
+from .paymenttype import PaymentTypes
+from .report import Reports
+from .sync import Sync
+from .batch import Batch
+from .asyncread import async_payment_list, async_payment_detail
+from .asyncread import async_tenant_list, async_tenant_detail
+from .asyncread import async_property_list, async_property_detail
@@ -0,0 +1,165 @@
+"""Async read endpoints for ASGI deployments
+
+Under ASGI, Django 3.1 runs every sync view on one shared thread, so the
+DRF viewsets handle a single request at a time. These views serve the
+same list and retrieve responses as native async views. Cached
+credentials are checked on the event loop, and the queries run in a
+pool of worker threads, one connection per thread, so requests no
+longer wait on each other.
+
+Django 3.1 has no async ORM API, so database work is wrapped with
+`database_sync_to_async` rather than awaited directly. The responses are
+the `?fast` renderings, which are byte-identical to the DRF output.
+"""
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponseNotAllowed, HttpResponseServerError
+from rest_framework import exceptions, status
+from rest_framework.authentication import get_authorization_header
+from rest_framework.request import Request
+from crosscheckapi import fastjson
+from crosscheckapi.authentication import LandlordTokenAuthentication, credential_cache
+from crosscheckapi.models import ArchivedPayment, Payment, Property, Tenant, TenantPropertyRel
+from crosscheckapi.pagination import IdCursorPagination, PaymentCursorPagination
+from crosscheckapi.shards import activate
+from .payment import PAYMENT_ROW, Payments
+from .property import PROPERTY_LEASE_ROW, PROPERTY_ROW, Properties
+from .tenant import TENANT_ROW, Tenants, tenant_rows
+
+
+def database_sync_to_async(func):
+    """Run `func` in a worker thread that is not shared with the sync
+    views, closing the thread's connection as CONN_MAX_AGE requires
+    """
+    def run(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+async def authenticate(request):
+    """Return the landlord of the request's token
+
+    Raises:
+        NotAuthenticated, AuthenticationFailed -- as DRF would
+    """
+    header = get_authorization_header(request).split()
+    if not header or header[0].lower() != b'token':
+        raise exceptions.NotAuthenticated()
+    if len(header) != 2:
+        raise exceptions.AuthenticationFailed('Invalid token header.')
+
+    key = header[1].decode()
+    credentials = credential_cache.get(key)
+    if credentials is None:
+        credentials = await database_sync_to_async(
+            LandlordTokenAuthentication().authenticate_credentials)(key)
+
+    # The landlord was loaded with the user, so this is not a query
+    return getattr(credentials[0], 'landlord', None)
+
+
+def landlord_view(render):
+    """Turn `render(request, ...)`, a sync function returning a response
+    for the authenticated landlord, into an async GET view
+    """
+    async def view(request, *args, **kwargs):
+        if request.method != 'GET':
+            return HttpResponseNotAllowed(['GET'])
+
+        try:
+            landlord = await authenticate(request)
+        except exceptions.APIException as ex:
+            response = fastjson.json_response({'detail': str(ex.detail)}, status=ex.status_code)
+            response['WWW-Authenticate'] = 'Token'
+            return response
+
+        # DRF's request wrapper gives the shared filters query_params
+        # and the paginators absolute URLs
+        drf_request = Request(request)
+        drf_request.landlord = landlord
+        # Copied into the worker thread with the rest of the context
+        activate(landlord)
+        return await database_sync_to_async(render)(drf_request, *args, **kwargs)
+
+    return view
+
+
+@landlord_view
+def async_payment_list(request):
+    try:
+        payments = Payments().filtered_payments(request).values(*PAYMENT_ROW.fields)
+    except ValueError as ex:
+        return fastjson.json_response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+    # Relevance ranked results are not paginated
+    if request.query_params.get('keyword', None) is None or \
+            request.query_params.get('sort', None) != 'relevance':
+        paginator = PaymentCursorPagination()
+        page = paginator.paginate_queryset(payments, request)
+        if page is not None:
+            return fastjson.paginated_json_response(paginator, PAYMENT_ROW.rows(page))
+
+    return fastjson.json_response(PAYMENT_ROW.rows(payments))
+
+
+@landlord_view
+def async_payment_detail(request, pk):
+    try:
+        try:
+            payment = Payment.objects.values(*PAYMENT_ROW.fields).get(pk=pk)
+        except Payment.DoesNotExist:
+            # Archived payments are returned too, like Payments.retrieve
+            payment = ArchivedPayment.objects.values(*PAYMENT_ROW.fields).get(pk=pk)
+        return fastjson.json_response(PAYMENT_ROW.map(payment))
+    except Exception as ex:
+        return HttpResponseServerError(ex, status=status.HTTP_404_NOT_FOUND)
+
+
+@landlord_view
+def async_tenant_list(request):
+    tenants = Tenants().filtered_tenants(request).order_by('id')
+
+    paginator = IdCursorPagination()
+    rows = tenants.values(*TENANT_ROW.fields)
+    page = paginator.paginate_queryset(rows, request)
+    if page is not None:
+        return fastjson.paginated_json_response(
+            paginator, tenant_rows(page, [tenant['id'] for tenant in page]))
+
+    return fastjson.json_response(tenant_rows(rows, tenants.values('id')))
+
+
+@landlord_view
+def async_tenant_detail(request, pk):
+    try:
+        tenant = Tenant.objects.values(*TENANT_ROW.fields).get(pk=pk)
+        return fastjson.json_response(tenant_rows([tenant], [pk])[0])
+    except Exception as ex:
+        return HttpResponseServerError(ex, status=status.HTTP_404_NOT_FOUND)
+
+
+@landlord_view
+def async_property_list(request):
+    properties = Properties().filtered_properties(request).values(*PROPERTY_ROW.fields)
+
+    paginator = IdCursorPagination()
+    page = paginator.paginate_queryset(properties, request)
+    if page is not None:
+        return fastjson.paginated_json_response(paginator, PROPERTY_ROW.rows(page))
+
+    return fastjson.json_response(PROPERTY_ROW.rows(properties))
+
+
+@landlord_view
+def async_property_detail(request, pk):
+    try:
+        rental = PROPERTY_ROW.map(Property.objects.values(*PROPERTY_ROW.fields).get(pk=pk))
+        rental['lease'] = PROPERTY_LEASE_ROW.rows(
+            TenantPropertyRel.objects.filter(rented_property_id=pk)
+            .with_active().order_by('id').values(*PROPERTY_LEASE_ROW.fields))
+        return fastjson.json_response(rental)
+    except Exception as ex:
+        return HttpResponseServerError(ex, status=status.HTTP_404_NOT_FOUND)
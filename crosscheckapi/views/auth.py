@@ -6,6 +6,7 @@ from rest_framework.authtoken.models import Token
 from rest_framework import status
 from django.views.decorators.csrf import csrf_exempt
 from crosscheckapi.models import Landlord
+from crosscheckapi.shards import choose_shard
 
 @csrf_exempt
 def login_user(request):
@@ -55,14 +56,13 @@ def register_user(request):
         password=req_body['password']
     )
 
-    # Create the crosscheckapi_landlord table
-    landlord = Landlord.objects.create(
-        user=new_user
+    # Create the crosscheckapi_landlord table, placing the landlord's
+    # rows in the least used shard
+    Landlord.objects.create(
+        user=new_user,
+        shard=choose_shard()
     )
 
-    # Commit the user to the database by saving it
-    landlord.save()
-
     # Use the REST Framework's token generator on the new user account
     token = Token.objects.create(user=new_user)
 
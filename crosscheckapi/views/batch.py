@@ -0,0 +1,317 @@
+"""View module for running many writes in one request"""
+from django.conf import settings
+from django.db import router, transaction
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.viewsets import ViewSet
+from crosscheckapi.cache import invalidate_responses
+from crosscheckapi.leases import LeaseResolver
+from crosscheckapi.models import Payment, PaymentType, Property, Tenant, TenantPropertyRel
+from crosscheckapi.reports import record_payments
+from crosscheckapi.views.payment import parse_amount, parse_payment_date
+
+
+def optional_text(value):
+    return None if value in (None, '') else str(value)
+
+
+def whole_number(value):
+    return int(value)
+
+
+# Resource -> (model, landlord lookup, {field: (attribute, parser, required)}).
+# A parser naming a resource marks a reference to a row of it.
+RESOURCES = {
+    'tenants': (Tenant, 'landlord', {
+        'full_name': ('full_name', str, True),
+        'phone_number': ('phone_number', optional_text, False),
+        'email': ('email', optional_text, False),
+    }),
+    'properties': (Property, 'landlord', {
+        'street': ('street', str, True),
+        'city': ('city', str, True),
+        'state': ('state', str, True),
+        'postal_code': ('postal_code', str, True),
+    }),
+    'leases': (TenantPropertyRel, 'tenant__landlord', {
+        'tenant': ('tenant_id', 'tenants', True),
+        'rented_property': ('rented_property_id', 'properties', True),
+        'lease_start': ('lease_start', parse_payment_date, True),
+        'lease_end': ('lease_end', parse_payment_date, True),
+        'rent': ('rent', whole_number, True),
+    }),
+    'payments': (Payment, 'landlord', {
+        'tenant': ('tenant_id', 'tenants', True),
+        'payment_type': ('payment_type_id', 'paymenttypes', True),
+        'date': ('date', parse_payment_date, True),
+        'amount': ('amount', parse_amount, True),
+        'ref_num': ('ref_num', str, True),
+    }),
+}
+
+# Runs of creates of these resources are inserted with one bulk_create.
+# Tenants and properties are saved one at a time, since their signals
+# maintain the tenant table and the address search index.
+BULK_CREATED = ('leases', 'payments')
+
+
+class BatchError(ValueError):
+    """An operation that cannot run, which rolls the batch back"""
+
+    def __init__(self, index, message):
+        super().__init__('operation {}: {}'.format(index, message))
+        self.index = index
+
+
+class Batch(ViewSet):
+    """Cross Check batched writes"""
+
+    def create(self, request):
+        """Handle POST requests with a list of operations to run in one transaction
+
+        The body is {"operations": [...]}, each operation being one of
+            {"op": "create", "resource": ..., "data": {...}, "ref": "name"}
+            {"op": "update", "resource": ..., "id": ..., "data": {...}}
+            {"op": "delete", "resource": ..., "id": ...}
+        for the resources tenants, properties, leases and payments. An id,
+        or a tenant or rented_property in `data`, may be {"ref": "name"}
+        to refer to a row created earlier in the batch. Updates change
+        only the fields given.
+
+        Consecutive payment or lease creates are inserted together, and
+        their ids are only returned when the database reports them, so
+        give an operation a `ref` to get its id back. Consecutive deletes
+        of one resource run as one delete.
+
+        Returns:
+            Response -- 200 with one result per operation, or 400 naming
+            the operation that failed when nothing was written
+        """
+        operations = request.data.get('operations') if isinstance(request.data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return Response({'message': 'operations must be a list of operations'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        limit = getattr(settings, 'BATCH_MAX_OPERATIONS', 500)
+        if len(operations) > limit:
+            return Response({'message': 'a batch holds at most {} operations'.format(limit)},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        using = router.db_for_write(Payment)
+        try:
+            with transaction.atomic(using=using):
+                results = BatchRunner(request.landlord, operations).run()
+                # bulk_create skips the signals that drop cached responses
+                invalidate_responses(request.landlord.id, using)
+        except BatchError as ex:
+            return Response({'message': ex.args[0], 'index': ex.index},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'results': results})
+
+
+class BatchRunner:
+    """Runs the operations of one batch in order, collecting runs of
+    creates and deletes to write together
+    """
+
+    def __init__(self, landlord, operations):
+        self.landlord = landlord
+        self.operations = operations
+        self.results = [None] * len(operations)
+        # Created rows by ref: name -> (resource, id)
+        self.refs = {}
+        # The operations waiting to be written together
+        self.pending = []
+        self.pending_kind = None
+        self.live = self.live_rows()
+
+    def run(self):
+        for index, operation in enumerate(self.operations):
+            if not isinstance(operation, dict):
+                raise BatchError(index, 'must be an object')
+            kind = operation.get('op')
+            resource = operation.get('resource')
+            if resource not in RESOURCES:
+                raise BatchError(index, 'resource must be one of {}'.format(', '.join(RESOURCES)))
+
+            if kind == 'create':
+                row = self.build(index, resource, operation.get('data'))
+                name = operation.get('ref')
+                if resource in BULK_CREATED and name is None:
+                    self.queue(('create', resource), index, row)
+                else:
+                    self.flush()
+                    self.save_created(index, resource, row, name)
+            elif kind == 'update':
+                self.flush()
+                self.update(index, resource, operation)
+            elif kind == 'delete':
+                self.queue(('delete', resource), index, self.target_id(index, operation))
+            else:
+                raise BatchError(index, 'op must be create, update or delete')
+
+        self.flush()
+        return self.results
+
+    def live_rows(self):
+        """The ids of the rows that references may point at: the
+        landlord's tenants and properties and every payment type, read
+        in one query each. Rows created in the batch are added to them.
+        """
+        return {
+            'tenants': set(Tenant.objects.filter(landlord=self.landlord).values_list('id', flat=True)),
+            'properties': set(Property.objects.filter(landlord=self.landlord).values_list('id', flat=True)),
+            'paymenttypes': set(PaymentType.objects.values_list('id', flat=True)),
+        }
+
+    def owned(self, resource):
+        model, owner, _ = RESOURCES[resource]
+        return model.objects.filter(**{owner: self.landlord})
+
+    def resolve(self, index, resource, value):
+        """The id of a row of `resource` given its id or {"ref": name}"""
+        if isinstance(value, dict):
+            name = value.get('ref')
+            if name not in self.refs:
+                raise BatchError(index, 'unknown ref "{}"'.format(name))
+            ref_resource, pk = self.refs[name]
+            if ref_resource != resource:
+                raise BatchError(index, 'ref "{}" is not one of the {}'.format(name, resource))
+            return pk
+
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise BatchError(index, '{} is not a valid id'.format(value))
+
+    def target_id(self, index, operation):
+        return self.resolve(index, operation['resource'], operation.get('id'))
+
+    def parse(self, index, resource, data, partial):
+        """Convert the request fields of `data` to model attributes
+
+        Raises:
+            BatchError -- for unknown, missing or invalid fields
+        """
+        if not isinstance(data, dict):
+            raise BatchError(index, 'data must be an object')
+        _, _, fields = RESOURCES[resource]
+
+        unknown = sorted(set(data) - set(fields))
+        if unknown:
+            raise BatchError(index, 'unknown {}'.format(', '.join(unknown)))
+        missing = [field for field, (_, _, required) in fields.items()
+                   if required and not partial and data.get(field) in (None, '')]
+        if missing:
+            raise BatchError(index, 'missing {}'.format(', '.join(missing)))
+        # Updates may leave required fields out, but not clear them
+        cleared = [field for field, value in data.items()
+                   if fields[field][2] and value in (None, '')]
+        if cleared:
+            raise BatchError(index, '{} cannot be empty'.format(', '.join(cleared)))
+
+        values = {}
+        for field, value in data.items():
+            attribute, parser, _ = fields[field]
+            if isinstance(parser, str):
+                pk = self.resolve(index, parser, value)
+                if pk not in self.live[parser]:
+                    raise BatchError(index, 'unknown {} {}'.format(field, value))
+                values[attribute] = pk
+                continue
+            try:
+                values[attribute] = parser(value)
+            except (TypeError, ValueError) as ex:
+                raise BatchError(index, '{}: {}'.format(field, ex))
+        return values
+
+    def build(self, index, resource, data):
+        model, _, _ = RESOURCES[resource]
+        row = model(**self.parse(index, resource, data, partial=False))
+        if resource != 'leases':
+            row.landlord = self.landlord
+        return row
+
+    def queue(self, kind, index, item):
+        if kind != self.pending_kind:
+            self.flush()
+        self.pending_kind = kind
+        self.pending.append((index, item))
+
+    def flush(self):
+        """Write the pending run of creates or deletes"""
+        if not self.pending:
+            return
+        kind, resource = self.pending_kind
+        pending, self.pending, self.pending_kind = self.pending, [], None
+
+        if kind == 'delete':
+            self.delete(resource, pending)
+            return
+
+        rows = [row for _, row in pending]
+        if resource == 'payments':
+            attach_leases(rows)
+        model, _, _ = RESOURCES[resource]
+        model.objects.bulk_create(rows)
+        if resource == 'payments':
+            # bulk_create skips the signals that count payments
+            record_payments(rows)
+        for index, row in pending:
+            self.results[index] = {'status': status.HTTP_201_CREATED, 'id': row.pk}
+
+    def save_created(self, index, resource, row, name):
+        if name is not None:
+            if not isinstance(name, str) or name in self.refs:
+                raise BatchError(index, 'ref must be a new name')
+        if resource == 'payments':
+            attach_leases([row])
+        row.save()
+
+        if name is not None:
+            self.refs[name] = (resource, row.pk)
+        if resource in self.live:
+            self.live[resource].add(row.pk)
+        self.results[index] = {'status': status.HTTP_201_CREATED, 'id': row.pk}
+
+    def update(self, index, resource, operation):
+        pk = self.target_id(index, operation)
+        values = self.parse(index, resource, operation.get('data'), partial=True)
+        try:
+            row = self.owned(resource).get(pk=pk)
+        except RESOURCES[resource][0].DoesNotExist:
+            raise BatchError(index, '{} {} not found'.format(resource, pk))
+
+        for attribute, value in values.items():
+            setattr(row, attribute, value)
+        if resource == 'payments':
+            # Payments keep following the lease that covers their date
+            row.rented_property_id = TenantPropertyRel.objects.covering(
+                row.tenant_id, row.date).values_list('rented_property_id', flat=True).first()
+        row.save()
+
+        self.results[index] = {'status': status.HTTP_204_NO_CONTENT, 'id': pk}
+
+    def delete(self, resource, pending):
+        ids = [pk for _, pk in pending]
+        rows = self.owned(resource).filter(pk__in=ids)
+        found = set(rows.values_list('id', flat=True))
+        for index, pk in pending:
+            if pk not in found:
+                raise BatchError(index, '{} {} not found'.format(resource, pk))
+
+        # One delete for the run. The rows' delete signals still run.
+        rows.delete()
+        if resource in self.live:
+            self.live[resource] -= found
+        for index, pk in pending:
+            self.results[index] = {'status': status.HTTP_204_NO_CONTENT, 'id': pk}
+
+
+def attach_leases(payments):
+    """Set each payment's property from the lease covering its date,
+    with one query for all of them
+    """
+    tenant_ids = {payment.tenant_id for payment in payments}
+    LeaseResolver(TenantPropertyRel.objects.filter(tenant_id__in=tenant_ids)).attach(payments)
@@ -1,15 +1,25 @@
 """View module for handling requests about payments"""
+import csv
+import json
+import time
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.http import HttpResponseServerError
+from django.http import HttpResponseServerError, StreamingHttpResponse
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
-from datetime import datetime
-import operator
-from crosscheckapi.models import Tenant, Landlord, Payment, PaymentType, TenantPropertyRel
+from django.conf import settings
+from django.db import router, transaction
+from django.utils.dateparse import parse_date
+from crosscheckapi.models import ArchivedPayment, Tenant, Landlord, Payment, PaymentType, TenantPropertyRel
+from crosscheckapi import fastjson
+from crosscheckapi.archive import payment_source
+from crosscheckapi.cache import cached_response, invalidate_responses
+from crosscheckapi.leases import LeaseResolver
+from crosscheckapi.pagination import PaymentCursorPagination
+from crosscheckapi.reports import record_payments
 
 class Payments(ViewSet):
     """ Cross Check payments """
@@ -20,31 +30,14 @@ class Payments(ViewSet):
             Response -- JSON serialized payment instance
         """
         # landlord = authenticated user
-        landlord = Landlord.objects.get(user=request.auth.user)
+        landlord = request.landlord
         tenant_id = int(request.data["full_name"])
         tenant = Tenant.objects.get(pk=tenant_id )
         payment = Payment()
 
-        # Splitting the datetime string on the T to save the date
-        date_string_list = request.data["date"].split('T')
-        date = date_string_list[0]
-        payment.date = date
+        payment.date = parse_payment_date(request.data["date"])
 
-        # This field is looking for an integer.
-        # If the user includes a $, the string will
-        # split, be converted to an integer and saved
-        try:
-            payment.amount = int(request.data["amount"])
-        except ValueError:
-            try:
-                amount_string_list = request.data["amount"].split('$')
-                float_amount = float(amount_string_list[1])
-                amount = int(float_amount)
-                payment.amount = amount
-            except IndexError:
-                float_amount = float(request.data["amount"])
-                amount = int(float_amount)
-                payment.amount = amount
+        payment.amount = parse_amount(request.data["amount"])
         
         payment.ref_num = request.data["ref_num"]
         payment.tenant = tenant
@@ -52,11 +45,8 @@ class Payments(ViewSet):
         # Find the associated lease to assign the property
         # rather than having the user select both the
         # tenant and property
-        # try:
-        #     lease = TenantPropertyRel.objects.get(tenant=int(request.data["tenant_id"]))
-        #     payment.rented_property = lease.rented_property
-        # except TenantPropertyRel.DoesNotExist:
-        #     payment.rented_property = None
+        payment.rented_property_id = TenantPropertyRel.objects.covering(
+            tenant, payment.date).values_list('rented_property_id', flat=True).first()
         
         # Retrieve the payment type and attach a
         # Payment Type instance to the payment
@@ -74,11 +64,16 @@ class Payments(ViewSet):
 
     def retrieve(self, request, pk=None):
         """Handle GET requests for single payment
+        Archived payments are returned too, read-only.
+
         Returns:
             Response -- JSON serialized payment instance
         """
         try:
-            payment = Payment.objects.get(pk=pk)
+            try:
+                payment = Payment.objects.get(pk=pk)
+            except Payment.DoesNotExist:
+                payment = ArchivedPayment.objects.get(pk=pk)
 
             serializer = PaymentSerializer(
                 payment, context={'request': request})
@@ -86,80 +81,134 @@ class Payments(ViewSet):
         except Exception as ex:
             return HttpResponseServerError(ex, status=status.HTTP_404_NOT_FOUND)
 
+    @cached_response('payments')
     def list(self, request):
         """Handle GET requests to payments resource
         Returns:
             Response -- JSON serialized list of payments
         """
-        landlord = Landlord.objects.get(user=request.auth.user)
-        payments = Payment.objects.filter(landlord=landlord)
+        try:
+            payments = self.filtered_payments(request)
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Return a single page when the client asks for one.
+        # Relevance ranked results are not paginated because
+        # the cursor depends on the date ordering.
+        ranked = (self.request.query_params.get('keyword', None) is not None and
+                  self.request.query_params.get('sort', None) == 'relevance')
+        paginator = PaymentCursorPagination()
+
+        # Opt-in fast rendering straight from values() rows
+        fast = fastjson.is_requested(request)
+        if fast:
+            payments = payments.values(*PAYMENT_ROW.fields)
+
+        page = None
+        if not ranked:
+            page = paginator.paginate_queryset(payments, request, view=self)
+        if page is not None:
+            if fast:
+                return fastjson.paginated_json_response(paginator, PAYMENT_ROW.rows(page))
+            serializer = PaymentSerializer(
+                page, many=True, context={'request': request})
+            return paginator.get_paginated_response(serializer.data)
+
+        if fast:
+            return fastjson.json_response(PAYMENT_ROW.rows(payments))
+
+        serializer = PaymentSerializer(
+            payments, many=True, context={'request': request})
+
+        return Response(serializer.data)
+
+    def filtered_payments(self, request):
+        """The authenticated landlord's payments, filtered by the
+        keyword, date and tenant query parameters
+
+        Raises:
+            ValueError -- when the date range is malformed
+        """
+        landlord = request.landlord
+
+        # Date range query parameter, sent as `?date=start/end`.
+        # Ranges that reach into the archive read the payment history.
+        date_range = request.query_params.get('date', None)
+        start = end = None
+        if date_range is not None:
+            start, end = parse_date_range(date_range)
+        source = payment_source(landlord, start, end)
+
+        # Sort the payments by date starting with the most recent.
+        # The ordering matches the (landlord, -date, -id) index.
+        payments = source.objects.filter(landlord=landlord).select_related(
+            'tenant', 'payment_type').order_by('-date', '-id')
         
         # Search keyword query parameter.
         # Allows the user to search by ref_num or name
-        # using the same search input.
-        keyword = self.request.query_params.get('keyword', None)
+        # using the same search input. `?sort=relevance`
+        # ranks the matches instead of sorting by date.
+        keyword = request.query_params.get('keyword', None)
+        ranked = request.query_params.get('sort', None) == 'relevance'
         if keyword is not None:
-            payments = payments.filter(ref_num__icontains=keyword
-                        ) | payments.filter(tenant__full_name__icontains=keyword) 
+            payments = payments.search(keyword, ranked=ranked)
 
-        # Date range query parameter
-        # Check for the parameter to distinguigh the fetch
-        # Use the values sent in the body for the range
-        date_range = self.request.query_params.get('date', None)
         if date_range is not None:
-            print(date_range)
-            date_split = date_range.split('/')
-            print(date_split)
-            d1 = date_split[0]
-            d2 = date_split[1]
-            # d1 = request.data["startDate"]
-            # d2 = request.data["endDate"]
-            payments = payments.filter(date__range=(d1,d2))
+            payments = payments.filter(date__range=(start, end))
 
         # Specific tenant query parameter
-        chosen_tenant = self.request.query_params.get('tenant', None)
+        chosen_tenant = request.query_params.get('tenant', None)
         if chosen_tenant is not None:
-            payments = payments.filter(tenant__id=int(chosen_tenant))
+            payments = payments.filter(tenant_id=int(chosen_tenant))
 
-        # Sort the payments by date starting with the most recent
-        sorted_payments = sorted(payments, key=operator.attrgetter('date'), reverse=True)
+        return payments
 
-        serializer = PaymentSerializer(
-            sorted_payments, many=True, context={'request': request})
+    @action(methods=['get'], detail=False)
+    def export(self, request):
+        """Stream the full filtered payment history as a download
 
-        return Response(serializer.data)
+        Accepts the same keyword, date and tenant parameters as the list.
+        `?output=ndjson` selects NDJSON instead of CSV. Rows are read
+        from the database in chunks as the response is sent, so memory
+        use does not grow with the number of payments.
+
+        Returns:
+            StreamingHttpResponse -- CSV or NDJSON file
+        """
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            return Response({'message': 'output must be csv or ndjson'}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            payments = self.filtered_payments(request)
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = payments.order_by('-date', '-id').values_list(*EXPORT_COLUMNS.values()).iterator(
+            chunk_size=settings.PAYMENT_EXPORT_CHUNK_SIZE)
+
+        content_type, encode = EXPORT_FORMATS[output]
+        response = StreamingHttpResponse(encode(rows), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="payments.{}"'.format(output)
+        return response
 
     def update(self, request, pk=None):
         """Handle PUT requests for payments
         Returns:
-            Response -- Empty body with 204 status code
+            Response -- Empty body with 204 status code, or 404 or 409
         """
         # landlord = authenticated user
-        landlord = Landlord.objects.get(user=request.auth.user)
+        landlord = request.landlord
+        try:
+            payment = Payment.objects.get(pk=pk)
+        except Payment.DoesNotExist:
+            return missing_payment(pk)
+
         tenant = Tenant.objects.get(pk=request.data["full_name"])
-        
-        payment = Payment.objects.get(pk=pk)
 
-        # Splitting the datetime string on the T to save the date
-        date_string_list = request.data["date"].split('T')
-        date = date_string_list[0]
-        payment.date = date
+        payment.date = parse_payment_date(request.data["date"])
 
-        # This field is looking for an integer.
-        # If the user includes a $, the string will
-        # split, be converted to an integer and saved
-        try:
-            payment.amount = int(request.data["amount"])
-        except ValueError:
-            try:
-                amount_string_list = request.data["amount"].split('$')
-                float_amount = float(amount_string_list[1])
-                amount = int(float_amount)
-                payment.amount = amount
-            except IndexError:
-                float_amount = float(request.data["amount"])
-                amount = int(float_amount)
-                payment.amount = amount
+        payment.amount = parse_amount(request.data["amount"])
 
         payment.ref_num = request.data["ref_num"]
         payment.tenant = tenant
@@ -167,8 +216,8 @@ class Payments(ViewSet):
         # Find the associated lease to assign the property
         # rather than having the user select both the
         # tenant and property
-        # lease = TenantPropertyRel.objects.get(tenant=request.data["tenant_id"])
-        # payment.rented_property = lease.rented_property
+        payment.rented_property_id = TenantPropertyRel.objects.covering(
+            tenant, payment.date).values_list('rented_property_id', flat=True).first()
         
         # Retrieve the payment type and attach a 
         # Payment Type instance to the payment
@@ -183,7 +232,7 @@ class Payments(ViewSet):
     def destroy(self, request, pk=None):
         """Handle DELETE requests for payments
         Returns:
-            Response -- 204, 404, or 500 status code
+            Response -- 204, 404, 409, or 500 status code
         """
         try:
             payment = Payment.objects.get(pk=pk)
@@ -191,16 +240,252 @@ class Payments(ViewSet):
             
             return Response({}, status=status.HTTP_204_NO_CONTENT)
 
-        except Payment.DoesNotExist as ex:
-            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
+        except Payment.DoesNotExist:
+            return missing_payment(pk)
 
         except Exception as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(methods=['post'], detail=False, url_path='import')
+    def import_payments(self, request):
+        """Create many payments from a CSV or NDJSON upload
+
+        Each row needs `date`, `amount`, `ref_num`, `tenant` (id or full
+        name) and `type` (payment type id or label). The body is parsed as
+        it streams in and valid rows are inserted with bulk_create in
+        batches of `?batch_size=` inside one transaction. Invalid rows are
+        skipped and reported.
+
+        Returns:
+            Response -- 201 with the created count, per-row errors and
+            throughput, or 415 for an unsupported content type
+        """
+        landlord = request.landlord
+        start = time.perf_counter()
+
+        try:
+            rows = read_import_rows(request.stream, request.content_type)
+        except ValueError as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        try:
+            batch_size = max(1, int(request.query_params.get(
+                'batch_size', settings.PAYMENT_IMPORT_BATCH_SIZE)))
+        except ValueError:
+            return Response({'message': 'batch_size must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Every tenant, payment type and lease is resolved from
+        # these maps instead of a query per row
+        tenants = lookup_map(Tenant.objects.filter(landlord=landlord), 'full_name')
+        payment_types = lookup_map(PaymentType.objects.all(), 'label')
+        leases = LeaseResolver(TenantPropertyRel.objects.filter(tenant__landlord=landlord))
+
+        created = 0
+        errors = []
+        batch = []
+        with transaction.atomic(using=router.db_for_write(Payment)):
+            for row_number, row in enumerate(rows, start=1):
+                try:
+                    if isinstance(row, str):
+                        row = json.loads(row)
+                    missing = [field for field in IMPORT_FIELDS if row.get(field) in (None, '')]
+                    if missing:
+                        raise ValueError('missing {}'.format(', '.join(missing)))
+
+                    batch.append(Payment(
+                        date=parse_payment_date(row['date']),
+                        amount=parse_amount(row['amount']),
+                        ref_num=str(row['ref_num']),
+                        tenant_id=resolve(tenants, row['tenant'], 'tenant'),
+                        payment_type_id=resolve(payment_types, row['type'], 'payment type'),
+                        landlord=landlord
+                    ))
+                except (AttributeError, TypeError, ValueError) as ex:
+                    errors.append({'row': row_number, 'message': str(ex)})
+
+                if len(batch) >= batch_size:
+                    leases.attach(batch)
+                    created += len(Payment.objects.bulk_create(batch))
+                    record_payments(batch)
+                    batch = []
+
+            leases.attach(batch)
+            created += len(Payment.objects.bulk_create(batch))
+            record_payments(batch)
+
+            # bulk_create skips the signals that drop cached responses
+            invalidate_responses(landlord.id, router.db_for_write(Payment))
+
+        seconds = time.perf_counter() - start
+        return Response({
+            'created': created,
+            'errors': errors,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round((created + len(errors)) / seconds, 1) if seconds else None
+        }, status=status.HTTP_201_CREATED)
+
     # @action(methods=['post'], detail=True)
     # def daterange(self, request):
     #     """
 
+IMPORT_FIELDS = ('date', 'amount', 'ref_num', 'tenant', 'type')
+
+# Export column name -> payment field
+EXPORT_COLUMNS = {
+    'id': 'id',
+    'date': 'date',
+    'amount': 'amount',
+    'ref_num': 'ref_num',
+    'tenant_id': 'tenant_id',
+    'tenant': 'tenant__full_name',
+    'type': 'payment_type__label',
+}
+
+class Echo:
+    """A file-like object that returns what is written to it,
+    so csv.writer can produce lines for a streaming response
+    """
+    def write(self, value):
+        return value
+
+def encode_csv(rows):
+    """Encode export rows as CSV lines, header first"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_COLUMNS.keys())
+    for row in rows:
+        yield writer.writerow(row)
+
+def encode_ndjson(rows):
+    """Encode export rows as one JSON object per line"""
+    columns = list(EXPORT_COLUMNS.keys())
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), default=str) + '\n'
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', encode_csv),
+    'ndjson': ('application/x-ndjson', encode_ndjson),
+}
+
+def read_import_rows(stream, content_type):
+    """Iterate over the rows of a CSV or NDJSON body, reading it line
+    by line. CSV rows are dicts; NDJSON rows are their undecoded lines.
+
+    Raises:
+        ValueError -- for any other content type
+    """
+    if content_type.startswith('text/csv'):
+        return csv.DictReader(iter_lines(stream))
+    if content_type.startswith(('application/x-ndjson', 'application/jsonl')):
+        return (line for line in iter_lines(stream) if line.strip())
+
+    raise ValueError('Upload text/csv or application/x-ndjson')
+
+def iter_lines(stream):
+    """Decode a request body stream one line at a time"""
+    if stream is None:
+        return
+    for line in iter(stream.readline, b''):
+        yield line.decode('utf-8-sig')
+
+def missing_payment(pk):
+    """The response to a change of payment `pk` when it is not in the
+    payment table: 409 when it was archived, since archived payments
+    are read-only, or 404
+    """
+    if ArchivedPayment.objects.filter(pk=pk).exists():
+        return Response({'message': 'Payment {} is archived and cannot be changed'.format(pk)},
+                        status=status.HTTP_409_CONFLICT)
+    return Response({'message': 'Payment matching query does not exist.'},
+                    status=status.HTTP_404_NOT_FOUND)
+
+
+def lookup_map(queryset, name_field):
+    """Map both the id and the lowercase name of each row to its id.
+    Names shared by several rows map to None.
+    """
+    lookup = {}
+    for pk, name in queryset.values_list('id', name_field):
+        lookup[str(pk)] = pk
+        key = name.strip().lower()
+        lookup[key] = None if key in lookup else pk
+    return lookup
+
+def resolve(lookup, value, label):
+    """Return the id for an id or name from `lookup_map`
+
+    Raises:
+        ValueError -- when the value is unknown or ambiguous
+    """
+    key = str(value).strip().lower()
+    if lookup.get(key) is None:
+        reason = 'ambiguous' if key in lookup else 'unknown'
+        raise ValueError('{} {} "{}"'.format(reason, label, value))
+
+    return lookup[key]
+
+def parse_payment_date(value):
+    """Parse a payment date, dropping the time from a datetime string
+
+    Raises:
+        ValueError -- when the value is not a valid date
+    """
+    # Splitting the datetime string on the T to save the date
+    payment_date = parse_date(str(value).split('T')[0])
+    if payment_date is None:
+        raise ValueError('{} is not a valid date'.format(value))
+
+    return payment_date
+
+def parse_amount(value):
+    """Convert an amount such as 1200, "1200.50" or "$1,200" to whole dollars
+
+    Raises:
+        ValueError -- when the value is not a number
+    """
+    # This field is looking for an integer.
+    # If the user includes a $, it is stripped
+    # before the amount is converted
+    try:
+        return int(value)
+    except ValueError:
+        return int(float(str(value).replace('$', '').replace(',', '')))
+
+def parse_date_range(date_range):
+    """Split a `start/end` query parameter into a pair of dates
+
+    Raises:
+        ValueError -- when either side is not a valid date
+    """
+    try:
+        d1, d2 = date_range.split('/')
+        start, end = parse_date(d1), parse_date(d2)
+    except ValueError:
+        start = end = None
+
+    if start is None or end is None:
+        raise ValueError('date must be formatted as YYYY-MM-DD/YYYY-MM-DD')
+
+    return start, end
+
+# The PaymentSerializer output, built from values() rows
+PAYMENT_ROW = fastjson.RowMapper([
+    ('id', 'id'),
+    ('date', ('date', fastjson.iso_date)),
+    ('amount', 'amount'),
+    ('ref_num', 'ref_num'),
+    ('tenant', [
+        ('id', 'tenant__id'),
+        ('phone_number', 'tenant__phone_number'),
+        ('email', 'tenant__email'),
+        ('landlord', 'tenant__landlord'),
+        ('full_name', 'tenant__full_name'),
+    ]),
+    ('payment_type', [
+        ('id', 'payment_type__id'),
+        ('label', 'payment_type__label'),
+    ]),
+])
+
 class TenantSerializer(serializers.ModelSerializer):
     """JSON serializer for tenants"""
     
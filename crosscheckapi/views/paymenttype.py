@@ -1,34 +1,77 @@
 """View module for handling requests about game types"""
-from django.http import HttpResponseServerError
+import hashlib
+import threading
+from django.http import HttpResponse, HttpResponseServerError
+from django.utils.cache import get_conditional_response
+from rest_framework.renderers import JSONRenderer
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework import serializers
+from crosscheckapi.cache import bump_version, data_version
 from crosscheckapi.models import PaymentType
 import json
 
+# The encoded list response and its ETag, with the payment types version
+# they were built at. The version is kept in the shared cache and bumped
+# by the PaymentType signal handlers, so a change made through any
+# process rebuilds the copy in every process.
+_encoded_payment_types = None
+_encoded_payment_types_lock = threading.Lock()
+
+
+def encoded_payment_types():
+    """Return the encoded payment types response body and its ETag"""
+    global _encoded_payment_types
+    # Read before the payment types, so a change committed while they
+    # are encoded leaves this copy outdated rather than current
+    version = data_version('paymenttypes', 'all')
+    with _encoded_payment_types_lock:
+        if _encoded_payment_types is None or _encoded_payment_types[0] != version:
+            payment_types = PaymentType.objects.all()
+
+            # The table on the front end requires a specific data structure
+            # {id: label, id: label, etc.}
+            pt_obj = {}
+            for pt in payment_types:
+                pt_obj[pt.id] = pt.label
+
+            pt_obj_string = json.dumps(pt_obj, separators=None)
+
+            body = JSONRenderer().render(pt_obj_string)
+            etag = '"{}"'.format(hashlib.sha1(body).hexdigest())
+            _encoded_payment_types = (version, body, etag)
+
+        return _encoded_payment_types[1:]
+
+
+def invalidate_payment_types():
+    """Rebuild the payment types response on the next request, in
+    every process
+    """
+    bump_version('paymenttypes', 'all')
+
+
 class PaymentTypes(ViewSet):
     """ Cross Check PaymentTypes """
 
     def list(self, request):
         """Handle GET requests to payment_type resource
         Returns:
-            Response -- JSON serialized list of payment_types
+            Response -- JSON serialized list of payment_types,
+            or 304 when the client's copy is current
         """
-        payment_types = PaymentType.objects.all()
-
-        # The table on the front end requires a specific data structure
-        # {id: label, id: label, etc.}
-        pt_obj = {}
-        for pt in payment_types:
-            pt_obj[pt.id] = pt.label
+        body, etag = encoded_payment_types()
 
-        pt_obj_string = json.dumps(pt_obj, separators=None)
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = HttpResponse(body, content_type='application/json')
+        response['ETag'] = etag
 
-        return Response(pt_obj_string)
+        return response
 
 class PaymentTypeSerializer(serializers.ModelSerializer):
     """JSON serializer for payment_types"""
     class Meta:
         model = PaymentType
-        fields = ('id', 'label')
\ No newline at end of file
+        fields = ('id', 'label')
@@ -7,9 +7,10 @@ from rest_framework.decorators import action
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
-from datetime import date
-from datetime import datetime
 from crosscheckapi.models import Property, Tenant, Landlord, Payment, PaymentType, TenantPropertyRel
+from crosscheckapi import fastjson
+from crosscheckapi.cache import cached_response
+from crosscheckapi.pagination import IdCursorPagination
 
 
 class Properties(ViewSet):
@@ -21,7 +22,7 @@ class Properties(ViewSet):
             Response -- JSON serialized property instance
         """
         # landlord = authenticated user
-        landlord = Landlord.objects.get(user=request.auth.user)
+        landlord = request.landlord
 
         rental = Property()
         rental.street = request.data["street"]
@@ -45,21 +46,12 @@ class Properties(ViewSet):
         try:
             rental = Property.objects.get(pk=pk)
 
-            # Find the associated leases and attach them to the custom property `lease`
-            try:
-                leases = TenantPropertyRel.objects.filter(rented_property=pk)
-
-                # Set the custom property `active` based on the lease date range
-                current_day = date.today()
-                for lease in leases:
-                    if current_day >= lease.lease_start and current_day <= lease.lease_end:
-                        lease.active = True
-                    else: 
-                        lease.active = False
-                rental.lease = leases
-
-            except TenantPropertyRel.DoesNotExist:
-                rental.lease = None
+            # Attach the associated leases to the custom property `lease`.
+            # Tenants and their landlords are joined in the same query and
+            # `active` is computed in SQL, the same way the tenant views do.
+            rental.lease = list(TenantPropertyRel.objects.filter(rented_property=rental)
+                                .select_related('tenant__landlord')
+                                .with_active().order_by('id'))
 
             serializer = LeasedPropertySerializer(
                 rental, context={'request': request})
@@ -67,34 +59,59 @@ class Properties(ViewSet):
         except Exception as ex:
             return HttpResponseServerError(ex, status=status.HTTP_404_NOT_FOUND)
 
+    @cached_response('properties')
     def list(self, request):
         """Handle GET requests to property resource
         Returns:
             Response -- JSON serialized list of properties
         """
-        landlord = Landlord.objects.get(user=request.auth.user)
-        current_users_properties = Property.objects.filter(landlord=landlord)
-
-        search_term = self.request.query_params.get('search', None)
-        if search_term is not None:
-            current_users_properties = current_users_properties.filter(street__icontains=search_term
-            ) | current_users_properties.filter(city__icontains=search_term
-            ) | current_users_properties.filter(state__icontains=search_term
-            ) | current_users_properties.filter(postal_code__icontains=search_term
-            )
+        current_users_properties = self.filtered_properties(request)
+
+        # Opt-in fast rendering straight from values() rows
+        fast = fastjson.is_requested(request)
+        if fast:
+            current_users_properties = current_users_properties.values(*PROPERTY_ROW.fields)
+
+        # Return a single page when the client asks for one
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(current_users_properties, request, view=self)
+        if page is not None:
+            if fast:
+                return fastjson.paginated_json_response(paginator, PROPERTY_ROW.rows(page))
+            serializer = PropertySerializer(
+                page, many=True, context={'request': request})
+            return paginator.get_paginated_response(serializer.data)
+
+        if fast:
+            return fastjson.json_response(PROPERTY_ROW.rows(current_users_properties))
 
         serializer = PropertySerializer(
             current_users_properties, many=True, context={'request': request})
 
         return Response(serializer.data)
 
+    def filtered_properties(self, request):
+        """The authenticated landlord's properties, filtered by the
+        search query parameter
+        """
+        landlord = request.landlord
+        current_users_properties = Property.objects.filter(landlord=landlord)
+
+        search_term = request.query_params.get('search', None)
+        if search_term is not None:
+            # Every word must prefix-match a word of the street,
+            # city, state or postal code, e.g. "main 37203"
+            current_users_properties = current_users_properties.search(search_term, landlord)
+
+        return current_users_properties
+
     def update(self, request, pk=None):
         """Handle PUT requests for properties
         Returns:
             Response -- Empty body with 204 status code
         """
         # landlord = authenticated user
-        landlord = Landlord.objects.get(user=request.auth.user)
+        landlord = request.landlord
 
         rental = Property.objects.get(pk=pk)
         rental.street = request.data["street"]
@@ -151,12 +168,61 @@ class Properties(ViewSet):
             return Response({}, status=status.HTTP_204_NO_CONTENT)
 
 
+# The PropertySerializer output, built from values() rows
+PROPERTY_ROW = fastjson.RowMapper([
+    ('id', 'id'),
+    ('street', 'street'),
+    ('city', 'city'),
+    ('state', 'state'),
+    ('postal_code', 'postal_code'),
+    ('landlord', 'landlord'),
+])
+
+
+# The LeasedPropertySerializer leases, built from values() rows
+PROPERTY_LEASE_ROW = fastjson.RowMapper([
+    ('id', 'id'),
+    ('lease_start', ('lease_start', fastjson.iso_date)),
+    ('lease_end', ('lease_end', fastjson.iso_date)),
+    ('rent', 'rent'),
+    ('tenant', [
+        ('id', 'tenant__id'),
+        ('phone_number', 'tenant__phone_number'),
+        ('email', 'tenant__email'),
+        ('full_name', 'tenant__full_name'),
+        ('landlord', [
+            ('id', 'tenant__landlord__id'),
+            ('user', 'tenant__landlord__user'),
+        ]),
+    ]),
+    ('active', 'active'),
+])
+
+
+class LeaseLandlordSerializer(serializers.ModelSerializer):
+    """JSON serializer for the landlord of a lease's tenant, without
+    the shard holding their rows
+    """
+    class Meta:
+        model = Landlord
+        fields = ('id', 'user')
+
+class LeaseTenantSerializer(serializers.ModelSerializer):
+    """JSON serializer for the tenant of a lease. Change times are
+    only sent by /sync.
+    """
+    landlord = LeaseLandlordSerializer(many=False)
+    class Meta:
+        model = Tenant
+        fields = ('id', 'phone_number', 'email',
+                    'full_name', 'landlord')
+
 class LeaseSerializer(serializers.ModelSerializer):
     """JSON serializer for leases"""
+    tenant = LeaseTenantSerializer(many=False)
     class Meta:
         model = TenantPropertyRel
         fields = ('id', 'lease_start', 'lease_end', 'rent', 'tenant', 'active')
-        depth = 2
 
 class LeasedPropertySerializer(serializers.ModelSerializer):
     """JSON serializer for individual properties with the associated leases"""
@@ -0,0 +1,111 @@
+"""View module for handling requests about reports"""
+from django.db.models import Sum
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.viewsets import ViewSet
+from rest_framework.response import Response
+from django.utils.dateparse import parse_date
+from crosscheckapi.models import MonthlyIncome
+from crosscheckapi.reconciliation import load_leases, load_payments, reconcile
+from crosscheckapi.views.payment import parse_date_range
+
+# Query parameter value -> MonthlyIncome field
+MONTHLY_DIMENSIONS = {
+    'property': 'rented_property_id',
+    'tenant': 'tenant_id',
+    'type': 'payment_type_id',
+}
+
+class Reports(ViewSet):
+    """Cross Check reports"""
+
+    @action(methods=['get'], detail=False)
+    def monthly(self, request):
+        """Handle GET requests for monthly income totals
+
+        Totals are read from the MonthlyIncome summary table, never from
+        Payment. `?date=start/end` limits the months, `?by=property,tenant`
+        picks the dimensions to group by (all three by default) and
+        `?tenant=` / `?property=` narrow the report.
+
+        Returns:
+            Response -- JSON list of totals per month and dimension
+        """
+        landlord = request.landlord
+        income = MonthlyIncome.objects.filter(landlord=landlord)
+
+        date_range = request.query_params.get('date', None)
+        if date_range is not None:
+            try:
+                start, end = parse_date_range(date_range)
+            except ValueError as ex:
+                return Response({'message': ex.args[0]}, status=status.HTTP_400_BAD_REQUEST)
+            income = income.filter(month__range=(start.replace(day=1), end))
+
+        for name in ('tenant', 'property'):
+            chosen = request.query_params.get(name, None)
+            if chosen is not None:
+                try:
+                    chosen = int(chosen)
+                except ValueError:
+                    return Response({'message': '{} must be an id'.format(name)},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                income = income.filter(**{MONTHLY_DIMENSIONS[name]: chosen})
+
+        by = request.query_params.get('by', ','.join(MONTHLY_DIMENSIONS))
+        dimensions = [name for name in by.split(',') if name]
+        unknown = set(dimensions) - set(MONTHLY_DIMENSIONS)
+        if unknown:
+            return Response({'message': 'by must be a list of property, tenant and type'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        fields = ['month'] + [MONTHLY_DIMENSIONS[name] for name in dimensions]
+        totals = income.values(*fields).annotate(
+            amount=Sum('total'), payments=Sum('payment_count')).order_by(*fields)
+
+        return Response([
+            dict({name: row[MONTHLY_DIMENSIONS[name]] for name in dimensions},
+                 month=row['month'].strftime('%Y-%m'),
+                 total=row['amount'], count=row['payments'])
+            for row in totals
+        ])
+
+    @action(methods=['get'], detail=False)
+    def reconciliation(self, request):
+        """Handle GET requests for rent reconciliation
+
+        Compares the rent due each month of every lease with the payments
+        received, up to `?as_of=YYYY-MM-DD` (default today). `?delinquent`
+        returns only leases in arrears.
+
+        Returns:
+            Response -- JSON per lease totals, arrears, overpayments and
+            days late, plus the payments that match no lease
+        """
+        landlord = request.landlord
+
+        as_of = request.query_params.get('as_of', None)
+        if as_of is not None:
+            as_of = parse_date(as_of)
+            if as_of is None:
+                return Response({'message': 'as_of must be formatted as YYYY-MM-DD'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        leases = load_leases(landlord)
+        result = reconcile(leases, load_payments(landlord), as_of)
+
+        columns = ('expected', 'received', 'arrears', 'overpayment', 'late_months', 'max_days_late')
+        rows = zip(leases['id'].tolist(), leases['tenant'].tolist(), leases['property'].tolist(),
+                   *(result[column].tolist() for column in columns))
+        report = [
+            dict(zip(('lease', 'tenant', 'property') + columns, row))
+            for row in rows
+        ]
+
+        if request.query_params.get('delinquent', None) is not None:
+            report = [row for row in report if row['arrears'] > 0]
+
+        return Response({
+            'leases': report,
+            'unmatched': {'count': result['unmatched_count'], 'total': result['unmatched_total']},
+        })
@@ -0,0 +1,126 @@
+"""View module for incremental sync of a landlord's records"""
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.viewsets import ViewSet
+from crosscheckapi import fastjson
+from crosscheckapi.models import Payment, Property, Tenant, TenantPropertyRel, Tombstone
+
+DEFAULTS = {
+    # The cursor trails the response by this much, so rows written by
+    # transactions that commit after the changes are read are resent
+    # in the next sync rather than missed
+    'OVERLAP_SECONDS': 60,
+    # Tombstones are pruned after this many days. Older cursors get a
+    # full snapshot with `reset` set.
+    'TOMBSTONE_DAYS': 30,
+}
+
+
+def sync_options():
+    return dict(DEFAULTS, **getattr(settings, 'SYNC', {}))
+
+# Records are flat: related records are referenced by id
+TENANT_SYNC_ROW = fastjson.RowMapper([
+    ('id', 'id'),
+    ('phone_number', 'phone_number'),
+    ('email', 'email'),
+    ('full_name', 'full_name'),
+    ('updated_at', ('updated_at', fastjson.iso_datetime)),
+])
+
+PROPERTY_SYNC_ROW = fastjson.RowMapper([
+    ('id', 'id'),
+    ('street', 'street'),
+    ('city', 'city'),
+    ('state', 'state'),
+    ('postal_code', 'postal_code'),
+    ('updated_at', ('updated_at', fastjson.iso_datetime)),
+])
+
+LEASE_SYNC_ROW = fastjson.RowMapper([
+    ('id', 'id'),
+    ('lease_start', ('lease_start', fastjson.iso_date)),
+    ('lease_end', ('lease_end', fastjson.iso_date)),
+    ('rent', 'rent'),
+    ('tenant', 'tenant'),
+    ('rented_property', 'rented_property'),
+    ('updated_at', ('updated_at', fastjson.iso_datetime)),
+])
+
+PAYMENT_SYNC_ROW = fastjson.RowMapper([
+    ('id', 'id'),
+    ('date', ('date', fastjson.iso_date)),
+    ('amount', 'amount'),
+    ('ref_num', 'ref_num'),
+    ('tenant', 'tenant'),
+    ('rented_property', 'rented_property'),
+    ('payment_type', 'payment_type'),
+    ('updated_at', ('updated_at', fastjson.iso_datetime)),
+])
+
+# (response key, model, landlord lookup, row mapper)
+COLLECTIONS = [
+    ('tenants', Tenant, 'landlord', TENANT_SYNC_ROW),
+    ('properties', Property, 'landlord', PROPERTY_SYNC_ROW),
+    ('leases', TenantPropertyRel, 'tenant__landlord', LEASE_SYNC_ROW),
+    ('payments', Payment, 'landlord', PAYMENT_SYNC_ROW),
+]
+
+
+class Sync(ViewSet):
+    """Cross Check changes feed"""
+
+    def list(self, request):
+        """Handle GET requests for the records changed since a cursor
+
+        Without `?since=` every record is returned. With the `cursor` of
+        an earlier response, only the records created or changed since
+        then are returned, with the ids of the records deleted since.
+        Clients apply the changed records first, then the deletions,
+        and pass the new cursor to the next sync.
+
+        Returns:
+            Response -- JSON object with the records of each kind, the
+            deleted ids of each kind, the next cursor, and `reset` when
+            the client must replace its records rather than update them
+        """
+        options = sync_options()
+        landlord = request.landlord
+        now = timezone.now()
+
+        since = request.query_params.get('since', None)
+        if since is not None:
+            try:
+                since = parse_datetime(since)
+            except ValueError:
+                since = None
+            if since is None or timezone.is_naive(since):
+                return Response({'message': 'since must be a cursor returned by /sync'},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        reset = since is None or since < now - timedelta(days=options['TOMBSTONE_DAYS'])
+        body = {
+            'cursor': fastjson.iso_datetime(now - timedelta(seconds=options['OVERLAP_SECONDS'])),
+            'reset': reset,
+        }
+
+        # One query per kind, each a range scan of its updated_at index
+        for key, model, owner, row in COLLECTIONS:
+            records = model.objects.filter(**{owner: landlord})
+            if not reset:
+                records = records.filter(updated_at__gte=since)
+            body[key] = row.rows(records.order_by('updated_at', 'id').values(*row.fields))
+
+        deleted = {key: [] for key, _, _, _ in COLLECTIONS}
+        if not reset:
+            kinds = {model._meta.model_name: key for key, model, _, _ in COLLECTIONS}
+            for kind, object_id in Tombstone.objects.filter(
+                    landlord=landlord, deleted_at__gte=since).order_by('id').values_list('model', 'object_id'):
+                deleted[kinds[kind]].append(object_id)
+        body['deleted'] = deleted
+
+        return fastjson.json_response(body)
@@ -1,16 +1,22 @@
 """View module for handling requests about tenants"""
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
-from django.http import HttpResponseServerError
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseServerError
+from django.utils.cache import get_conditional_response
 from rest_framework import status
 from rest_framework.decorators import action
 from rest_framework.viewsets import ViewSet
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework import serializers
-from crosscheckapi.models import Tenant, Landlord, TenantPropertyRel
+from crosscheckapi.models import Property, Tenant, Landlord, TenantPropertyRel
+from crosscheckapi import fastjson
+from crosscheckapi.cache import cached_response, data_version
+from crosscheckapi.pagination import IdCursorPagination
+import hashlib
 import json
-from datetime import date
-from datetime import datetime
 
 class Tenants(ViewSet):
     """Cross Check tenants"""
@@ -20,7 +26,7 @@ class Tenants(ViewSet):
         Returns:
             Response -- JSON serialized tenant instance
         """
-        landlord = Landlord.objects.get(user=request.auth.user)
+        landlord = request.landlord
 
         tenant = Tenant()
         tenant.phone_number = request.data["phone_number"]
@@ -43,26 +49,13 @@ class Tenants(ViewSet):
         """
 
         try: 
-            tenant = Tenant.objects.get(pk=pk)
-
-            try:
-                rented_property = TenantPropertyRel.objects.filter(tenant=pk)
-                tenant.rented_property = rented_property
-            except TenantPropertyRel.DoesNotExist:
-                tenant.rented_property = None
-
-            # Check if the lease is active and add a custom property
-            current_day = date.today()
-            for rp in tenant.rented_property:
-                if current_day > rp.lease_start and current_day < rp.lease_end:
-                    rp.active = True
-                else: 
-                    rp.active = False         
+            # Leases, their properties and the `active` flag are
+            # loaded with the tenant in a fixed number of queries
+            tenant = Tenant.objects.with_leases().get(pk=pk)
 
             # If the tenant does not have a lease, null will be
             # returned rather than an empty array
-            if not tenant.rented_property:
-                    tenant.rented_property = None   
+            tenant.rented_property = tenant.leases or None
 
             serializer = TenantSerializer(tenant, context={'request': request})
             return Response(serializer.data)
@@ -74,7 +67,7 @@ class Tenants(ViewSet):
         Returns:
             Response -- Empty body with 204 status code
         """
-        landlord = Landlord.objects.get(user=request.auth.user)
+        landlord = request.landlord
 
         tenant = Tenant.objects.get(pk=pk)
         tenant.phone_number = request.data["phone_number"]
@@ -107,64 +100,172 @@ class Tenants(ViewSet):
         Returns:
             Response -- JSON serialized list of tenants
         """
-        landlord = Landlord.objects.get(user=request.auth.user)
-        current_users_tenants = Tenant.objects.filter(landlord=landlord)
+        landlord = request.landlord
 
         # The table on the front end requires an object where the
         # id's are keys and names are values
         table = self.request.query_params.get('table', None)
         if table is not None:
-            tenant_obj = {}
-            for tenant in current_users_tenants:
-                tenant_obj[tenant.id] = tenant.full_name
-            
-            to_string = json.dumps(tenant_obj, separators=None)
+            body, etag = encoded_tenant_table(landlord)
 
-            return Response(to_string)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = HttpResponse(body, content_type='application/json')
+            response['ETag'] = etag
 
-        search_term = self.request.query_params.get('search', None)
-        if search_term is not None:
-            current_users_tenants = current_users_tenants.filter(phone_number__icontains=search_term
-                ) | current_users_tenants.filter(email__icontains=search_term
-                ) | current_users_tenants.filter(full_name__icontains=search_term
-                ) 
+            return response
 
-        # Connect rented properties to tenants through the relationship table
-        try:
-            for tenant in current_users_tenants:
-                lease = TenantPropertyRel.objects.filter(tenant=tenant)
-                tenant.rented_property = lease
+        return self.tenant_list(request)
+
+    @cached_response('tenants')
+    def tenant_list(self, request):
+        """The tenants list response, cached until the landlord's data changes"""
+        current_users_tenants = self.filtered_tenants(request)
 
-                # Check if the lease is active and add a custom property
-                current_day = date.today()
-                for rp in tenant.rented_property:
-                    if current_day > rp.lease_start and current_day < rp.lease_end:
-                        rp.active = True
-                    else: 
-                        rp.active = False
+        # Opt-in fast rendering straight from values() rows
+        if fastjson.is_requested(request):
+            return fast_tenant_list(current_users_tenants.order_by('id'), request, self)
 
-        except TenantPropertyRel.DoesNotExist:
-            current_users_tenants.rented_property = None
+        # Connect rented properties to tenants through the relationship table.
+        # Every lease is prefetched at once rather than queried per tenant.
+        current_users_tenants = current_users_tenants.with_leases().order_by('id')
+
+        # Return a single page when the client asks for one
+        paginator = IdCursorPagination()
+        page = paginator.paginate_queryset(current_users_tenants, request, view=self)
+        if page is not None:
+            current_users_tenants = page
 
         # If the tenant does not have a lease, null will be 
         # returned rather than an empty array
         for tenant in current_users_tenants:
-            if not tenant.rented_property:
-                    tenant.rented_property = None
+            tenant.rented_property = tenant.leases or None
         
         serializer = TenantSerializer(
             current_users_tenants, many=True, context={'request': request}
         )
+        if page is not None:
+            return paginator.get_paginated_response(serializer.data)
+
         return Response(serializer.data)
 
+    def filtered_tenants(self, request):
+        """The authenticated landlord's tenants, filtered by the
+        search query parameter
+        """
+        current_users_tenants = Tenant.objects.filter(landlord=request.landlord)
+
+        search_term = request.query_params.get('search', None)
+        if search_term is not None:
+            # One landlord condition around the alternatives, so the
+            # landlord index returns the tenants in id order
+            current_users_tenants = current_users_tenants.filter(
+                Q(phone_number__icontains=search_term) |
+                Q(email__icontains=search_term) |
+                Q(full_name__icontains=search_term))
+
+        return current_users_tenants
+
+
+def fast_tenant_list(tenants, request, view):
+    """Render the tenant list from values() rows, in the same shape as
+    TenantSerializer, with the leases of every tenant loaded in one query
+    """
+    paginator = IdCursorPagination()
+    rows = tenants.values(*TENANT_ROW.fields)
+    page = paginator.paginate_queryset(rows, request, view=view)
+    if page is not None:
+        return fastjson.paginated_json_response(
+            paginator, tenant_rows(page, [tenant['id'] for tenant in page]))
+
+    return fastjson.json_response(tenant_rows(rows, tenants.values('id')))
+
 
+def tenant_rows(rows, tenant_ids):
+    """Map tenant values() rows and attach their leases, loaded in one
+    query for the tenants in `tenant_ids` (a list or an id subquery)
+    """
+    results = TENANT_ROW.rows(rows)
+    if not results:
+        return results
+
+    leases = {}
+    # Ordered by tenant first, so the tenant_id index returns each
+    # tenant's leases in id order without a sort
+    for lease in (TenantPropertyRel.objects.filter(tenant_id__in=tenant_ids)
+                  .with_active().order_by('tenant_id', 'id').values('tenant_id', *LEASE_ROW.fields)):
+        leases.setdefault(lease['tenant_id'], []).append(LEASE_ROW.map(lease))
+
+    # If the tenant does not have a lease, null will be
+    # returned rather than an empty array
+    for tenant in results:
+        tenant['rented_property'] = leases.get(tenant['id'])
+
+    return results
+
+
+def encoded_tenant_table(landlord):
+    """Return the landlord's {id: full_name} table response body and ETag
+
+    The body is cached per landlord under the landlord's tenant data
+    version, which the Tenant signal handlers bump on every change.
+    """
+    key = 'tenant-table:{}:{}'.format(landlord.id, data_version('tenants', landlord.id))
+    encoded = cache.get(key)
+    if encoded is None:
+        tenant_obj = dict(Tenant.objects.filter(landlord=landlord).order_by('id')
+                          .values_list('id', 'full_name'))
+
+        to_string = json.dumps(tenant_obj, separators=None)
+
+        body = JSONRenderer().render(to_string)
+        encoded = (body, '"{}"'.format(hashlib.sha1(body).hexdigest()))
+        cache.set(key, encoded)
+
+    return encoded
+
+
+# The TenantSerializer output, built from values() rows. Leases are
+# mapped separately and attached as rented_property.
+TENANT_ROW = fastjson.RowMapper([
+    ('id', 'id'),
+    ('phone_number', 'phone_number'),
+    ('email', 'email'),
+    ('landlord', 'landlord'),
+    ('full_name', 'full_name'),
+])
+
+LEASE_ROW = fastjson.RowMapper([
+    ('id', 'id'),
+    ('lease_start', ('lease_start', fastjson.iso_date)),
+    ('lease_end', ('lease_end', fastjson.iso_date)),
+    ('rent', 'rent'),
+    ('rented_property', [
+        ('id', 'rented_property__id'),
+        ('street', 'rented_property__street'),
+        ('city', 'rented_property__city'),
+        ('state', 'rented_property__state'),
+        ('postal_code', 'rented_property__postal_code'),
+        ('landlord', 'rented_property__landlord'),
+    ]),
+    ('active', 'active'),
+])
+
+
+class LeasePropertySerializer(serializers.ModelSerializer):
+    """JSON serializer for the property of a lease. Change times are
+    only sent by /sync.
+    """
+    class Meta:
+        model = Property
+        fields = ('id', 'street', 'city', 'state', 'postal_code', 'landlord')
 
 class LeaseSerializer(serializers.ModelSerializer):
     """JSON serializer for leases"""
+    rented_property = LeasePropertySerializer(many=False)
     class Meta:
         model = TenantPropertyRel
         fields = ('id', 'lease_start', 'lease_end', 'rent', 'rented_property', 'active')
-        depth = 1
 
 class TenantSerializer(serializers.ModelSerializer):
     """JSON serializer for tenants"""